@@ -0,0 +1,547 @@
+# -------------------------------------------------------------
+# License
+# -------------------------------------------------------------
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to
+# whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall
+# be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# -------------------------------------------------------------
+
+
+"""
+Run a reference engine and a fast engine on the same maps and check that
+they produce the same results.
+
+The reference engines are the straightforward MapTiler and
+MapDataExtractor classes in this repository.  A fast engine is any class
+with the same interface (usually a subclass that replaces some of the
+stages) given as MODULE.CLASS.  Both engines are run on the same inputs
+and their results are compared: the layers and tile indices (layerDict),
+the pixels each cell ends up showing (imageDict), the rooms found by the
+tiler, and the rooms, walkable cells, subjects (objects and bindings)
+and edges found by the extractor.  The speedup of the fast engine over
+the reference is reported for the whole run and for each stage.
+
+The maps are either real layer images (run through the tiler and then
+the extractor) or randomly generated.  Each generated case is a set of
+layers from MapTilerBenchmark.py for the tiler and a rooms and doors map
+from MapDataExtractorBenchmark.py for the extractor.
+
+The exit status is 0 when no differences are found and 1 otherwise.
+
+Usage: DifferentialCheck.py [--tilerEngine=ENGINE]
+                            [--extractorEngine=ENGINE]
+                            [--tileWidth=WIDTH]
+                            [--tileHeight=HEIGHT]
+                            [--floorLayer=FLOORLAYER]
+                            [--wallLayer=WALLLAYER]
+                            [--portalLayer=PORTALLAYER]
+                            [--doorLayer=DOORLAYER]
+                            [--binding=BINDING]...
+                            [--repeat=COUNT]
+                            [--maxReport=COUNT]
+                            [--workDir=WORKDIR]
+                            <layerImage>...
+       DifferentialCheck.py --generate=COUNT
+                            [--tilerEngine=ENGINE]
+                            [--extractorEngine=ENGINE]
+                            [--size=SIZE]
+                            [--seed=SEED]
+                            [--repeat=COUNT]
+                            [--maxReport=COUNT]
+                            [--workDir=WORKDIR]
+
+Options:
+    --tilerEngine=ENGINE        The tiler to check against MapTiler, as
+                                MODULE.CLASS.
+                                [Default: MapTiler.MapTiler]
+    --extractorEngine=ENGINE    The extractor to check against
+                                MapDataExtractor, as MODULE.CLASS.
+                                [Default: MapDataExtractor.MapDataExtractor]
+    --tileWidth=WIDTH           The width of a tile in the layer images.
+                                [Default: 64]
+    --tileHeight=HEIGHT         The height of a tile in the layer images.
+                                [Default: 64]
+    --floorLayer=FLOORLAYER     The layer with the floors.
+                                [Default: Floors]
+    --wallLayer=WALLLAYER       The layer with the walls.
+                                [Default: Walls]
+    --portalLayer=PORTALLAYER   The layer with the portals.
+                                [Default: Portals]
+    --doorLayer=DOORLAYER       The layer with the doors.
+                                [Default: Doors]
+    --binding=BINDING           A layer whose objects are bound to the
+                                nearest other object (e.g. activators).
+                                May be given more than once.
+    --generate=COUNT            Check this many randomly generated maps
+                                instead of layer images.
+    --size=SIZE                 The width and height of the generated maps
+                                in tiles.
+                                [Default: 24]
+    --seed=SEED                 The random seed for the first generated
+                                map.  Each map after it adds one.
+                                [Default: 1]
+    --repeat=COUNT              Run each engine this many times and time
+                                the fastest run.
+                                [Default: 1]
+    --maxReport=COUNT           The most differences printed for each
+                                check.
+                                [Default: 5]
+    --workDir=WORKDIR           The directory the generated maps and the
+                                outputs of each engine are written to.
+                                [Default: DifferentialCheck]
+
+Website:        http://www.NonlinearIdeas.com
+Repository:     https://github.com/NonlinearIdeas/Map-Tiler
+Report Issues:  https://github.com/NonlinearIdeas/Map-Tiler
+License:        MIT License - See specific text in source code.
+Copyright:      Copyright (c) 2015 Nonlinear Ideas Inc (contact@nlideas.com)
+"""
+
+import os
+import sys
+import time
+import docopt
+from MapTiler import MapTiler
+from MapDataExtractor import MapDataExtractor, MapDataExtractorConfig
+from MapTilerBenchmark import MapTilerBenchmark
+from MapDataExtractorBenchmark import MapDataExtractorBenchmark
+
+
+class DifferentialCheck(object):
+    REFERENCE_TILER = "MapTiler.MapTiler"
+    REFERENCE_EXTRACTOR = "MapDataExtractor.MapDataExtractor"
+    NAV_PREFIX = "NAV_"
+
+    # The stages whose speedups are reported, for each tool.
+    TILER_STAGES = ["CreateTileset", "CreateNavData", "ExportTileset", "ExportTiledFile"]
+    EXTRACTOR_STAGES = ["LoadTiledMap", "ExtractRoomsData", "ExtractObjectsData", "ExtractAdjacencyData"]
+
+    # The settings for the generated tiler layers.  The first layers
+    # stand in for the floors, walls, doors and portals and the last
+    # one is the binding layer, so rooms, objects and bindings all get exercised.
+    GENERATED_TILER = { "layers":5, "tileSize":16, "poolSize":24, "repetition":0.9,
+                        "transformMix":0.25, "sparsity":0.4 }
+    GENERATED_FLOOR = "Layer00"
+    GENERATED_WALL = "Layer01"
+    GENERATED_DOOR = "Layer02"
+    GENERATED_PORTAL = "Layer03"
+    GENERATED_BINDING = "Layer04"
+
+    def __init__(self):
+        self.Reset()
+
+    def Reset(self):
+        # The number of differences found in all the cases.
+        self.differences = 0
+        # One row per engine run of (case, tool, reference seconds,
+        # fast seconds, stage speedups).
+        self.timings = []
+
+    # Load an engine class from MODULE.CLASS.
+    def LoadEngine(self, spec):
+        if "." not in spec:
+            print "Engine %s is not of the form MODULE.CLASS.  Unable to continue." % spec
+            return None
+        moduleName, className = spec.rsplit(".", 1)
+        try:
+            module = __import__(moduleName, fromlist=[className])
+        except ImportError, e:
+            print "Unable to import %s (%s).  Unable to continue." % (moduleName, e)
+            return None
+        if not hasattr(module, className):
+            print "Module %s has no class %s.  Unable to continue." % (moduleName, className)
+            return None
+        return getattr(module, className)
+
+    # Run an engine repeat times.  Returns the engine from the fastest
+    # run and its time, or (None, 0) if it failed.
+    def TimeEngine(self, run):
+        best = None
+        bestEngine = None
+        for idx in xrange(self.repeat):
+            start = time.time()
+            engine = run()
+            elapsed = time.time() - start
+            if engine is None:
+                return None, 0
+            if best is None or elapsed < best:
+                best = elapsed
+                bestEngine = engine
+        return bestEngine, best
+
+    def GetStageSeconds(self, engine, name):
+        stats = getattr(engine, "stats", None)
+        if stats is None or name not in stats.stages:
+            return None
+        return stats.stages[name]["wallSeconds"]
+
+    def RecordTiming(self, case, tool, stages, reference, fast, refSeconds, fastSeconds):
+        speedups = []
+        for name in stages:
+            refStage = self.GetStageSeconds(reference, name)
+            fastStage = self.GetStageSeconds(fast, name)
+            if refStage is None or fastStage is None:
+                continue
+            speedups.append((name, refStage, fastStage))
+        self.timings.append((case, tool, refSeconds, fastSeconds, speedups))
+
+    def FormatSpeedup(self, refSeconds, fastSeconds):
+        if fastSeconds <= 0:
+            return "-"
+        return "%.2fx" % (refSeconds / fastSeconds)
+
+    def RunTiler(self, engineClass, outDir, tileWidth, tileHeight, fileList, navLayers):
+        if not os.path.exists(outDir):
+            os.makedirs(outDir)
+        floorLayer, wallLayer, portalLayer, doorLayer = navLayers
+        tiler = engineClass()
+        result = tiler.ProcessInputs(tileWidth=tileWidth,
+                                     tileHeight=tileHeight,
+                                     tileOffX=0,
+                                     tileOffY=0,
+                                     tileInsetX=0,
+                                     tileInsetY=0,
+                                     fileList=fileList[:],
+                                     inputFilePattern=None,
+                                     outTilesetFile=os.path.join(outDir, "tileset.png"),
+                                     outTiledFile=os.path.join(outDir, "tiled.tmx"),
+                                     forceSquareTileset=False,
+                                     verbose=False,
+                                     mergeExisting=False,
+                                     overwriteExisting=True,
+                                     floorLayer=floorLayer,
+                                     wallLayer=wallLayer,
+                                     portalLayer=portalLayer,
+                                     doorLayer=doorLayer,
+                                     outNavPrefix=DifferentialCheck.NAV_PREFIX)
+        if not result:
+            return None
+        return tiler
+
+    def RunExtractor(self, engineClass, tiledFile, navLayers, bindingLayers):
+        floorLayer, wallLayer, doorLayer = navLayers
+        config = MapDataExtractorConfig(tiledFile=tiledFile,
+                                        floorLayer=floorLayer,
+                                        wallLayer=wallLayer,
+                                        doorLayer=doorLayer,
+                                        navPrefix=DifferentialCheck.NAV_PREFIX,
+                                        exportData=False,
+                                        bindingLayers=bindingLayers)
+        extractor = engineClass()
+        if not extractor.Process(config):
+            return None
+        return extractor
+
+    # Print a check result and add its differences to the total.
+    def ReportCheck(self, name, problems):
+        if len(problems) == 0:
+            print "    %-24s OK" % name
+            return
+        print "    %-24s %d difference(s)" % (name, len(problems))
+        for problem in problems[:self.maxReport]:
+            print "        %s" % problem
+        if len(problems) > self.maxReport:
+            print "        ..."
+        self.differences += len(problems)
+
+    # Compare two dictionaries entry by entry.  Returns a list of
+    # descriptions of the keys that are missing or different.
+    def CompareDicts(self, refDict, fastDict, label):
+        problems = []
+        for key in sorted(set(refDict.keys()) | set(fastDict.keys())):
+            if key not in fastDict:
+                problems.append("%s %s: missing from the fast engine" % (label, key))
+            elif key not in refDict:
+                problems.append("%s %s: only in the fast engine" % (label, key))
+            elif refDict[key] != fastDict[key]:
+                problems.append("%s %s: reference %s, fast %s" % (label, key, refDict[key], fastDict[key]))
+        return problems
+
+    # The rooms as a set of cell sets, so that a renumbering of the
+    # rooms can be told apart from a different set of rooms.
+    def CreatePartition(self, roomDict):
+        return set([frozenset(cells) for cells in roomDict.values()])
+
+    def CompareRooms(self, refRooms, fastRooms, label):
+        problems = self.CompareDicts(refRooms, fastRooms, label)
+        if problems and self.CreatePartition(refRooms) == self.CreatePartition(fastRooms):
+            problems.insert(0, "the rooms have the same cells but are numbered or ordered differently")
+        return problems
+
+    # The bytes of a tile as it appears in a cell.
+    def GetCellPixels(self, tiler, cache, tile):
+        if tile not in cache:
+            tileIdx, xForm = tile
+            cache[tile] = tiler.ApplyTransformation(tiler.imageDict[tileIdx], xForm).tobytes()
+        return cache[tile]
+
+    # The navigation layers are drawn with random colors, so only
+    # their tile indices are compared, not their pixels.
+    def ComparePixels(self, reference, fast):
+        problems = []
+        refCache = {}
+        fastCache = {}
+        for lname in reference.layerNames:
+            if lname.startswith(DifferentialCheck.NAV_PREFIX) or lname not in fast.layerDict:
+                continue
+            refLayer = reference.layerDict[lname]
+            fastLayer = fast.layerDict[lname]
+            for idx in sorted(refLayer.keys()):
+                if idx not in fastLayer:
+                    problems.append("%s cell %d: missing from the fast engine" % (lname, idx))
+                    continue
+                refPixels = self.GetCellPixels(reference, refCache, refLayer[idx])
+                fastPixels = self.GetCellPixels(fast, fastCache, fastLayer[idx])
+                if refPixels != fastPixels:
+                    problems.append("%s cell %d: reference tile %s, fast tile %s" % (
+                        lname, idx, refLayer[idx], fastLayer[idx]))
+        return problems
+
+    def CompareTilers(self, reference, fast):
+        problems = []
+        if reference.layerNames != fast.layerNames:
+            problems.append("reference layers %s, fast layers %s" % (reference.layerNames, fast.layerNames))
+        if len(reference.imageDict) != len(fast.imageDict):
+            problems.append("reference has %d tiles, fast has %d" % (len(reference.imageDict), len(fast.imageDict)))
+        self.ReportCheck("layers and tiles", problems)
+        problems = []
+        for lname in reference.layerNames:
+            if lname not in fast.layerDict:
+                continue
+            problems += self.CompareDicts(reference.layerDict[lname], fast.layerDict[lname], "%s cell" % lname)
+        self.ReportCheck("layerDict", problems)
+        self.ReportCheck("imageDict pixels", self.ComparePixels(reference, fast))
+        self.ReportCheck("tiler rooms", self.CompareRooms(reference.roomDict, fast.roomDict, "room"))
+
+    # The subjects with their ids replaced by their type and cells, so
+    # a renumbering can be told apart from different objects.
+    def CreateSubjectSet(self, subjects):
+        keys = {}
+        for subjectID in subjects:
+            objType, indices, bindings = subjects[subjectID]
+            keys[subjectID] = (objType, tuple(sorted(indices)))
+        return set([(keys[subjectID], tuple(sorted([keys.get(bound) for bound in subjects[subjectID][2]])))
+                    for subjectID in subjects])
+
+    # Edges are compared as sets so that a change of order is reported
+    # separately from a missing or extra edge.
+    def CompareEdges(self, refEdges, fastEdges):
+        problems = self.CompareDicts(refEdges, fastEdges, "node")
+        if not problems:
+            return problems
+        unordered = lambda edges: { idx:(edges[idx][0], frozenset(edges[idx][1])) for idx in edges }
+        if unordered(refEdges) == unordered(fastEdges):
+            problems.insert(0, "the edges are the same but in a different order")
+        return problems
+
+    def CompareExtractors(self, reference, fast):
+        refOutput = reference.outputDict
+        fastOutput = fast.outputDict
+        self.ReportCheck("extractor rooms",
+                         self.CompareRooms(refOutput[MapDataExtractor.KEY_ROOMS],
+                                           fastOutput.get(MapDataExtractor.KEY_ROOMS, {}), "room"))
+        self.ReportCheck("walkable cells",
+                         self.CompareDicts(refOutput[MapDataExtractor.KEY_WALKABLE],
+                                           fastOutput.get(MapDataExtractor.KEY_WALKABLE, {}), "cell"))
+        refSubjects = refOutput[MapDataExtractor.KEY_OBJECTS]
+        fastSubjects = fastOutput.get(MapDataExtractor.KEY_OBJECTS, {})
+        problems = self.CompareDicts(refSubjects, fastSubjects, "subject")
+        if problems and self.CreateSubjectSet(refSubjects) == self.CreateSubjectSet(fastSubjects):
+            problems.insert(0, "the subjects are the same but numbered differently")
+        self.ReportCheck("subjects", problems)
+        self.ReportCheck("edges",
+                         self.CompareEdges(refOutput[MapDataExtractor.KEY_ADJACENCY],
+                                           fastOutput.get(MapDataExtractor.KEY_ADJACENCY, {})))
+
+    def CheckTiler(self, case, caseDir, tileWidth, tileHeight, fileList, navLayers):
+        runs = []
+        for label, engineClass in [("reference", self.referenceTiler), ("fast", self.fastTiler)]:
+            outDir = os.path.join(caseDir, label)
+            run = lambda: self.RunTiler(engineClass, outDir, tileWidth, tileHeight, fileList, navLayers)
+            engine, seconds = self.TimeEngine(run)
+            if engine is None:
+                print "The %s tiler failed on %s.  Unable to continue." % (label, case)
+                return None
+            runs.append((engine, seconds))
+        print "  Tiler:"
+        self.CompareTilers(runs[0][0], runs[1][0])
+        self.RecordTiming(case, "tiler", DifferentialCheck.TILER_STAGES,
+                          runs[0][0], runs[1][0], runs[0][1], runs[1][1])
+        return runs[0][0]
+
+    # Both extractors read the same Tiled file, so any difference is
+    # down to the extractor alone.
+    def CheckExtractor(self, case, tiledFile, navLayers, bindingLayers):
+        runs = []
+        for label, engineClass in [("reference", self.referenceExtractor), ("fast", self.fastExtractor)]:
+            run = lambda: self.RunExtractor(engineClass, tiledFile, navLayers, bindingLayers)
+            engine, seconds = self.TimeEngine(run)
+            if engine is None:
+                print "The %s extractor failed on %s.  Unable to continue." % (label, case)
+                return False
+            runs.append((engine, seconds))
+        print "  Extractor:"
+        self.CompareExtractors(runs[0][0], runs[1][0])
+        self.RecordTiming(case, "extractor", DifferentialCheck.EXTRACTOR_STAGES,
+                          runs[0][0], runs[1][0], runs[0][1], runs[1][1])
+        return True
+
+    def CheckLayerImages(self, fileList, tileWidth, tileHeight, tilerLayers, bindingLayers):
+        case = "layer images"
+        print "Checking %s..." % case
+        tiler = self.CheckTiler(case, os.path.join(self.workDir, "images"),
+                                tileWidth, tileHeight, fileList, tilerLayers)
+        if tiler is None:
+            return False
+        floorLayer, wallLayer, portalLayer, doorLayer = tilerLayers
+        return self.CheckExtractor(case, tiler.outTiledFile, (floorLayer, wallLayer, doorLayer), bindingLayers)
+
+    def CheckGenerated(self, count, size, seed):
+        for idx in xrange(count):
+            case = "generated map %d (seed %d)" % (idx + 1, seed + idx)
+            caseDir = os.path.join(self.workDir, "generated%02d" % (idx + 1))
+            if not os.path.exists(caseDir):
+                os.makedirs(caseDir)
+            print "Checking %s..." % case
+            layers = MapTilerBenchmark()
+            layers.workDir = caseDir
+            layers.config = dict(DifferentialCheck.GENERATED_TILER)
+            layers.config.update({ "width":size, "height":size, "seed":seed + idx })
+            layers.GenerateLayers()
+            tilerLayers = (DifferentialCheck.GENERATED_FLOOR, DifferentialCheck.GENERATED_WALL,
+                           DifferentialCheck.GENERATED_PORTAL, DifferentialCheck.GENERATED_DOOR)
+            tiler = self.CheckTiler(case, caseDir, layers.config["tileSize"], layers.config["tileSize"],
+                                    layers.layerFiles, tilerLayers)
+            if tiler is None:
+                return False
+            if not self.CheckExtractor(case + " layers", tiler.outTiledFile,
+                                       (DifferentialCheck.GENERATED_FLOOR, DifferentialCheck.GENERATED_WALL,
+                                        DifferentialCheck.GENERATED_DOOR),
+                                       [DifferentialCheck.GENERATED_BINDING]):
+                return False
+            # A map with proper rooms and doors for the extractor.
+            rooms = MapDataExtractorBenchmark()
+            rooms.rooms = 9
+            rooms.doorDensity = 0.8
+            rooms.objectDensity = 0.05
+            rooms.objectLayers = 2
+            rooms.bindingLayers = 1
+            rooms.bindingDensity = 0.01
+            rooms.seed = seed + idx
+            rooms.GenerateMap(size)
+            tiledFile = os.path.join(caseDir, "rooms.tmx")
+            rooms.ExportTiledFile(size, tiledFile)
+            if not self.CheckExtractor(case + " rooms", tiledFile,
+                                       (MapDataExtractorBenchmark.FLOOR_LAYER,
+                                        MapDataExtractorBenchmark.WALL_LAYER,
+                                        MapDataExtractorBenchmark.DOOR_LAYER),
+                                       rooms.bindingLayerNames):
+                return False
+        return True
+
+    def PrintTimings(self):
+        print "---------------------------------"
+        print "Speedup (reference seconds / fast seconds)"
+        print "---------------------------------"
+        for case, tool, refSeconds, fastSeconds, speedups in self.timings:
+            print "%s, %s: %.3f / %.3f = %s" % (case, tool, refSeconds, fastSeconds,
+                                                self.FormatSpeedup(refSeconds, fastSeconds))
+            for name, refStage, fastStage in speedups:
+                print "    %-24s %.3f / %.3f = %s" % (name, refStage, fastStage,
+                                                      self.FormatSpeedup(refStage, fastStage))
+        refTotal = sum([row[2] for row in self.timings])
+        fastTotal = sum([row[3] for row in self.timings])
+        print "Overall: %.3f / %.3f = %s" % (refTotal, fastTotal, self.FormatSpeedup(refTotal, fastTotal))
+
+    # Returns True if the engines agree on every case.
+    def ProcessInputs(self,
+                      tilerEngine,
+                      extractorEngine,
+                      fileList,
+                      tileWidth,
+                      tileHeight,
+                      tilerLayers,
+                      bindingLayers,
+                      generate,
+                      size,
+                      seed,
+                      repeat,
+                      maxReport,
+                      workDir):
+        self.Reset()
+        self.repeat = max(1, repeat)
+        self.maxReport = maxReport
+        self.workDir = workDir
+        self.referenceTiler = self.LoadEngine(DifferentialCheck.REFERENCE_TILER)
+        self.referenceExtractor = self.LoadEngine(DifferentialCheck.REFERENCE_EXTRACTOR)
+        self.fastTiler = self.LoadEngine(tilerEngine)
+        self.fastExtractor = self.LoadEngine(extractorEngine)
+        if None in [self.referenceTiler, self.referenceExtractor, self.fastTiler, self.fastExtractor]:
+            return False
+        if not os.path.exists(workDir):
+            os.makedirs(workDir)
+        if generate:
+            if not self.CheckGenerated(generate, size, seed):
+                return False
+        else:
+            for fileName in fileList:
+                if not os.path.exists(fileName):
+                    print "Layer image %s does not exist.  Unable to continue." % fileName
+                    return False
+            if not self.CheckLayerImages(fileList, tileWidth, tileHeight, tilerLayers, bindingLayers):
+                return False
+        self.PrintTimings()
+        if self.differences:
+            print "Found %d difference(s) between the reference and fast engines." % self.differences
+            return False
+        print "The reference and fast engines agree."
+        return True
+
+if __name__ == "__main__":
+    arguments = docopt.docopt(__doc__)
+    print "-----------------------------------"
+    print "Inputs:"
+    args = arguments.keys()
+    args.sort()
+    for arg in args:
+        print "%-25s %s" % (arg, arguments[arg])
+    print "-----------------------------------"
+    tilerLayers = (arguments['--floorLayer'],
+                   arguments['--wallLayer'],
+                   arguments['--portalLayer'],
+                   arguments['--doorLayer'])
+    generate = int(arguments['--generate']) if arguments['--generate'] else 0
+
+    check = DifferentialCheck()
+    passed = check.ProcessInputs(arguments['--tilerEngine'],
+                                 arguments['--extractorEngine'],
+                                 arguments['<layerImage>'],
+                                 int(arguments['--tileWidth']),
+                                 int(arguments['--tileHeight']),
+                                 tilerLayers,
+                                 arguments['--binding'],
+                                 generate,
+                                 int(arguments['--size']),
+                                 int(arguments['--seed']),
+                                 int(arguments['--repeat']),
+                                 int(arguments['--maxReport']),
+                                 arguments['--workDir'])
+    sys.exit(0 if passed else 1)
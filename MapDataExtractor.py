@@ -75,6 +75,10 @@ Usage: MapDataExtractor.py  <tiledFile>
                             [--binding=LAYER ...]
                             [--noDiagonalEdges]
                             [--reallyVerbose]
+                            [--statsFile=STATSFILE]
+                            [--progressRate=RATE]
+                            [--incremental]
+                            [--cacheFile=CACHEFILE]
 Argumnts:
     tiledFile       The Tiled (.tmx) file that contains the Tiled data.
 
@@ -90,7 +94,11 @@ Options:
     --outFile=OUTFILE       The CSV output file with all the output data.  See below for format.
                             [Default: NavData.csv]
     --verbose               Generate output while processing.
-    --reallyVerbose         Generate even more output while processing.
+    --reallyVerbose         Generate even more output while processing,
+                            including every walking edge.
+    --progressRate=RATE     The maximum number of progress lines per
+                            second while generating adjacency data.
+                            [Default: 2]
     --exclude=LAYER         Specifies a layer to be excluded from processing.
                             Can be specified multiple times.
     --blocking=LAYER        Specifies an object layer that will be considered as
@@ -104,6 +112,20 @@ Options:
     --noDiagonalEdges       By default, the adjacent check will consider
                             diagonal edges as well.  This option restricts
                             the check to only N, S, E, W checks.
+    --statsFile=STATSFILE   Save the timing, memory and size counters for
+                            each stage (nodes, edges, rooms, objects,
+                            output bytes) to this file as JSON.  They are
+                            always printed at the end.
+    --incremental           Only redo the work around the cells that changed
+                            since the last incremental run.  The layers and
+                            results of each run are saved to the cache file
+                            and the next run compares the layers against
+                            them, then patches the rooms, objects, bindings
+                            and edges near the changed cells.  Everything is
+                            extracted again if there is no cache or it was
+                            made with other settings, map size or room tiles.
+    --cacheFile=CACHEFILE   The cache file for the incremental mode.
+                            Defaults to the output file with .cache added.
 
 Website:        http://www.NonlinearIdeas.com
 Repository:     https://github.com/NonlinearIdeas/Map-Tiler
@@ -117,6 +139,11 @@ from lxml import etree
 import docopt
 import csv
 import string
+import math
+import bisect
+import cPickle
+from PerfStats import PerfStats
+from ProgressReporter import ProgressReporter
 
 class MapDataExtractor(object):
     # Keys used for holding output data
@@ -129,6 +156,8 @@ class MapDataExtractor(object):
     KEY_EDGE_DOOR = "DOOR"
     KEY_EDGE_WALK = "WALK"
     CSV_EXPORT_COLUMNS = 10
+    # Bump this when the contents of the incremental cache change.
+    CACHE_VERSION = 1
 
     def __init__(self):
         self.Reset()
@@ -175,6 +204,24 @@ class MapDataExtractor(object):
         # key.  Each object stored may be a different format.
         self.outputDict = {}
 
+        # Timing, memory and counters for each stage.
+        self.stats = PerfStats("MapDataExtractor")
+
+        # Keyed by (binding layer, first index of the activator), the
+        # object index found nearest to each activator.
+        self.nearestDict = {}
+
+        # The state saved by the last incremental run, if it can be used.
+        self.cache = None
+
+        # Keyed by layer name, the cells whose tile changed since the
+        # cached run, and the cells that were added or removed.
+        self.valueChanges = {}
+        self.presenceChanges = {}
+
+        # The cells whose room changed since the cached run.
+        self.roomChanges = set()
+
     def FatalError(self,message):
         print message
         print "Unable to continue."
@@ -197,25 +244,123 @@ class MapDataExtractor(object):
         self.layerTiles = self.layerWidth*self.layerHeight
 
         # Tileset Information
+        # The tileset may be split across several pages, each with its
+        # own <tileset>.  Tile ids are relative to the page, so they are
+        # converted back to the tile index (gid-1) used in the layers.
         self.tileMap = { idx:{} for idx in xrange(self.layerTiles)}
         for tileset in inRoot.findall("tileset"):
-            if tileset.attrib["firstgid"] == "1":
+            firstGID = int(tileset.attrib["firstgid"])
+            if firstGID == 1:
                 self.tileMapFile = tileset.find("image").attrib["source"]
-                for tile in tileset.findall("tile"):
-                    id = int(tile.attrib["id"])
-                    for properties in tile.findall("properties"):
-                        for property in properties.findall("property"):
-                            self.tileMap[id][property.attrib["name"]] = property.attrib["value"]
+            for tile in tileset.findall("tile"):
+                id = firstGID - 1 + int(tile.attrib["id"])
+                for properties in tile.findall("properties"):
+                    for property in properties.findall("property"):
+                        self.tileMap.setdefault(id, {})[property.attrib["name"]] = property.attrib["value"]
 
         # Layers
         self.layerMap = {layer.attrib['name']: {} for layer in inRoot.findall("layer")}
         for layer in inRoot.findall("layer"):
-            tiles = layer.find("data").findall("tile")
-            for idx in xrange(len(tiles)):
-                tile = tiles[idx]
-                tileID = self.ExtractTileIndex(int(tile.attrib["gid"]))
+            parsed = self.ParseDataGids(layer.find("data"))
+            if parsed is None:
+                return self.FatalError("Layer %s has data encoded as %s.  Only XML and CSV are supported." %
+                                       (layer.attrib['name'], layer.find("data").attrib["encoding"]))
+            cells, offMap = parsed
+            if offMap:
+                return self.FatalError("Layer %s has %d tiles outside the %dx%d map.  Turn off Map > Infinite in Tiled to crop it to its tiles." %
+                                       (layer.attrib['name'], offMap, self.layerWidth, self.layerHeight))
+            for idx, gid in cells:
+                tileID = self.ExtractTileIndex(gid)
                 if tileID > 0:
                     self.layerMap[layer.attrib['name']][idx] = tileID-1
+
+        # Sparse layers may have been written as object groups with a
+        # tile object for each used cell.
+        for group in inRoot.findall("objectgroup"):
+            layer = self.layerMap.setdefault(group.attrib['name'], {})
+            for obj in group.findall("object"):
+                if "gid" not in obj.attrib:
+                    continue
+                idx = self.CalculateObjectCellIndex(obj)
+                if idx is None:
+                    continue
+                tileID = self.ExtractTileIndex(int(obj.attrib["gid"]))
+                if tileID > 0:
+                    layer[idx] = tileID-1
+        return True
+
+    # Returns (cell index, gid) for each cell stored in the <data> of a
+    # layer, which may be XML <tile> elements or CSV, either for the
+    # whole layer or split into the <chunk> elements of an infinite map,
+    # along with the number of used cells that are off the map (e.g. in
+    # chunks at negative coordinates after the map was grown in Tiled).
+    # Returns None for encodings that are not supported (e.g. base64).
+    def ParseDataGids(self, data):
+        encoding = data.attrib.get("encoding")
+        if encoding not in [None, "csv"]:
+            return None
+        chunks = data.findall("chunk")
+        if not chunks:
+            chunks = [data]
+        cells = []
+        offMap = 0
+        for chunk in chunks:
+            chunkX = int(chunk.attrib.get("x", "0"))
+            chunkY = int(chunk.attrib.get("y", "0"))
+            width = int(chunk.attrib.get("width", self.layerWidth))
+            if encoding == "csv":
+                gids = [int(gid) for gid in (chunk.text or "").replace("\n", "").split(",") if gid.strip()]
+            else:
+                gids = [int(tile.attrib.get("gid", "0")) for tile in chunk.findall("tile")]
+            for pos in xrange(len(gids)):
+                if gids[pos] == 0:
+                    continue
+                col = chunkX + pos % width
+                row = chunkY + pos / width
+                if col < 0 or row < 0 or col >= self.layerWidth or row >= self.layerHeight:
+                    offMap += 1
+                    continue
+                cells.append((self.CalculateCellIndex(col, row), gids[pos]))
+        return cells, offMap
+
+    # Tile objects are placed by their bottom left corner and rotated
+    # (clockwise, in degrees) around it.  The cell is the one that holds
+    # the center of the object, or None if it is off the map.
+    def CalculateObjectCellIndex(self, obj):
+        x = float(obj.attrib["x"])
+        y = float(obj.attrib["y"])
+        width = float(obj.attrib.get("width", self.tileWidth))
+        height = float(obj.attrib.get("height", self.tileHeight))
+        angle = math.radians(float(obj.attrib.get("rotation", "0")))
+        dx = width / 2.0
+        dy = -height / 2.0
+        centerX = x + dx * math.cos(angle) - dy * math.sin(angle)
+        centerY = y + dx * math.sin(angle) + dy * math.cos(angle)
+        col = int(math.floor(centerX / self.tileWidth))
+        row = int(math.floor(centerY / self.tileHeight))
+        if col < 0 or row < 0 or col >= self.layerWidth or row >= self.layerHeight:
+            return None
+        return self.CalculateCellIndex(col, row)
+
+    # Take the layers and room properties straight from a MapTiler that
+    # has already run, instead of reading them back from the Tiled file
+    # it wrote.  The tile indexes are the same ones the Tiled file would
+    # have (gid - 1).
+    def LoadFromTiler(self, tiler):
+        self.tileWidth = tiler.tileWidth
+        self.tileHeight = tiler.tileHeight
+        self.layerWidth = tiler.layerWidth
+        self.layerHeight = tiler.layerHeight
+        self.layerTiles = self.layerWidth*self.layerHeight
+        self.tileMapFile = tiler.outTilesetFile
+        self.tileMap = { idx:{} for idx in xrange(self.layerTiles)}
+        for tileIdx in tiler.tileProperties:
+            for name, value in tiler.tileProperties[tileIdx]:
+                self.tileMap.setdefault(tileIdx, {})[name] = "%s" % value
+        self.layerMap = {}
+        for lname in tiler.layerNames:
+            layerDict = tiler.layerDict[lname]
+            self.layerMap[lname] = { idx:layerDict[idx][0] for idx in layerDict if layerDict[idx][0] > 0 }
         return True
 
     def FormatNavName(self,name):
@@ -309,27 +454,23 @@ class MapDataExtractor(object):
 
         KEY_ROOMS = MapDataExtractor.KEY_ROOMS
         KEY_WALKABLE = MapDataExtractor.KEY_WALKABLE
-        KEY_PROPERTY_ROOM = self.FormatNavName(MapDataExtractor.KEY_PROPERTY_ROOM)
 
         # Create an output set to hold the data.
         self.outputDict[KEY_ROOMS] = {}
 
         # Create a dictionary for the rooms based on the tiles that
         # have the property.
-        roomDict = {}
-        tileDict = {}
+        tileDict = self.FindRoomTiles()
+        roomDict = { roomID:[] for roomID in tileDict.values() }
         indexDict = {}
-        for tileID in self.tileMap:
-            if self.tileMap[tileID].has_key(KEY_PROPERTY_ROOM):
-                roomID = int(self.tileMap[tileID][KEY_PROPERTY_ROOM])
-                tileDict[tileID] = roomID
-                roomDict[roomID] = []
         # Find the rooms layer.
         navRooms = self.FormatNavName(KEY_ROOMS)
         if navRooms not in self.layerMap:
             return self.FatalError("Layer %s not found in layers."%navRooms)
         layer = self.layerMap[navRooms]
-        for layerIndex in layer:
+        # In order, so each room lists its cells sorted.  The incremental
+        # update keeps them that way.
+        for layerIndex in sorted(layer.keys()):
             tileID = layer[layerIndex]
             if(tileID in tileDict):
                 # This means the tile in the layer is a room tile marker.
@@ -338,6 +479,8 @@ class MapDataExtractor(object):
                 indexDict[layerIndex] = tileType
         self.outputDict[KEY_ROOMS] = roomDict
         self.outputDict[KEY_WALKABLE] = indexDict
+        self.stats.SetCounter("Rooms", len(roomDict))
+        self.stats.SetCounter("Nodes", len(indexDict))
         if self.verbose:
             roomKeys = roomDict.keys()
             roomKeys.sort()
@@ -347,10 +490,18 @@ class MapDataExtractor(object):
                 print
         return True
 
-    def ExtractObjectsData(self):
-        if self.verbose:
-            self.Banner("Extracting Objects")
-        # Figure out which layers to process.
+    # Keyed by the tile index, the room of each tile that has the room
+    # property.
+    def FindRoomTiles(self):
+        KEY_PROPERTY_ROOM = self.FormatNavName(MapDataExtractor.KEY_PROPERTY_ROOM)
+        tileDict = {}
+        for tileID in self.tileMap:
+            if self.tileMap[tileID].has_key(KEY_PROPERTY_ROOM):
+                tileDict[tileID] = int(self.tileMap[tileID][KEY_PROPERTY_ROOM])
+        return tileDict
+
+    # The layers that objects are made from, sorted.
+    def GetObjectLayerNames(self):
         # Start with all the layer names.
         lNames = self.layerMap.keys()
         # Now start filtering out.
@@ -359,6 +510,13 @@ class MapDataExtractor(object):
         lNames = [name for name in lNames if name not in self.excludeLayers]
         lNames = [name for name in lNames if not self.BeginsWithNavPrefix(name)]
         lNames.sort()
+        return lNames
+
+    def ExtractObjectsData(self):
+        if self.verbose:
+            self.Banner("Extracting Objects")
+        # Figure out which layers to process.
+        lNames = self.GetObjectLayerNames()
         # Go through each layer, creating an object set for each.
         # Store them in a dictionary by object name, with the data as a list of lists,
         # each sublist containing the indices for the object.
@@ -396,18 +554,21 @@ class MapDataExtractor(object):
         # nearest object.
         keys = subjects.keys()
         keys.sort()
+        self.nearestDict = {}
         for act in self.bindingLayers:
             for subject in keys:
                 objType, indices, binding = subjects[subject]
                 if objType == act:
                     # Find the nearest index
                     nearest = self.FindNearestIndex(indices[0],objIndices)
+                    self.nearestDict[(act, indices[0])] = nearest
                     # Bind the two together
                     bindingTo = subjectIndexMap[nearest]
                     subjects[subject][2].append(bindingTo)
                     subjects[bindingTo][2].append(subject)
         # Store off for later processing
         self.outputDict[MapDataExtractor.KEY_OBJECTS] = subjects
+        self.stats.SetCounter("Objects", len(subjects))
 
         if self.verbose:
             keys = subjects.keys()
@@ -447,36 +608,18 @@ class MapDataExtractor(object):
                         del indexDict[idx]
 
         # Build up the "doorDict". We'll need it later
-        doorDict = { key:0 for key in self.layerMap[self.doorLayer].keys() if key != 0 }
+        doorDict = self.CreateDoorDict()
 
         # For every layer index, look and figure out if there are adjacent cells for it.
-        # Build this up as a walkable list for now.
-        # In subsequent steps, we can figure out if the edge is
-        # more complex.
+        nodeRooms = { layerIndex:indexDict[layerIndex][0] for layerIndex in indexDict }
+        self.progress.BeginJob(len(indexDict))
+        self.progress.BeginTask("Adjacency", len(indexDict))
         for layerIndex in indexDict:
-            adjacentList = self.GetAdjacentIndexes(layerIndex)
-            # Only keep the ones that are also in a room
-            adjacentList = [adj for adj in adjacentList if adj in indexDict]
-            # Now that we have a list of edges to adjacent cells, we have to
-            # figure out what kind of edges they are.
-            temp = []
-            for adj in adjacentList:
-                # We know it must at least be "walkable"
-                edgeType = MapDataExtractor.KEY_EDGE_WALK
-                src = layerIndex
-                des = adj
-                srcRoom = indexDict[src][0]
-                desRoom = indexDict[des][0]
-                if srcRoom != desRoom:
-                    # Must be more complex
-                    edgeType = MapDataExtractor.KEY_EDGE_ROOM
-                    # If there is a door on both layer indices, then this must
-                    # be a door edge.
-                    if src in doorDict and des in doorDict:
-                        edgeType = MapDataExtractor.KEY_EDGE_DOOR
-                temp.append((adj,edgeType))
-            indexDict[layerIndex].append(temp)
+            indexDict[layerIndex].append(self.CreateNodeEdges(layerIndex, nodeRooms, doorDict))
+            self.progress.Update()
+        self.progress.EndTask()
         self.outputDict[MapDataExtractor.KEY_ADJACENCY] = indexDict
+        self.stats.SetCounter("Edges", sum([len(indexDict[idx][1]) for idx in indexDict]))
         if self.verbose:
             keys = indexDict.keys()
             keys.sort()
@@ -493,14 +636,15 @@ class MapDataExtractor(object):
                     if roomDes != roomSrc:
                         restEdges.append("(%4d, %4d) --> (%4d, %4d) [Room %d -> %d] by %s Edge." % (
                             colSrc, rowSrc, colDes, rowDes, roomSrc, roomDes, etype))
-                    else:
+                    elif self.progress.IsDebug():
+                        # Only format these if they will be shown.
                         walkEdges.append("(%4d, %4d) --> (%4d, %4d) [Room %d]" % (
                             colSrc, rowSrc, colDes, rowDes, roomDes))
             print
             print "Walking Edges:"
-            if self.reallyVerbose:
+            if self.progress.IsDebug():
                 for item in walkEdges:
-                    print item
+                    self.progress.Trace(item)
             else:
                print "<Not Showing>"
             print
@@ -510,6 +654,289 @@ class MapDataExtractor(object):
 
         return True
 
+    def CreateDoorDict(self):
+        return { key:0 for key in self.layerMap[self.doorLayer].keys() if key != 0 }
+
+    # The edges from a node to the adjacent nodes, given the room of
+    # every node around it (nodeRooms) and the cells with doors.
+    def CreateNodeEdges(self, layerIndex, nodeRooms, doorDict):
+        # Build this up as a walkable list for now.
+        # In subsequent steps, we can figure out if the edge is
+        # more complex.
+        adjacentList = self.GetAdjacentIndexes(layerIndex)
+        # Only keep the ones that are also in a room
+        adjacentList = [adj for adj in adjacentList if adj in nodeRooms]
+        # Now that we have a list of edges to adjacent cells, we have to
+        # figure out what kind of edges they are.
+        temp = []
+        for adj in adjacentList:
+            # We know it must at least be "walkable"
+            edgeType = MapDataExtractor.KEY_EDGE_WALK
+            src = layerIndex
+            des = adj
+            srcRoom = nodeRooms[src]
+            desRoom = nodeRooms[des]
+            if srcRoom != desRoom:
+                # Must be more complex
+                edgeType = MapDataExtractor.KEY_EDGE_ROOM
+                # If there is a door on both layer indices, then this must
+                # be a door edge.
+                if src in doorDict and des in doorDict:
+                    edgeType = MapDataExtractor.KEY_EDGE_DOOR
+            temp.append((adj,edgeType))
+        return temp
+
+    # Everything that has to match for the cached results of an earlier
+    # run to be patched instead of extracted again.
+    def CreateCacheSignature(self):
+        return (MapDataExtractor.CACHE_VERSION,
+                self.layerWidth,
+                self.layerHeight,
+                self.floorLayer,
+                self.wallLayer,
+                self.doorLayer,
+                self.navPrefix,
+                sorted(self.excludeLayers),
+                self.blockingLayers,
+                self.bindingLayers,
+                self.diagonalEdges)
+
+    # Returns the cached state, or None if everything has to be
+    # extracted again.
+    def LoadCache(self):
+        if not os.path.exists(self.cacheFile):
+            print "Cache %s does not exist.  Extracting everything." % self.cacheFile
+            return None
+        try:
+            with open(self.cacheFile, "rb") as inFile:
+                state = cPickle.load(inFile)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            print "Cache %s could not be read.  Extracting everything." % self.cacheFile
+            return None
+        if state["signature"] != self.CreateCacheSignature():
+            print "Cache %s was made with different settings or map size.  Extracting everything." % self.cacheFile
+            return None
+        if state["roomTiles"] != self.FindRoomTiles():
+            print "The room tiles changed since cache %s was made.  Extracting everything." % self.cacheFile
+            return None
+        return state
+
+    def SaveCache(self):
+        state = {
+            "signature":self.CreateCacheSignature(),
+            "roomTiles":self.FindRoomTiles(),
+            "layerMap":self.layerMap,
+            "outputDict":self.outputDict,
+            "nearestDict":self.nearestDict,
+            "edges":self.stats.GetCounter("Edges"),
+        }
+        tempFile = self.cacheFile + ".tmp"
+        with open(tempFile, "wb") as outFile:
+            cPickle.dump(state, outFile, cPickle.HIGHEST_PROTOCOL)
+        if os.path.exists(self.cacheFile):
+            os.remove(self.cacheFile)
+        os.rename(tempFile, self.cacheFile)
+        if self.verbose:
+            print "Saved cache to %s." % self.cacheFile
+        return True
+
+    # Compare each layer with the cached one to find the dirty cells.
+    def FindLayerChanges(self):
+        oldLayerMap = self.cache["layerMap"]
+        self.valueChanges = {}
+        self.presenceChanges = {}
+        dirty = set()
+        for lname in set(oldLayerMap.keys()) | set(self.layerMap.keys()):
+            old = oldLayerMap.get(lname, {})
+            new = self.layerMap.get(lname, {})
+            if old == new:
+                continue
+            cells = set([idx for idx, tileID in set(old.iteritems()) ^ set(new.iteritems())])
+            self.valueChanges[lname] = cells
+            self.presenceChanges[lname] = set([idx for idx in cells if (idx in old) != (idx in new)])
+            dirty |= cells
+        self.outputDict = self.cache["outputDict"]
+        self.stats.SetCounter("Dirty Cells", len(dirty))
+        print "Updating the cached results for %d dirty cells in %d layers." % (len(dirty), len(self.valueChanges))
+        return True
+
+    # The cells near a set of cells, including the cells themselves.
+    def GetNeighborhood(self, cells):
+        result = set(cells)
+        for idx in cells:
+            result.update(self.GetAdjacentIndexes(idx))
+        return result
+
+    # Move the cells whose room tile changed to their new rooms.
+    def UpdateRoomsData(self):
+        if self.verbose:
+            self.Banner("Updating Rooms")
+        navRooms = self.FormatNavName(MapDataExtractor.KEY_ROOMS)
+        if navRooms not in self.layerMap:
+            return self.FatalError("Layer %s not found in layers."%navRooms)
+        layer = self.layerMap[navRooms]
+        tileDict = self.FindRoomTiles()
+        roomDict = self.outputDict[MapDataExtractor.KEY_ROOMS]
+        indexDict = self.outputDict[MapDataExtractor.KEY_WALKABLE]
+        self.roomChanges = set()
+        for layerIndex in sorted(self.valueChanges.get(navRooms, [])):
+            oldRoom = indexDict.get(layerIndex)
+            newRoom = tileDict.get(layer.get(layerIndex))
+            if oldRoom == newRoom:
+                continue
+            if oldRoom is not None:
+                roomCells = roomDict[oldRoom]
+                del roomCells[bisect.bisect_left(roomCells, layerIndex)]
+                del indexDict[layerIndex]
+            if newRoom is not None:
+                bisect.insort(roomDict[newRoom], layerIndex)
+                indexDict[layerIndex] = newRoom
+            self.roomChanges.add(layerIndex)
+        self.stats.SetCounter("Rooms", len(roomDict))
+        self.stats.SetCounter("Nodes", len(indexDict))
+        if self.verbose:
+            print "%d cells changed rooms." % len(self.roomChanges)
+        return True
+
+    # The cells connected to first in a layer, in the same order that
+    # FindConnectedIndices(...) finds them.
+    def FindLayerComponent(self, first, layer):
+        result = []
+        queue = [first]
+        seen = set(queue)
+        while len(queue) > 0:
+            next = queue.pop(0)
+            result.append(next)
+            for adj in self.GetAdjacentIndexes(next):
+                if adj in layer and adj not in seen:
+                    seen.add(adj)
+                    queue.append(adj)
+        return result
+
+    # Find the objects again in the parts of the layers that changed,
+    # then number all the objects and bind the activators the same way
+    # ExtractObjectsData(...) does.
+    def UpdateObjectsData(self):
+        if self.verbose:
+            self.Banner("Updating Objects")
+        lNames = self.GetObjectLayerNames()
+        # The cached objects of each layer, as lists of indices.
+        components = {}
+        oldSubjects = self.outputDict[MapDataExtractor.KEY_OBJECTS]
+        for subject in oldSubjects:
+            objType, indices, binding = oldSubjects[subject]
+            components.setdefault(objType, []).append(indices)
+        found = 0
+        for objType in lNames:
+            changed = self.presenceChanges.get(objType)
+            if not changed:
+                continue
+            layer = self.layerMap[objType]
+            # Objects touching a changed cell are found again.  Every cell
+            # of such an object is in cells, so starting from the smallest
+            # one finds it in the same order as a full extraction.
+            seeds = self.GetNeighborhood(changed)
+            kept = []
+            cells = set()
+            for indices in components.get(objType, []):
+                if seeds.isdisjoint(indices):
+                    kept.append(indices)
+                else:
+                    cells.update(indices)
+            cells = set([idx for idx in cells | seeds if idx in layer])
+            while len(cells) > 0:
+                indices = self.FindLayerComponent(min(cells), layer)
+                cells.difference_update(indices)
+                kept.append(indices)
+                found += 1
+            components[objType] = kept
+        # Number the objects in layer and first index order.
+        subjectID = 1
+        subjects = { }
+        for objType in lNames:
+            for indices in sorted(components.get(objType, []), key=lambda indices: indices[0]):
+                subjects[subjectID] = [objType, indices, []]
+                subjectID += 1
+        subjectIndexMap = {}
+        for subject in subjects:
+            objType,indices,binding = subjects[subject]
+            if objType in self.bindingLayers:
+                continue
+            for idx in indices:
+                subjectIndexMap[idx] = subject
+        # Only the object cells added since the cached run can be nearer
+        # to an activator than the one it was bound to.
+        added = set()
+        for objType in self.presenceChanges:
+            if objType in lNames and objType not in self.bindingLayers:
+                added.update([idx for idx in self.presenceChanges[objType] if idx in subjectIndexMap])
+        added = sorted(added)
+        objIndices = None
+        oldNearest = self.cache["nearestDict"]
+        self.nearestDict = {}
+        keys = subjects.keys()
+        keys.sort()
+        for act in self.bindingLayers:
+            for subject in keys:
+                objType, indices, binding = subjects[subject]
+                if objType != act:
+                    continue
+                nearest = oldNearest.get((act, indices[0]))
+                if nearest is None or nearest not in subjectIndexMap:
+                    if objIndices is None:
+                        objIndices = subjectIndexMap.keys()
+                        objIndices.sort()
+                    nearest = self.FindNearestIndex(indices[0],objIndices)
+                else:
+                    best = (self.DistSquared(indices[0],nearest), nearest)
+                    for idx in added:
+                        best = min(best, (self.DistSquared(indices[0],idx), idx))
+                    nearest = best[1]
+                self.nearestDict[(act, indices[0])] = nearest
+                # Bind the two together
+                bindingTo = subjectIndexMap[nearest]
+                subjects[subject][2].append(bindingTo)
+                subjects[bindingTo][2].append(subject)
+        self.outputDict[MapDataExtractor.KEY_OBJECTS] = subjects
+        self.stats.SetCounter("Objects", len(subjects))
+        if self.verbose:
+            print "Found %d objects again, %d objects in total." % (found, len(subjects))
+        return True
+
+    # Redo the edges of the nodes whose room, blocking or door changed,
+    # and of the nodes next to them.
+    def UpdateAdjacencyData(self):
+        if self.verbose:
+            self.Banner("Updating Adjacency Information")
+        indexDict = self.outputDict[MapDataExtractor.KEY_ADJACENCY]
+        walkable = self.outputDict[MapDataExtractor.KEY_WALKABLE]
+        dirty = set(self.roomChanges)
+        for lname in self.blockingLayers + [self.doorLayer]:
+            dirty.update(self.presenceChanges.get(lname, []))
+        update = self.GetNeighborhood(dirty)
+        # The rooms of the nodes in and around the ones being updated.
+        nodeRooms = {}
+        for layerIndex in self.GetNeighborhood(update):
+            if layerIndex not in walkable:
+                continue
+            if [lname for lname in self.blockingLayers if layerIndex in self.layerMap[lname]]:
+                continue
+            nodeRooms[layerIndex] = walkable[layerIndex]
+        doorDict = self.CreateDoorDict()
+        edges = self.cache["edges"]
+        for layerIndex in update:
+            if layerIndex in indexDict:
+                edges -= len(indexDict[layerIndex][1])
+                del indexDict[layerIndex]
+            if layerIndex in nodeRooms:
+                temp = self.CreateNodeEdges(layerIndex, nodeRooms, doorDict)
+                indexDict[layerIndex] = [nodeRooms[layerIndex], temp]
+                edges += len(temp)
+        self.stats.SetCounter("Edges", edges)
+        if self.verbose:
+            print "Updated the edges of %d cells." % len(update)
+        return True
+
     def ExportTilemapData(self,writer):
         # Export the Tilemap Data
         writer.writerow(["Tilemap", "File", self.tiledFile])
@@ -583,9 +1010,8 @@ class MapDataExtractor(object):
             self.ExportRoomData(writer)
             # Objects
             self.ExportObjectData(writer)
-
-            return True
-        return False
+        self.stats.SetCounter("Output Bytes", os.path.getsize(self.outFile))
+        return True
 
     def CheckInputs(self):
         if self.doorLayer not in self.layerMap:
@@ -614,44 +1040,152 @@ class MapDataExtractor(object):
                    bindingLayers,
                    diagonalEdges,
                    verbose,
-                   reallyVerbose):
+                   reallyVerbose,
+                   statsFile=None,
+                   stageHook=None,
+                   progressRate=2.0,
+                   incremental=False,
+                   cacheFile=None):
+        config = MapDataExtractorConfig(tiledFile=tiledFile,
+                                        floorLayer=floorLayer,
+                                        wallLayer=wallLayer,
+                                        doorLayer=doorLayer,
+                                        navPrefix=navPrefix,
+                                        outFile=outFile,
+                                        excludeLayers=excludeLayers,
+                                        blockingLayers=blockingLayers,
+                                        bindingLayers=bindingLayers,
+                                        diagonalEdges=diagonalEdges,
+                                        verbose=verbose,
+                                        reallyVerbose=reallyVerbose,
+                                        statsFile=statsFile,
+                                        stageHook=stageHook,
+                                        progressRate=progressRate,
+                                        incremental=incremental,
+                                        cacheFile=cacheFile)
+        return self.Process(config)
+
+    # Run everything described by a MapDataExtractorConfig.  If a
+    # MapTiler that has already run is passed in, its layers are used
+    # directly and the Tiled file is not read.  The results are left in
+    # outputDict whether or not they are exported.
+    def Process(self, config, tiler=None):
         # Cache inputs
-        self.tiledFile = tiledFile
-        self.floorLayer = floorLayer
-        self.doorLayer = doorLayer
-        self.wallLayer = wallLayer
-        self.navPrefix = navPrefix
-        self.outFile = outFile
-        self.excludeLayers = excludeLayers
-        self.blockingLayers = blockingLayers
-        self.bindingLayers = bindingLayers
-        self.verbose = verbose
-        self.diagonalEdges = diagonalEdges
-        self.reallyVerbose = reallyVerbose
+        self.config = config
+        self.tiledFile = config.tiledFile
+        self.floorLayer = config.floorLayer
+        self.doorLayer = config.doorLayer
+        self.wallLayer = config.wallLayer
+        self.navPrefix = config.navPrefix
+        self.outFile = config.outFile
+        self.exportData = config.exportData
+        self.excludeLayers = config.excludeLayers
+        self.blockingLayers = config.blockingLayers
+        self.bindingLayers = config.bindingLayers
+        self.verbose = config.verbose or config.reallyVerbose
+        self.diagonalEdges = config.diagonalEdges
+        self.reallyVerbose = config.reallyVerbose
+        self.statsFile = config.statsFile
+        self.incremental = config.incremental
+        self.cacheFile = config.cacheFile or self.outFile + ".cache"
+        if config.progressRate <= 0:
+            return self.FatalError("The progress rate must be more than 0, not %s." % config.progressRate)
+        level = ProgressReporter.LEVEL_QUIET
+        if config.reallyVerbose:
+            level = ProgressReporter.LEVEL_DEBUG
+        elif config.verbose:
+            level = ProgressReporter.LEVEL_PROGRESS
+        self.progress = ProgressReporter(level, config.progressRate)
+        # The hook (if any) is called as hook(stageName, stageResults)
+        # as each stage finishes.
+        self.stats = PerfStats("MapDataExtractor")
+        self.stats.SetStageHook(config.stageHook)
+        self.outputDict = {}
 
         # Pull in the tile map.
-        if not self.LoadTiledMap(tiledFile):
+        if tiler is not None:
+            if self.tiledFile is None:
+                self.tiledFile = tiler.outTiledFile
+            if not self.RunStage("LoadFromTiler", lambda: self.LoadFromTiler(tiler)):
+                return False
+        elif not self.RunStage("LoadTiledMap", lambda: self.LoadTiledMap(self.tiledFile)):
             return False
 
         if not self.CheckInputs():
             return False
 
-        # Extract the rooms.
-        if not self.ExtractRoomsData():
+        # Patch the results of the last incremental run if they can be
+        # used, otherwise extract everything.
+        self.cache = None
+        if self.incremental:
+            self.cache = self.RunStage("LoadCache", self.LoadCache)
+
+        if self.cache is not None:
+            for name, method in [("FindLayerChanges", self.FindLayerChanges),
+                                 ("UpdateRoomsData", self.UpdateRoomsData),
+                                 ("UpdateObjectsData", self.UpdateObjectsData),
+                                 ("UpdateAdjacencyData", self.UpdateAdjacencyData)]:
+                if not self.RunStage(name, method):
+                    return False
+        else:
+            # Extract the rooms.
+            if not self.RunStage("ExtractRoomsData", self.ExtractRoomsData):
+                return False
+
+            # Extract the objects.
+            if not self.RunStage("ExtractObjectsData", self.ExtractObjectsData):
+                return False
+
+            # Extract adjacency
+            if not self.RunStage("ExtractAdjacencyData", self.ExtractAdjacencyData):
+                return False
+
+        if self.exportData and not self.RunStage("ExportData", self.ExportData):
             return False
 
-        # Extract the objects.
-        if not self.ExtractObjectsData():
+        if self.incremental and not self.RunStage("SaveCache", self.SaveCache):
             return False
 
-        # Extract adjacency
-        if not self.ExtractAdjacencyData():
-            return False
+        self.stats.PrintTable()
+        if self.statsFile:
+            self.stats.ExportJSON(self.statsFile)
+        return True
 
-        if not self.ExportData():
-            return False
+    # Run one stage of the processing, recording its statistics.
+    def RunStage(self, name, method):
+        self.stats.BeginStage(name)
+        result = method()
+        self.stats.EndStage(name)
+        return result
 
-        return True
+# All the settings for a MapDataExtractor run, with the same names and
+# defaults as the options to MapDataExtractor.py.  Any of them can be
+# passed in as keyword arguments.  Set exportData to False to keep the
+# results in memory only (see MapPipeline.py).
+class MapDataExtractorConfig(object):
+    def __init__(self, **settings):
+        self.tiledFile = None
+        self.floorLayer = "Floors"
+        self.wallLayer = "Walls"
+        self.doorLayer = "Doors"
+        self.navPrefix = "NAV_"
+        self.outFile = "NavData.csv"
+        self.exportData = True
+        self.excludeLayers = []
+        self.blockingLayers = []
+        self.bindingLayers = []
+        self.diagonalEdges = True
+        self.verbose = False
+        self.reallyVerbose = False
+        self.statsFile = None
+        self.stageHook = None
+        self.progressRate = 2.0
+        self.incremental = False
+        self.cacheFile = None
+        for name in settings:
+            if not hasattr(self, name):
+                raise TypeError("Unknown MapDataExtractor setting %s." % name)
+            setattr(self, name, settings[name])
 
 if __name__ == "__main__":
     arguments = docopt.docopt(__doc__)
@@ -689,6 +1223,10 @@ if __name__ == "__main__":
     reallyVerbose = arguments['--reallyVerbose']
     verbose = arguments["--verbose"] or reallyVerbose
     diagonalEdges = not arguments["--noDiagonalEdges"]
+    statsFile = arguments["--statsFile"]
+    progressRate = float(arguments["--progressRate"])
+    incremental = arguments["--incremental"]
+    cacheFile = arguments["--cacheFile"]
 
     extractor = MapDataExtractor()
     extractor.ProcessMap(tiledFile,
@@ -702,5 +1240,10 @@ if __name__ == "__main__":
                          bindingLayers,
                          diagonalEdges,
                          verbose,
-                         reallyVerbose
+                         reallyVerbose,
+                         statsFile,
+                         None,
+                         progressRate,
+                         incremental,
+                         cacheFile
                          )
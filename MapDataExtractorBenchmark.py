@@ -0,0 +1,382 @@
+# -------------------------------------------------------------
+# License
+# -------------------------------------------------------------
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to
+# whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall
+# be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# -------------------------------------------------------------
+
+
+"""
+Generate large synthetic Tiled (.tmx) maps and benchmark how each stage
+of MapDataExtractor.py scales with the size of the map.
+
+The maps are laid out as a grid of rooms separated by walls, with doors
+cut into some of the walls between neighboring rooms.  Object layers
+and binding (activator) layers are scattered over the floor.  A
+<navPrefix>Rooms layer and the room tile properties are written the
+same way MapTiler.py writes them, so the maps can be fed straight to
+MapDataExtractor.ProcessMap(...).
+
+Each size is run in turn and the time for each stage is recorded, along
+with the time spent in FindConnectedIndices and FindNearestIndex.  The
+results are written to a CSV file and printed as a scaling curve.  The
+"Exponent" columns are the slope of log(time) against log(cells)
+between one size and the next: 1.0 is linear, 2.0 is quadratic.
+
+Usage: MapDataExtractorBenchmark.py [--sizes=SIZES]
+                                    [--rooms=ROOMS]
+                                    [--doorDensity=DOORS]
+                                    [--objectDensity=OBJECTS]
+                                    [--objectLayers=LAYERS]
+                                    [--bindingLayers=BINDING]
+                                    [--bindingDensity=BDENSITY]
+                                    [--seed=SEED]
+                                    [--results=RESULTS]
+                                    [--workDir=WORKDIR]
+
+Options:
+    --sizes=SIZES               A comma separated list of the map sizes
+                                (width and height in tiles) to run, e.g.
+                                64,128,256,512,1024,2048,4096.
+                                [Default: 64,128,256]
+    --rooms=ROOMS               The (approximate) number of rooms in each
+                                map.  They are laid out as a square grid.
+                                [Default: 16]
+    --doorDensity=DOORS         The fraction (0-1) of the walls between
+                                neighboring rooms that get a door.
+                                [Default: 0.75]
+    --objectDensity=OBJECTS     The fraction (0-1) of floor cells covered
+                                by objects, over all the object layers.
+                                [Default: 0.05]
+    --objectLayers=LAYERS       The number of object layers.
+                                [Default: 3]
+    --bindingLayers=BINDING     The number of binding (activator) layers.
+                                [Default: 1]
+    --bindingDensity=BDENSITY   The fraction (0-1) of floor cells with an
+                                activator on each binding layer.
+                                [Default: 0.005]
+    --seed=SEED                 The random seed, so runs can be repeated.
+                                [Default: 1]
+    --results=RESULTS           The CSV file the scaling curve is written to.
+                                [Default: MapDataExtractorBenchmark.csv]
+    --workDir=WORKDIR           The directory the maps and outputs are
+                                written to.
+                                [Default: MapDataExtractorBenchmark]
+
+Website:        http://www.NonlinearIdeas.com
+Repository:     https://github.com/NonlinearIdeas/Map-Tiler
+Report Issues:  https://github.com/NonlinearIdeas/Map-Tiler
+License:        MIT License - See specific text in source code.
+Copyright:      Copyright (c) 2015 Nonlinear Ideas Inc (contact@nlideas.com)
+"""
+
+import os
+import csv
+import math
+import random
+import docopt
+from MapDataExtractor import MapDataExtractor
+
+
+class MapDataExtractorBenchmark(object):
+    NAV_PREFIX = "NAV_"
+    FLOOR_LAYER = "Floors"
+    WALL_LAYER = "Walls"
+    DOOR_LAYER = "Doors"
+    TILE_SIZE = 32
+
+    # Tile indices used in the generated maps.  Object and binding
+    # layers get their own tiles after these, followed by the room
+    # tiles.
+    TILE_FLOOR = 1
+    TILE_WALL = 2
+    TILE_DOOR = 3
+
+    # The stages reported, in order.  The last two happen inside
+    # ExtractObjectsData.
+    STAGES = ["LoadTiledMap", "ExtractRoomsData", "ExtractObjectsData",
+              "ExtractAdjacencyData", "ExportData",
+              "FindConnectedIndices", "FindNearestIndex"]
+
+    def __init__(self):
+        self.Reset()
+
+    def Reset(self):
+        # Keyed by layer name.  Each entry is a dictionary of
+        # cell index -> tile index for the occupied cells.
+        self.layerMap = {}
+        self.layerNames = []
+        # Keyed by room tile index, the room number.
+        self.roomTiles = {}
+        self.objectLayerNames = []
+        self.bindingLayerNames = []
+
+    def GenerateMap(self, size):
+        self.Reset()
+        rng = random.Random(self.seed + size)
+        roomsPerSide = max(1, int(round(math.sqrt(self.rooms))))
+        roomSize = max(3, size / roomsPerSide)
+        roomsPerSide = int(math.ceil(size * 1.0 / roomSize))
+        floors = {}
+        walls = {}
+        doors = {}
+        rooms = {}
+        self.objectLayerNames = ["Object%02d" % idx for idx in xrange(self.objectLayers)]
+        self.bindingLayerNames = ["Binding%02d" % idx for idx in xrange(self.bindingLayers)]
+        nextTile = MapDataExtractorBenchmark.TILE_DOOR + 1
+        objectTiles = {}
+        for lname in self.objectLayerNames + self.bindingLayerNames:
+            objectTiles[lname] = nextTile
+            nextTile += 1
+        roomTileBase = nextTile
+        # Floors everywhere, walls on the room boundaries and the
+        # edges of the map.
+        for row in xrange(size):
+            for col in xrange(size):
+                idx = row * size + col
+                floors[idx] = MapDataExtractorBenchmark.TILE_FLOOR
+                if col % roomSize == 0 or row % roomSize == 0 or col == size - 1 or row == size - 1:
+                    walls[idx] = MapDataExtractorBenchmark.TILE_WALL
+        # Cut doors into the walls between neighboring rooms.
+        for roomRow in xrange(roomsPerSide):
+            for roomCol in xrange(roomsPerSide):
+                # Door to the room on the right, then the room below.
+                for dCol, dRow in [(1, 0), (0, 1)]:
+                    if roomCol + dCol >= roomsPerSide or roomRow + dRow >= roomsPerSide:
+                        continue
+                    if rng.random() >= self.doorDensity:
+                        continue
+                    if dCol:
+                        col = (roomCol + 1) * roomSize
+                        row = roomRow * roomSize + rng.randint(1, roomSize - 1)
+                    else:
+                        col = roomCol * roomSize + rng.randint(1, roomSize - 1)
+                        row = (roomRow + 1) * roomSize
+                    if col >= size - 1 or row >= size - 1:
+                        continue
+                    idx = row * size + col
+                    if idx in walls:
+                        del walls[idx]
+                        doors[idx] = MapDataExtractorBenchmark.TILE_DOOR
+        # Every open cell belongs to the room it is in.  Door cells
+        # belong to the room on their left/top.
+        for idx in floors:
+            if idx in walls:
+                continue
+            col = idx % size
+            row = idx / size
+            if idx in doors:
+                if col % roomSize == 0:
+                    col -= 1
+                else:
+                    row -= 1
+            room = (row / roomSize) * roomsPerSide + (col / roomSize)
+            rooms[idx] = roomTileBase + room
+            self.roomTiles[roomTileBase + room] = room
+        # Scatter the objects and activators over the open cells.
+        openCells = sorted(rooms.keys())
+        self.layerMap = {
+            MapDataExtractorBenchmark.FLOOR_LAYER:floors,
+            MapDataExtractorBenchmark.WALL_LAYER:walls,
+            MapDataExtractorBenchmark.DOOR_LAYER:doors,
+            MapDataExtractorBenchmark.NAV_PREFIX + "Rooms":rooms,
+        }
+        for lname in self.objectLayerNames + self.bindingLayerNames:
+            if lname in self.objectLayerNames:
+                density = self.objectDensity / max(1, self.objectLayers)
+            else:
+                density = self.bindingDensity
+            count = int(len(openCells) * density)
+            self.layerMap[lname] = { idx:objectTiles[lname] for idx in rng.sample(openCells, count) }
+        self.layerNames = [MapDataExtractorBenchmark.FLOOR_LAYER,
+                           MapDataExtractorBenchmark.WALL_LAYER,
+                           MapDataExtractorBenchmark.DOOR_LAYER] + \
+                          self.objectLayerNames + self.bindingLayerNames + \
+                          [MapDataExtractorBenchmark.NAV_PREFIX + "Rooms"]
+        return True
+
+    # The maps can be very large, so the file is written directly
+    # instead of building an element tree first.
+    def ExportTiledFile(self, size, fileName):
+        tileSize = MapDataExtractorBenchmark.TILE_SIZE
+        with open(fileName, "w") as outFile:
+            outFile.write("<?xml version='1.0' encoding='UTF-8'?>\n")
+            outFile.write('<map version="1.0" orientation="orthogonal" renderorder="left-up" '
+                          'width="%d" height="%d" tilewidth="%d" tileheight="%d">\n' % (
+                          size, size, tileSize, tileSize))
+            outFile.write('  <tileset firstgid="1" name="tileset" tilewidth="%d" tileheight="%d">\n' % (
+                tileSize, tileSize))
+            outFile.write('    <image source="tileset.png" width="%d" height="%d"/>\n' % (tileSize, tileSize))
+            for tileIdx in sorted(self.roomTiles.keys()):
+                outFile.write('    <tile id="%d"><properties><property name="%sROOM" value="%d"/>'
+                              '</properties></tile>\n' % (
+                              tileIdx, MapDataExtractorBenchmark.NAV_PREFIX, self.roomTiles[tileIdx]))
+            outFile.write('  </tileset>\n')
+            for lname in self.layerNames:
+                layer = self.layerMap[lname]
+                outFile.write('  <layer name="%s" width="%d" height="%d">\n    <data>\n' % (lname, size, size))
+                for idx in xrange(size * size):
+                    if idx in layer:
+                        outFile.write('      <tile gid="%d"/>\n' % (layer[idx] + 1))
+                    else:
+                        outFile.write('      <tile gid="0"/>\n')
+                outFile.write('    </data>\n  </layer>\n')
+            outFile.write('</map>\n')
+        return True
+
+    # Wrap a method of the extractor so every call is timed as its
+    # own (nested) stage.
+    def TimeMethod(self, extractor, name):
+        method = getattr(extractor, name)
+        def Timed(*args):
+            extractor.stats.BeginStage(name)
+            result = method(*args)
+            extractor.stats.EndStage(name)
+            return result
+        setattr(extractor, name, Timed)
+
+    def RunSize(self, size):
+        print "Generating %d x %d map..." % (size, size)
+        self.GenerateMap(size)
+        tiledFile = os.path.join(self.workDir, "map%d.tmx" % size)
+        outFile = os.path.join(self.workDir, "map%d.csv" % size)
+        self.ExportTiledFile(size, tiledFile)
+        extractor = MapDataExtractor()
+        self.TimeMethod(extractor, "FindConnectedIndices")
+        self.TimeMethod(extractor, "FindNearestIndex")
+        # ProcessMap replaces the stats, so pull the results from the hook.
+        stages = {}
+        def StageHook(name, stage):
+            stages[name] = stage
+        result = extractor.ProcessMap(tiledFile,
+                                      MapDataExtractorBenchmark.FLOOR_LAYER,
+                                      MapDataExtractorBenchmark.WALL_LAYER,
+                                      MapDataExtractorBenchmark.DOOR_LAYER,
+                                      MapDataExtractorBenchmark.NAV_PREFIX,
+                                      outFile,
+                                      [],
+                                      [],
+                                      self.bindingLayerNames,
+                                      True,
+                                      False,
+                                      False,
+                                      stageHook=StageHook)
+        if not result:
+            return None
+        row = { "size":size, "cells":size * size }
+        for name in MapDataExtractorBenchmark.STAGES:
+            row[name] = stages[name]["wallSeconds"] if name in stages else 0.0
+        row["peakRSSBytes"] = extractor.stats.GetPeakRSS()
+        for name in ["Rooms", "Nodes", "Objects", "Edges", "Output Bytes"]:
+            row[name] = extractor.stats.GetCounter(name)
+        return row
+
+    def CalculateExponent(self, prev, row, name):
+        if prev[name] <= 0 or row[name] <= 0:
+            return None
+        return math.log(row[name] / prev[name]) / math.log(row["cells"] * 1.0 / prev["cells"])
+
+    def PrintCurve(self, rows):
+        print "---------------------------------"
+        print "Scaling Curve (seconds, exponent vs. cells)"
+        print "---------------------------------"
+        print "%-22s" % "Stage" + "".join(["%16s" % ("%dx%d" % (row["size"], row["size"])) for row in rows])
+        for name in MapDataExtractorBenchmark.STAGES:
+            line = "%-22s" % name
+            for idx in xrange(len(rows)):
+                text = "%.3f" % rows[idx][name]
+                if idx > 0:
+                    exponent = self.CalculateExponent(rows[idx - 1], rows[idx], name)
+                    if exponent is not None:
+                        text += " (%.2f)" % exponent
+                line += "%16s" % text
+            print line
+        for name in ["Nodes", "Edges", "Objects", "Rooms"]:
+            print "%-22s" % name + "".join(["%16d" % row[name] for row in rows])
+        print
+
+    def ExportResults(self, rows):
+        columns = ["size", "cells"] + MapDataExtractorBenchmark.STAGES + \
+                  ["peakRSSBytes", "Rooms", "Nodes", "Objects", "Edges", "Output Bytes"]
+        with open(self.resultsFile, "wb") as csvfile:
+            writer = csv.writer(csvfile)
+            writer.writerow(columns)
+            for row in rows:
+                writer.writerow([row[name] for name in columns])
+        print "Saving scaling curve to %s." % self.resultsFile
+        return True
+
+    def RunBenchmark(self,
+                     sizes,
+                     rooms,
+                     doorDensity,
+                     objectDensity,
+                     objectLayers,
+                     bindingLayers,
+                     bindingDensity,
+                     seed,
+                     resultsFile,
+                     workDir):
+        self.rooms = rooms
+        self.doorDensity = doorDensity
+        self.objectDensity = objectDensity
+        self.objectLayers = objectLayers
+        self.bindingLayers = bindingLayers
+        self.bindingDensity = bindingDensity
+        self.seed = seed
+        self.resultsFile = resultsFile
+        self.workDir = workDir
+        if not os.path.exists(workDir):
+            os.makedirs(workDir)
+        rows = []
+        for size in sizes:
+            row = self.RunSize(size)
+            if row is None:
+                print "MapDataExtractor failed on size %d.  Unable to continue." % size
+                return False
+            rows.append(row)
+            # Write as we go, the large sizes can take a long time.
+            self.ExportResults(rows)
+        self.PrintCurve(rows)
+        return True
+
+if __name__ == "__main__":
+    arguments = docopt.docopt(__doc__)
+    print "-----------------------------------"
+    print "Inputs:"
+    args = arguments.keys()
+    args.sort()
+    for arg in args:
+        print "%-25s %s" % (arg, arguments[arg])
+    print "-----------------------------------"
+
+    benchmark = MapDataExtractorBenchmark()
+    benchmark.RunBenchmark([int(size) for size in arguments["--sizes"].split(",")],
+                           int(arguments["--rooms"]),
+                           float(arguments["--doorDensity"]),
+                           float(arguments["--objectDensity"]),
+                           int(arguments["--objectLayers"]),
+                           int(arguments["--bindingLayers"]),
+                           float(arguments["--bindingDensity"]),
+                           int(arguments["--seed"]),
+                           arguments["--results"],
+                           arguments["--workDir"])
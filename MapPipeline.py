@@ -0,0 +1,343 @@
+# -------------------------------------------------------------
+# License
+# -------------------------------------------------------------
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to
+# whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall
+# be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# -------------------------------------------------------------
+
+
+"""
+Run MapTiler.py and MapDataExtractor.py as one step.  The extractor uses
+the layers and room tiles the tiler built in memory, so the Tiled
+(.tmx) file does not have to be written and read back in between.
+Writing the tileset, the Tiled file and the nav data are each optional.
+
+From Python:
+
+    tilerConfig = MapTilerConfig(tileWidth=32, tileHeight=32,
+                                 fileList=["Floors.png", ...],
+                                 floorLayer="Floors", wallLayer="Walls",
+                                 portalLayer="Portals", doorLayer="Doors",
+                                 exportTileset=False, exportTiledFile=False)
+    extractorConfig = MapDataExtractorConfig(bindingLayers=["DoorActivators"],
+                                             exportData=False)
+    pipeline = MapPipeline()
+    if pipeline.Process(tilerConfig, extractorConfig):
+        rooms = pipeline.extractor.outputDict[MapDataExtractor.KEY_ROOMS]
+
+The nav layer names and prefix given to the tiler are also used by the
+extractor.
+
+With --watch, the script keeps running after the first pass and checks
+the layer images for changes (by polling, so it works everywhere).  The
+tiles and layers stay in memory, so when a layer is saved only that
+layer is tiled again, against the tiles already found.  The nav layers
+are only built again if the floor, wall, portal or door layer changed.
+Tiles no longer used are dropped, and the tileset, Tiled file and nav
+data are written again.  A change is only picked up once the file has
+stopped changing for one poll, so a half saved image is not read.
+
+Usage: MapPipeline.py   [--tileWidth=WIDTH]
+                        [--tileHeight=HEIGHT]
+                        [--tileOffX=OFFX]
+                        [--tileOffY=OFFY]
+                        [--tileInsetX=INSETX]
+                        [--tileInsetY=INSETY]
+                        [--filePattern=PATTERN]
+                        [--floorLayer=FLOORLAYER]
+                        [--wallLayer=WALLLAYER]
+                        [--portalLayer=PORTALLAYER]
+                        [--doorLayer=DOORLAYER]
+                        [--navPrefix=NAVPREFIX]
+                        [--outTileset=OUTTILESET]
+                        [--outTiled=OUTTILED]
+                        [--outFile=OUTFILE]
+                        [--noTileset]
+                        [--noTiled]
+                        [--noNavData]
+                        [--overwriteExisting]
+                        [--mergeExisting]
+                        [--exclude=LAYER ...]
+                        [--blocking=LAYER ...]
+                        [--binding=LAYER ...]
+                        [--noDiagonalEdges]
+                        [--verbose]
+                        [--watch]
+                        [--pollSeconds=SECONDS]
+                        [<layerImage>...]
+
+Options:
+    layerImage                  The layer images, as for MapTiler.py.
+    --tileWidth=WIDTH           The tile width in pixels.
+                                [Default: 64]
+    --tileHeight=HEIGHT         The tile height in pixels.
+                                [Default: 64]
+    --tileOffX=OFFX             Offset pixels in the image in the
+                                x direction.
+                                [Default: 0]
+    --tileOffY=OFFY             Offset pixels in the image in the
+                                y direction.
+                                [Default: 0]
+    --tileInsetX=INSETX         Inset pixels in the image in the
+                                x direction.
+                                [Default: 0]
+    --tileInsetY=INSETY         Inset pixels in the image in the
+                                y direction.
+                                [Default: 0]
+    --filePattern=PATTERN       A search pattern for the layer images.
+    --floorLayer=FLOORLAYER     The layer used for floors.
+                                [Default: Floors]
+    --wallLayer=WALLLAYER       The layer used for walls.
+                                [Default: Walls]
+    --portalLayer=PORTALLAYER   The layer used for portals.
+                                [Default: Portals]
+    --doorLayer=DOORLAYER       The layer used for doors.
+                                [Default: Doors]
+    --navPrefix=NAVPREFIX       The prefix for the generated nav layers.
+                                [Default: NAV_]
+    --outTileset=OUTTILESET     The tileset image to write.
+                                [Default: tileset.png]
+    --outTiled=OUTTILED         The Tiled file to write.
+                                [Default: tiled.tmx]
+    --outFile=OUTFILE           The CSV nav data file to write.
+                                [Default: NavData.csv]
+    --noTileset                 Do not write the tileset image.
+    --noTiled                   Do not write the Tiled file.
+    --noNavData                 Do not write the CSV nav data file.
+    --overwriteExisting         Overwrite the tileset and Tiled file.
+    --mergeExisting             Merge into the existing Tiled file.
+    --exclude=LAYER             A layer to leave out of the objects.
+                                Can be specified multiple times.
+    --blocking=LAYER            An object layer that blocks navigation.
+                                Can be specified multiple times.
+    --binding=LAYER             An object layer that is bound to the
+                                nearest other object.
+                                Can be specified multiple times.
+    --noDiagonalEdges           Only N, S, E, W edges in the nav graph.
+    --verbose                   Generate output while processing.
+    --watch                     Keep running and process the layers
+                                again whenever they change.
+    --pollSeconds=SECONDS       How often to check the layers for changes
+                                with --watch.
+                                [Default: 1]
+
+Website:        http://www.NonlinearIdeas.com
+Repository:     https://github.com/NonlinearIdeas/Map-Tiler
+Report Issues:  https://github.com/NonlinearIdeas/Map-Tiler
+License:        MIT License - See specific text in source code.
+Copyright:      Copyright (c) 2015 Nonlinear Ideas Inc (contact@nlideas.com)
+"""
+
+import os
+import time
+import datetime
+import docopt
+from MapTiler import MapTiler, MapTilerConfig
+from MapDataExtractor import MapDataExtractor, MapDataExtractorConfig
+
+
+class MapPipeline(object):
+    def __init__(self):
+        self.tiler = None
+        self.extractor = None
+
+    # Run the tiler and then the extractor on its results.  Both are
+    # kept (self.tiler, self.extractor) so their results can be used
+    # without reading anything back from disk.
+    def Process(self, tilerConfig, extractorConfig):
+        if None in [tilerConfig.floorLayer, tilerConfig.wallLayer, tilerConfig.portalLayer, tilerConfig.doorLayer]:
+            print "The floor, wall, portal and door layers are needed to create nav data."
+            print "Unable to continue."
+            return False
+        # The extractor looks for the layers the tiler made.
+        extractorConfig.floorLayer = tilerConfig.floorLayer
+        extractorConfig.wallLayer = tilerConfig.wallLayer
+        extractorConfig.doorLayer = tilerConfig.doorLayer
+        extractorConfig.navPrefix = tilerConfig.outNavPrefix
+        self.tiler = MapTiler()
+        if not self.tiler.Process(tilerConfig):
+            return False
+        self.extractor = MapDataExtractor()
+        if not self.extractor.Process(extractorConfig, self.tiler):
+            return False
+        return True
+
+
+class MapWatcher(object):
+    def __init__(self, tilerConfig, extractorConfig):
+        self.tilerConfig = tilerConfig
+        self.extractorConfig = extractorConfig
+        self.pipeline = MapPipeline()
+        # Keyed by layer index.  The (size, mtime) of the layer image when
+        # it was last processed, and when it was last seen changed.
+        self.stamps = {}
+        self.pendingStamps = {}
+
+    # The (size, mtime) of a file, or None if it is missing (e.g. while
+    # it is being saved).
+    def GetFileStamp(self, fileName):
+        if not os.path.exists(fileName):
+            return None
+        stat = os.stat(fileName)
+        return (stat.st_size, stat.st_mtime)
+
+    # Run the whole pipeline once, as MapPipeline.py would.
+    def Start(self):
+        if not self.pipeline.Process(self.tilerConfig, self.extractorConfig):
+            return False
+        tiler = self.pipeline.tiler
+        for layerIdx in xrange(len(tiler.layerFiles)):
+            self.stamps[layerIdx] = self.GetFileStamp(tiler.layerFiles[layerIdx])
+        return True
+
+    # Layers whose image changed and has not changed again since the
+    # last poll.
+    def FindChangedLayers(self):
+        tiler = self.pipeline.tiler
+        changed = []
+        for layerIdx in xrange(len(tiler.layerFiles)):
+            stamp = self.GetFileStamp(tiler.layerFiles[layerIdx])
+            if stamp is None or stamp == self.stamps[layerIdx]:
+                self.pendingStamps.pop(layerIdx, None)
+                continue
+            if self.pendingStamps.get(layerIdx) == stamp:
+                changed.append(layerIdx)
+            else:
+                self.pendingStamps[layerIdx] = stamp
+        return changed
+
+    # A changed layer must still be the same size as the others.
+    def CheckLayerImage(self, layerIdx):
+        tiler = self.pipeline.tiler
+        fileName = tiler.layerFiles[layerIdx]
+        try:
+            img = tiler.LoadCroppedImage(fileName)
+        except IOError:
+            print "Unable to read %s, will try again when it changes." % fileName
+            return False
+        if img.size != (tiler.imageWidth, tiler.imageHeight):
+            print "Image %s Size (%d x %d) does not match base size (%d x %d)." % (
+                fileName, img.size[0], img.size[1], tiler.imageWidth, tiler.imageHeight)
+            return False
+        return True
+
+    # Tile the changed layers again and bring all the outputs up to date.
+    def Update(self, changed):
+        tiler = self.pipeline.tiler
+        startTime = datetime.datetime.now()
+        for layerIdx in changed:
+            self.stamps[layerIdx] = self.pendingStamps.pop(layerIdx)
+        changed = [layerIdx for layerIdx in changed if self.CheckLayerImage(layerIdx)]
+        if len(changed) == 0:
+            return False
+        names = [tiler.layerNames[layerIdx] for layerIdx in changed]
+        print "---------------------------------"
+        print "Layers changed: %s" % ", ".join(names)
+        tiler.tilesPossible -= len(changed) * tiler.layerTiles
+        for layerIdx in changed:
+            tiler.TileLayer(layerIdx)
+        navLayers = [tiler.navFloorLayer, tiler.navWallLayer, tiler.navPortalLayer, tiler.navDoorLayer]
+        if len([name for name in names if name in navLayers]) > 0:
+            print "Nav layers changed, creating nav data again."
+            tiler.RemoveNavData()
+            if not tiler.RunStage("CreateNavData", tiler.CreateNavData):
+                return False
+        removed = tiler.CompactTiles()
+        imageTiles = set([0])
+        for lname in tiler.layerNames[:len(tiler.layerFiles)]:
+            for tileIdx, xForm in tiler.layerDict[lname].itervalues():
+                imageTiles.add(tileIdx)
+        tiler.tilesCreated = len(imageTiles)
+        print "%d tiles are no longer used, %d tiles in the tileset." % (removed, len(tiler.imageDict))
+        if not tiler.RunStage("ExportTileset", tiler.ExportTileset):
+            return False
+        if not tiler.RunStage("ExportTiledFile", tiler.ExportTiledFile):
+            return False
+        if tiler.metaTileFile:
+            if not tiler.RunStage("ExportMetaTiles", tiler.ExportMetaTiles):
+                return False
+        if not self.pipeline.extractor.Process(self.extractorConfig, tiler):
+            return False
+        print "Updated in %.2f seconds." % (datetime.datetime.now() - startTime).total_seconds()
+        return True
+
+    def Poll(self):
+        changed = self.FindChangedLayers()
+        if len(changed) == 0:
+            return False
+        return self.Update(changed)
+
+    # Keep polling until interrupted (Ctrl-C).
+    def Watch(self, pollSeconds):
+        print "Watching %d layers for changes.  Press Ctrl-C to stop." % len(self.pipeline.tiler.layerFiles)
+        try:
+            while True:
+                time.sleep(pollSeconds)
+                self.Poll()
+        except KeyboardInterrupt:
+            print "Stopped watching."
+        return True
+
+
+if __name__ == "__main__":
+    arguments = docopt.docopt(__doc__)
+    print "-----------------------------------"
+    print "Inputs:"
+    args = arguments.keys()
+    args.sort()
+    for arg in args:
+        print "%-25s %s" % (arg, arguments[arg])
+    print "-----------------------------------"
+    tilerConfig = MapTilerConfig(tileWidth=int(arguments['--tileWidth']),
+                                 tileHeight=int(arguments['--tileHeight']),
+                                 tileOffX=int(arguments['--tileOffX']),
+                                 tileOffY=int(arguments['--tileOffY']),
+                                 tileInsetX=int(arguments['--tileInsetX']),
+                                 tileInsetY=int(arguments['--tileInsetY']),
+                                 fileList=arguments['<layerImage>'],
+                                 inputFilePattern=arguments['--filePattern'],
+                                 floorLayer=arguments['--floorLayer'],
+                                 wallLayer=arguments['--wallLayer'],
+                                 portalLayer=arguments['--portalLayer'],
+                                 doorLayer=arguments['--doorLayer'],
+                                 outNavPrefix=arguments['--navPrefix'],
+                                 outTilesetFile=arguments['--outTileset'],
+                                 outTiledFile=arguments['--outTiled'],
+                                 exportTileset=not arguments['--noTileset'],
+                                 exportTiledFile=not arguments['--noTiled'],
+                                 overwriteExisting=arguments['--overwriteExisting'],
+                                 mergeExisting=arguments['--mergeExisting'],
+                                 verbose=arguments['--verbose'])
+    extractorConfig = MapDataExtractorConfig(outFile=arguments['--outFile'],
+                                             exportData=not arguments['--noNavData'],
+                                             excludeLayers=arguments['--exclude'],
+                                             blockingLayers=arguments['--blocking'],
+                                             bindingLayers=arguments['--binding'],
+                                             diagonalEdges=not arguments['--noDiagonalEdges'],
+                                             verbose=arguments['--verbose'])
+    if arguments['--watch']:
+        watcher = MapWatcher(tilerConfig, extractorConfig)
+        if watcher.Start():
+            watcher.Watch(float(arguments['--pollSeconds']))
+    else:
+        pipeline = MapPipeline()
+        pipeline.Process(tilerConfig, extractorConfig)
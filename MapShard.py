@@ -0,0 +1,526 @@
+# -------------------------------------------------------------
+# License
+# -------------------------------------------------------------
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to
+# whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall
+# be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# -------------------------------------------------------------
+
+
+"""
+Split the tiling of one huge map across several machines (or processes).
+
+Each shard tiles a rectangle of cells of every layer and saves its
+unique tiles, their fingerprints and the tile used by each of its cells
+to a shard file.  The merge then combines the shard files into one
+tileset and Tiled file, exactly as if MapTiler.py had tiled the whole
+map, and builds the nav data for the whole map.
+
+    tile    Tile the region COL,ROW,COLS,ROWS (in cells, after the
+            offset and inset are applied) and write a shard file.
+    merge   Combine shard files into the tileset and Tiled file.  The
+            shards must cover every cell of the map exactly once.
+    local   Split the map into SHARDCOLS x SHARDROWS regions, tile them
+            in parallel on this machine and merge them.
+
+The tile ids only depend on the contents of the shards, not the order
+they are given in or finish in, so every merge of the same shards gives
+the same tileset and Tiled file.
+
+Usage: MapShard.py tile <shardFile> --region=REGION
+                        [--tileWidth=WIDTH]
+                        [--tileHeight=HEIGHT]
+                        [--tileOffX=OFFX]
+                        [--tileOffY=OFFY]
+                        [--tileInsetX=INSETX]
+                        [--tileInsetY=INSETY]
+                        [--filePattern=PATTERN]
+                        [--verbose]
+                        [<layerImage>...]
+       MapShard.py merge <shardFile>...
+                        [--floorLayer=FLOORLAYER]
+                        [--wallLayer=WALLLAYER]
+                        [--portalLayer=PORTALLAYER]
+                        [--doorLayer=DOORLAYER]
+                        [--maxAtlasSize=MAXSIZE]
+                        [--atlasPacking=PACKING]
+                        [--tileOrder=ORDER]
+                        [--overwriteExisting]
+                        [--mergeExisting]
+                        [--outTileset=OUTTILESET]
+                        [--outTiled=OUTTILED]
+                        [--outNavPrefix=OUTNAVPRE]
+                        [--statsFile=STATSFILE]
+                        [--verbose]
+       MapShard.py local --shards=SHARDS
+                        [--processes=PROCESSES]
+                        [--shardDir=SHARDDIR]
+                        [--tileWidth=WIDTH]
+                        [--tileHeight=HEIGHT]
+                        [--tileOffX=OFFX]
+                        [--tileOffY=OFFY]
+                        [--tileInsetX=INSETX]
+                        [--tileInsetY=INSETY]
+                        [--filePattern=PATTERN]
+                        [--floorLayer=FLOORLAYER]
+                        [--wallLayer=WALLLAYER]
+                        [--portalLayer=PORTALLAYER]
+                        [--doorLayer=DOORLAYER]
+                        [--maxAtlasSize=MAXSIZE]
+                        [--atlasPacking=PACKING]
+                        [--tileOrder=ORDER]
+                        [--overwriteExisting]
+                        [--mergeExisting]
+                        [--outTileset=OUTTILESET]
+                        [--outTiled=OUTTILED]
+                        [--outNavPrefix=OUTNAVPRE]
+                        [--statsFile=STATSFILE]
+                        [--verbose]
+                        [<layerImage>...]
+
+Options:
+    shardFile                   The shard file to write (tile) or the
+                                shard files to combine (merge).
+    layerImage                  The layer images, as for MapTiler.py.
+    --region=REGION             The cells to tile as COL,ROW,COLS,ROWS.
+    --shards=SHARDS             How to split the map for a local run, as
+                                SHARDCOLSxSHARDROWS (e.g. 2x2).
+    --processes=PROCESSES       The number of shards to tile at the same
+                                time.  0 uses one per CPU.  1 does not
+                                start any extra processes.
+                                [Default: 0]
+    --shardDir=SHARDDIR         Where a local run writes its shard files.
+                                [Default: .]
+    --tileWidth=WIDTH           The width of the tiles in pixels.
+                                [Default: 64]
+    --tileHeight=HEIGHT         The height of the tiles in pixels.
+                                [Default: 64]
+    --tileOffX=OFFX             The x offset of the first tile in pixels.
+                                [Default: 0]
+    --tileOffY=OFFY             The y offset of the first tile in pixels.
+                                [Default: 0]
+    --tileInsetX=INSETX         The pixels to ignore at the right side.
+                                [Default: 0]
+    --tileInsetY=INSETY         The pixels to ignore at the bottom.
+                                [Default: 0]
+    --filePattern=PATTERN       A pattern for the layer images, as for
+                                MapTiler.py.
+    --floorLayer=FLOORLAYER     The nav layers, as for MapTiler.py.
+    --wallLayer=WALLLAYER
+    --portalLayer=PORTALLAYER
+    --doorLayer=DOORLAYER
+    --maxAtlasSize=MAXSIZE      As for MapTiler.py.
+                                [Default: 0]
+    --atlasPacking=PACKING      As for MapTiler.py.
+                                [Default: pow2]
+    --tileOrder=ORDER           As for MapTiler.py.
+                                [Default: discovery]
+    --overwriteExisting         Overwrite output files with new files.
+    --mergeExisting             Overwrite the tileset file and attempt
+                                to merge the tiled file.
+    --outTileset=OUTTILESET     The tileset to write.
+                                [Default: tileset.png]
+    --outTiled=OUTTILED         The Tiled file to write.
+                                [Default: tiled.tmx]
+    --outNavPrefix=OUTNAVPRE    The prefix for the nav layers.
+                                [Default: NAV_]
+    --statsFile=STATSFILE       Also save the stage statistics and
+                                counters to this file as JSON.
+    --verbose                   Print progress.
+
+Website:        http://www.NonlinearIdeas.com
+Repository:     https://github.com/NonlinearIdeas/Map-Tiler
+Report Issues:  https://github.com/NonlinearIdeas/Map-Tiler
+License:        MIT License - See specific text in source code.
+Copyright:      Copyright (c) 2015 Nonlinear Ideas Inc (contact@nlideas.com)
+"""
+
+import os
+import datetime
+import cPickle
+import multiprocessing
+import Image
+import docopt
+from MapTiler import MapTiler, MapTilerConfig
+
+
+# Tile one region of the map and save it as a shard file.  This is run
+# in a worker process for local runs, so the job is a plain tuple.
+# Returns True if the shard was written.
+def TileShard(job):
+    settings, region, shardFile, verbose = job
+    col0, row0, cols, rows = region
+    config = MapTilerConfig(tileWidth=settings["tileWidth"],
+                            tileHeight=settings["tileHeight"],
+                            tileOffX=settings["tileOffX"],
+                            tileOffY=settings["tileOffY"],
+                            tileInsetX=settings["tileInsetX"],
+                            tileInsetY=settings["tileInsetY"],
+                            exportTileset=False,
+                            exportTiledFile=False,
+                            verbose=verbose)
+    tiler = MapTiler()
+    tiler.Configure(config)
+    print "Tiling shard %s (%d,%d %dx%d)." % (shardFile, col0, row0, cols, rows)
+    if not tiler.CreateLayerFiles(settings["filePattern"], list(settings["fileList"])):
+        return False
+    # Find the size of the whole map first.
+    if not tiler.RunStage("CheckImageSizes", tiler.CheckImageSizes):
+        return False
+    signature = {
+        "tileSize":(tiler.tileWidth, tiler.tileHeight),
+        "offset":(tiler.tileOffX, tiler.tileOffY),
+        "inset":(tiler.tileInsetX, tiler.tileInsetY),
+        "layerNames":list(tiler.layerNames),
+        "layerSize":(tiler.layerWidth, tiler.layerHeight),
+    }
+    if col0 < 0 or row0 < 0 or cols <= 0 or rows <= 0 or \
+            col0 + cols > tiler.layerWidth or row0 + rows > tiler.layerHeight:
+        print "Region %d,%d %dx%d is not inside the map (%d x %d cells)." % (
+            col0, row0, cols, rows, tiler.layerWidth, tiler.layerHeight)
+        return False
+    # The region is tiled by moving the offset to its first cell and
+    # the inset back to its last one.
+    x0, y0, x1, y1 = tiler.CalculateSubimageRect(tiler.CalculateImageIndexFromCell(col0, row0))
+    lx0, ly0, lx1, ly1 = tiler.CalculateSubimageRect(tiler.CalculateImageIndexFromCell(col0 + cols - 1, row0 + rows - 1))
+    width, height = Image.open(tiler.layerFiles[0]).size
+    tiler.tileOffX += x0
+    tiler.tileOffY += y0
+    tiler.tileInsetX = width - (settings["tileOffX"] + lx1)
+    tiler.tileInsetY = height - (settings["tileOffY"] + ly1)
+    for name, method in [("CheckImageSizes", tiler.CheckImageSizes),
+                         ("CreateTileset", tiler.CreateTileset)]:
+        if not tiler.RunStage(name, method):
+            print "Shard %s failed in %s." % (shardFile, name)
+            return False
+    tiles = {}
+    fingerprints = {}
+    for tileIdx in tiler.imageDict:
+        tile = tiler.imageDict[tileIdx]
+        tiles[tileIdx] = (tile.mode, tile.size, tile.tobytes())
+        fingerprints[tileIdx] = tiler.CreateCanonicalFingerprint(tile)
+    shard = {
+        "signature":signature,
+        "region":region,
+        "tiles":tiles,
+        "fingerprints":fingerprints,
+        "layerDict":tiler.layerDict,
+        "tilesCreated":tiler.tilesCreated,
+        "tilesPossible":tiler.tilesPossible,
+        "counters":tiler.stats.counters,
+    }
+    with open(shardFile, "wb") as outFile:
+        cPickle.dump(shard, outFile, cPickle.HIGHEST_PROTOCOL)
+    print "Shard %s has %d unique tiles in %d cells." % (shardFile, tiler.tilesCreated, tiler.tilesPossible)
+    return True
+
+
+class MapShard(object):
+    def __init__(self):
+        pass
+
+    # Parse "COL,ROW,COLS,ROWS".  Returns None if it is not valid.
+    def ParseRegion(self, text):
+        try:
+            region = tuple([int(value) for value in text.split(",")])
+        except ValueError:
+            return None
+        if len(region) != 4:
+            return None
+        return region
+
+    # Split a map of layerWidth x layerHeight cells into shardCols x
+    # shardRows regions that are as close to the same size as possible.
+    def SplitRegions(self, layerWidth, layerHeight, shardCols, shardRows):
+        regions = []
+        for shardRow in xrange(shardRows):
+            row0 = shardRow * layerHeight / shardRows
+            row1 = (shardRow + 1) * layerHeight / shardRows
+            for shardCol in xrange(shardCols):
+                col0 = shardCol * layerWidth / shardCols
+                col1 = (shardCol + 1) * layerWidth / shardCols
+                if col1 > col0 and row1 > row0:
+                    regions.append((col0, row0, col1 - col0, row1 - row0))
+        return regions
+
+    def TileShards(self, jobs, processes):
+        if processes == 1:
+            results = map(TileShard, jobs)
+        else:
+            pool = multiprocessing.Pool(processes or None)
+            results = pool.map(TileShard, jobs)
+            pool.close()
+            pool.join()
+        for job, result in zip(jobs, results):
+            if not result:
+                print "Unable to tile shard %s." % job[2]
+                return False
+        return True
+
+    # Load the shard files, sorted by region so that the merge does not
+    # depend on the order they were given in.
+    def LoadShards(self):
+        self.shards = []
+        for shardFile in self.shardFiles:
+            if not os.path.exists(shardFile):
+                print "Shard %s does not exist." % shardFile
+                return False
+            with open(shardFile, "rb") as inFile:
+                shard = cPickle.load(inFile)
+            shard["file"] = shardFile
+            self.shards.append(shard)
+        self.shards.sort(key=lambda shard: (shard["region"][1], shard["region"][0]))
+        return True
+
+    # Every shard must come from the same layers and tile settings, and
+    # together they must cover every cell of the map exactly once.
+    def CheckShards(self):
+        signature = self.shards[0]["signature"]
+        for shard in self.shards[1:]:
+            if shard["signature"] != signature:
+                print "Shard %s was made with different layers or tile settings than %s." % (
+                    shard["file"], self.shards[0]["file"])
+                return False
+        layerWidth, layerHeight = signature["layerSize"]
+        owner = {}
+        for shard in self.shards:
+            col0, row0, cols, rows = shard["region"]
+            for row in xrange(row0, row0 + rows):
+                for col in xrange(col0, col0 + cols):
+                    if (col, row) in owner:
+                        print "Shards %s and %s both have cell (%d,%d)." % (
+                            owner[(col, row)], shard["file"], col, row)
+                        return False
+                    owner[(col, row)] = shard["file"]
+        missing = layerWidth * layerHeight - len(owner)
+        if missing > 0:
+            print "%d cells of the map (%d x %d) are not in any shard." % (missing, layerWidth, layerHeight)
+            return False
+        return True
+
+    # Combine the unique tiles of the shards into one tileset.  Tiles
+    # are looked up by the canonical fingerprints saved in the shards
+    # and then compared exactly.  Each cell is moved to its place in the
+    # whole map and uses the merged tile, with the transformation of the
+    # cell combined with the one that turns the merged tile into the
+    # shard's tile.
+    def MergeShards(self):
+        tiler = self.tiler
+        signature = self.shards[0]["signature"]
+        tiler.layerNames = list(signature["layerNames"])
+        tiler.layerWidth, tiler.layerHeight = signature["layerSize"]
+        tiler.layerTiles = tiler.layerWidth * tiler.layerHeight
+        tiler.layerDict = { lname:{} for lname in tiler.layerNames }
+        tiler.imageDict = {}
+        tiler.tileProperties = {}
+        fingerprints = {}
+        for shard in self.shards:
+            tiles = {}
+            for tileIdx in shard["tiles"]:
+                mode, size, data = shard["tiles"][tileIdx]
+                tiles[tileIdx] = Image.frombytes(mode, size, data)
+            remap = tiler.MergeTiles(tiles, fingerprints, shard["fingerprints"])
+            col0, row0, cols, rows = shard["region"]
+            for lname in tiler.layerNames:
+                shardLayer = shard["layerDict"][lname]
+                layerDict = tiler.layerDict[lname]
+                for idx in shardLayer:
+                    tileIdx, xForm = shardLayer[idx]
+                    cellIdx = tiler.CalculateImageIndexFromCell(col0 + idx % cols, row0 + idx / cols)
+                    layerDict[cellIdx] = tiler.RemapMergedCell(remap, tileIdx, xForm)
+            for name in shard["counters"]:
+                tiler.stats.AddCounter(name, shard["counters"][name])
+        tiler.tilesCreated = len(tiler.imageDict)
+        tiler.tilesPossible = sum([shard["tilesPossible"] for shard in self.shards])
+        tiler.stats.SetCounter("Shard Unique Tiles", sum([shard["tilesCreated"] for shard in self.shards]))
+        tiler.stats.SetCounter("Unique Tiles", tiler.tilesCreated)
+        print "The %d shards have %d unique tiles on their own and %d merged." % (
+            len(self.shards), sum([shard["tilesCreated"] for shard in self.shards]), tiler.tilesCreated)
+        return True
+
+    def RunStage(self, name, method):
+        return self.tiler.RunStage(name, method)
+
+    # Create the MapTiler that writes the merged outputs.
+    def CreateMergeTiler(self, settings, verbose):
+        signature = self.shards[0]["signature"]
+        config = MapTilerConfig(tileWidth=signature["tileSize"][0],
+                                tileHeight=signature["tileSize"][1],
+                                outTilesetFile=settings["outTileset"],
+                                outTiledFile=settings["outTiled"],
+                                floorLayer=settings["floorLayer"],
+                                wallLayer=settings["wallLayer"],
+                                portalLayer=settings["portalLayer"],
+                                doorLayer=settings["doorLayer"],
+                                outNavPrefix=settings["outNavPrefix"],
+                                maxAtlasSize=settings["maxAtlasSize"],
+                                atlasPacking=settings["atlasPacking"],
+                                tileOrder=settings["tileOrder"],
+                                mergeExisting=settings["mergeExisting"],
+                                overwriteExisting=settings["overwriteExisting"],
+                                verbose=verbose)
+        self.tiler = MapTiler()
+        self.tiler.Configure(config)
+        self.tiler.stats.toolName = "MapShard"
+
+    def ProcessTile(self, shardFile, regionText, settings, verbose=False):
+        region = self.ParseRegion(regionText)
+        if region is None:
+            print "The region must be COL,ROW,COLS,ROWS, not %s." % regionText
+            print "Unable to continue."
+            return False
+        if not TileShard((settings, region, shardFile, verbose)):
+            print "Unable to continue."
+            return False
+        return True
+
+    def ProcessMerge(self, shardFiles, settings, verbose=False):
+        self.shardFiles = shardFiles
+        self.startTime = datetime.datetime.now()
+        if settings["atlasPacking"] not in MapTiler.PACKING_LIST:
+            print "Unknown atlas packing %s.  Must be one of %s." % (
+                settings["atlasPacking"], ", ".join(MapTiler.PACKING_LIST))
+            print "Unable to continue."
+            return False
+        if settings["tileOrder"] not in MapTiler.ORDER_LIST:
+            print "Unknown tile order %s.  Must be one of %s." % (
+                settings["tileOrder"], ", ".join(MapTiler.ORDER_LIST))
+            print "Unable to continue."
+            return False
+        if not self.LoadShards():
+            print "Unable to continue."
+            return False
+        if not self.CheckShards():
+            print "Unable to continue."
+            return False
+        self.CreateMergeTiler(settings, verbose)
+        tiler = self.tiler
+        tiler.stats.SetCounter("Shards", len(self.shards))
+        if not tiler.CheckExistingFiles():
+            print "Unable to continue."
+            return False
+        if not self.RunStage("MergeShards", self.MergeShards):
+            print "Unable to continue."
+            return False
+        if not tiler.CheckNavArguments():
+            print "Unable to continue."
+            return False
+        for name, method in [("CheckMergingFiles", tiler.CheckMergingFiles),
+                             ("CreateNavData", tiler.CreateNavData),
+                             ("ExportTileset", tiler.ExportTileset),
+                             ("ExportTiledFile", tiler.ExportTiledFile)]:
+            if not self.RunStage(name, method):
+                print "Unable to continue."
+                return False
+
+        # Report execution time.
+        self.stopTime = datetime.datetime.now()
+        totalSeconds = (self.stopTime - self.startTime).total_seconds()
+        h, m, s = tiler.SecondsToHMS(totalSeconds)
+        print "Started: ", self.startTime
+        print "Stopped: ", self.stopTime
+        print "Total Run Time: [%d Hrs: %d Min: %d Sec]" % (h, m, s)
+        tiler.stats.PrintTable()
+        if settings["statsFile"]:
+            tiler.stats.ExportJSON(settings["statsFile"])
+        return True
+
+    # Split the map into shards, tile them with local processes and
+    # merge them.
+    def ProcessLocal(self, shardsText, processes, shardDir, settings, verbose=False):
+        try:
+            shardCols, shardRows = [int(value) for value in shardsText.lower().split("x")]
+        except ValueError:
+            print "The shards must be SHARDCOLSxSHARDROWS, not %s." % shardsText
+            print "Unable to continue."
+            return False
+        if shardCols <= 0 or shardRows <= 0:
+            print "There must be at least one shard column and row, not %s." % shardsText
+            print "Unable to continue."
+            return False
+        # Find the size of the map in cells.
+        tiler = MapTiler()
+        tiler.Configure(MapTilerConfig(tileWidth=settings["tileWidth"],
+                                       tileHeight=settings["tileHeight"],
+                                       tileOffX=settings["tileOffX"],
+                                       tileOffY=settings["tileOffY"],
+                                       tileInsetX=settings["tileInsetX"],
+                                       tileInsetY=settings["tileInsetY"]))
+        if not tiler.CreateLayerFiles(settings["filePattern"], list(settings["fileList"])):
+            print "Unable to continue."
+            return False
+        if not tiler.CheckImageSizes():
+            print "Unable to continue."
+            return False
+        regions = self.SplitRegions(tiler.layerWidth, tiler.layerHeight, shardCols, shardRows)
+        jobs = []
+        for col0, row0, cols, rows in regions:
+            shardFile = os.path.join(shardDir, "shard_%d_%d.pkl" % (col0, row0))
+            jobs.append((settings, (col0, row0, cols, rows), shardFile, verbose))
+        print "Tiling %d shards of the %d x %d cell map." % (len(jobs), tiler.layerWidth, tiler.layerHeight)
+        if not self.TileShards(jobs, processes):
+            print "Unable to continue."
+            return False
+        return self.ProcessMerge([job[2] for job in jobs], settings, verbose)
+
+
+if __name__ == "__main__":
+    arguments = docopt.docopt(__doc__)
+    print "-----------------------------------"
+    print "Inputs:"
+    args = arguments.keys()
+    args.sort()
+    for arg in args:
+        print "%-25s %s" % (arg, arguments[arg])
+    print "-----------------------------------"
+    settings = {
+        "tileWidth":int(arguments['--tileWidth']),
+        "tileHeight":int(arguments['--tileHeight']),
+        "tileOffX":int(arguments['--tileOffX']),
+        "tileOffY":int(arguments['--tileOffY']),
+        "tileInsetX":int(arguments['--tileInsetX']),
+        "tileInsetY":int(arguments['--tileInsetY']),
+        "filePattern":arguments['--filePattern'],
+        "fileList":arguments['<layerImage>'],
+        "floorLayer":arguments['--floorLayer'],
+        "wallLayer":arguments['--wallLayer'],
+        "portalLayer":arguments['--portalLayer'],
+        "doorLayer":arguments['--doorLayer'],
+        "maxAtlasSize":int(arguments['--maxAtlasSize']),
+        "atlasPacking":arguments['--atlasPacking'],
+        "tileOrder":arguments['--tileOrder'],
+        "overwriteExisting":arguments['--overwriteExisting'],
+        "mergeExisting":arguments['--mergeExisting'],
+        "outTileset":arguments['--outTileset'],
+        "outTiled":arguments['--outTiled'],
+        "outNavPrefix":arguments['--outNavPrefix'],
+        "statsFile":arguments['--statsFile'],
+    }
+    verbose = arguments['--verbose']
+
+    sharder = MapShard()
+    if arguments['tile']:
+        sharder.ProcessTile(arguments['<shardFile>'][0], arguments['--region'], settings, verbose)
+    elif arguments['merge']:
+        sharder.ProcessMerge(arguments['<shardFile>'], settings, verbose)
+    else:
+        sharder.ProcessLocal(arguments['--shards'], int(arguments['--processes']), arguments['--shardDir'],
+                             settings, verbose)
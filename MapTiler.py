@@ -41,13 +41,40 @@ Usage: MapTiler.py  [--tileWidth=WIDTH]
                     [--wallLayer=WALLLAYER]
                     [--portalLayer=PORTALLAYER]
                     [--doorLayer=DOORLAYER]
+                    [--incrementalRooms]
                     [--forceSquareTileset]
+                    [--maxAtlasSize=MAXSIZE]
+                    [--atlasPacking=PACKING]
+                    [--reportPacking]
+                    [--tileOrder=ORDER]
+                    [--pngCompressLevel=LEVEL]
+                    [--pngStrategy=STRATEGY]
+                    [--optimizeTileset]
+                    [--mipLevels=LEVELS]
+                    [--statsFile=STATSFILE]
                     [--overwriteExisting]
                     [--mergeExisting]
                     [--outTileset=OUTTILESET]
                     [--outTiled=OUTTILED]
                     [--outNavPrefix=OUTNAVPRE]
                     [--verbose]
+                    [--debug]
+                    [--progressRate=RATE]
+                    [--checkpoint=CKPTFILE]
+                    [--checkpointInterval=SECONDS]
+                    [--resume]
+                    [--estimate]
+                    [--sampleFraction=FRACTION]
+                    [--sparseThreshold=DENSITY]
+                    [--infiniteMap]
+                    [--chunkSize=CELLS]
+                    [--searchTiles]
+                    [--searchSizes=SIZES]
+                    [--searchOffsetStep=PIXELS]
+                    [--maxChannelDelta=DELTA]
+                    [--maxDiffPixels=PIXELS]
+                    [--metaTileFile=METAFILE]
+                    [--metaTileSize=SIZE]
                     [<layerImage>...]
 
 Arguments:
@@ -81,8 +108,60 @@ Options:
     --outTiled=OUTTILED         The output Tiled file in .tmx format.
                                 [Default: tiled.tmx]
     --forceSquareTileset        If present, the tileset image will be
-                                a square image.  The output tileset image
-                                is always a power of 2 in size.
+                                a square image.  With the pow2 packing,
+                                the output tileset image is always a
+                                power of 2 in size.
+    --maxAtlasSize=MAXSIZE      The maximum width/height in pixels of a
+                                tileset image.  If the tiles do not fit,
+                                they are split across several pages
+                                (tileset.png, tileset_1.png, ...), each
+                                with its own <tileset> in the Tiled file.
+                                A value of 0 means no limit.
+                                [Default: 0]
+    --atlasPacking=PACKING      How the tiles are laid out in the tileset
+                                image(s).  One of:
+                                  pow2   - Power of two width/height in
+                                           tiles (see --forceSquareTileset).
+                                  tight  - Smallest near-square grid.
+                                  aspect - The grid with the fewest empty
+                                           cells, closest to square and
+                                           at most 2:1.
+                                [Default: pow2]
+    --reportPacking             Report the wasted area and file size of
+                                every packing policy before exporting.
+    --tileOrder=ORDER           The order of the tiles in the tileset
+                                image(s).  One of:
+                                  discovery - The order the tiles were
+                                              found in the layers.
+                                  frequency - Most used tiles first.
+                                  locality  - Tiles that are used next
+                                              to each other are placed
+                                              next to each other.
+                                [Default: discovery]
+    --pngCompressLevel=LEVEL    The zlib compression level (0-9) used for
+                                the tileset image(s).
+                                [Default: 6]
+    --pngStrategy=STRATEGY      The zlib strategy used for the tileset
+                                image(s).  One of default, filtered,
+                                huffman, rle or fixed.
+                                [Default: default]
+    --optimizeTileset           Try every strategy at the highest level
+                                and keep the smallest tileset image.
+                                Reports the bytes saved.  Tileset images
+                                that use 256 colors or fewer (including
+                                alpha) are always saved as indexed
+                                (palette) images.  This is lossless.
+    --mipLevels=LEVELS          The number of downscaled (1/2, 1/4, ...)
+                                copies of the tileset to create for
+                                zoomed out rendering.  Each tile is scaled
+                                on its own and placed in the same spot as
+                                in the full size tileset, so the same gids
+                                work at every level.  The files are named
+                                after the page, e.g. tileset_mip1.png.
+                                [Default: 0]
+    --statsFile=STATSFILE       Save the timing, memory and counters for
+                                each stage of the run to this file as
+                                JSON.  They are always printed at the end.
     --floorLayer=FLOORLAYER     Define the name for the floor layer to be
                                 used in nav map generation.  See below.
     --wallLayer=WALLLAYER       Define the name for the wall layer to be
@@ -96,7 +175,106 @@ Options:
                                 option specifies the prefix for the navigation data,
                                 including layers and properties.
                                 [Default: NAV_]
+    --incrementalRooms          Start from the rooms in the existing Tiled
+                                file instead of flooding every room again.
+                                Only the rooms whose floors, walls, doors or
+                                portals changed are flooded again, and each
+                                new room takes the id (and tile) of the old
+                                room it overlaps most.  Untouched rooms keep
+                                their ids and, if the other tiles did not
+                                change, their tile gids.  Use it with
+                                --mergeExisting.
     --verbose                   If present, give output while working.
+                                Progress is reported for each layer with
+                                the tiles per second, efficiency, unique
+                                tiles and estimated time left.
+    --debug                     If present, also print a line for every
+                                tile processed.  This is slow on large
+                                maps.  Implies --verbose.
+    --progressRate=RATE         The maximum number of progress lines per
+                                second.
+                                [Default: 2]
+    --checkpoint=CKPTFILE       Periodically save the progress of creating
+                                the tileset to this file, so a long run
+                                that is killed can be resumed.  The file
+                                is removed when the run completes.
+    --checkpointInterval=SECONDS
+                                The minimum number of seconds between
+                                checkpoints.  Checkpoints are only saved
+                                at the end of a row of tiles.
+                                [Default: 60]
+    --resume                    Continue from the row after the last one
+                                saved in the --checkpoint file.  The layer
+                                images and tile settings must be the same
+                                as the run that saved it.  If the outputs
+                                were already written, --overwriteExisting
+                                or --mergeExisting is needed as usual.
+    --estimate                  Do not create anything.  Instead, tile a
+                                sample of the rows in each layer and
+                                estimate the number of unique tiles (with
+                                a 95% interval), the tileset size, the
+                                memory needed and how long creating the
+                                tileset would take.  The estimate tends
+                                to be low when most tiles are used only
+                                once or twice, so plan with the upper
+                                end of the interval.
+    --sampleFraction=FRACTION   The fraction of the rows in each layer
+                                that --estimate tiles.
+                                [Default: 0.1]
+    --sparseThreshold=DENSITY   Layers with fewer than this fraction of
+                                their cells used (e.g. 0.05) are written
+                                to the Tiled file as an object group with
+                                a tile object for each used cell, instead
+                                of a tile layer with every cell in it.
+                                0 writes every layer as a tile layer.
+                                [Default: 0]
+    --infiniteMap               Write the Tiled file as an infinite map.
+                                Each layer is split into chunks and only
+                                the chunks with tiles in them are written,
+                                so mostly empty maps stay small.
+    --chunkSize=CELLS           The width and height (in cells) of the
+                                chunks of an infinite map.
+                                [Default: 16]
+    --searchTiles               Do not create anything.  Instead, decode
+                                the layers once and count the unique
+                                tiles for each of the --searchSizes (and
+                                offsets), then print them ranked by the
+                                size of the tileset (with --atlasPacking
+                                and --maxAtlasSize) and unique tiles,
+                                with the options for the best one.
+    --searchSizes=SIZES         The tile sizes tried by --searchTiles, as
+                                a list of N (square) or WxH.
+                                [Default: 16,24,32,48,64]
+    --searchOffsetStep=PIXELS   Also try the offsets from 0 up to the tile
+                                size in steps of this many pixels, in x
+                                and y.  0 only tries --tileOffX/Y.
+                                [Default: 0]
+    --maxChannelDelta=DELTA     Merge tiles that are nearly the same, e.g.
+                                from anti-aliased art.  A tile can stand
+                                in for another if only a few pixels
+                                (see --maxDiffPixels) have a channel that
+                                differs by more than this.
+                                Near duplicates are found through an
+                                index of their block averages, so one may
+                                be missed, but never merged wrongly.  If
+                                both are 0, only exact duplicates are
+                                merged.
+                                [Default: 0]
+    --maxDiffPixels=PIXELS      The number of pixels that may differ by
+                                more than --maxChannelDelta in tiles that
+                                are merged.
+                                [Default: 0]
+    --metaTileFile=METAFILE     Also find the blocks of cells (meta tiles)
+                                that repeat in the layers and save them to
+                                this JSON file: a dictionary of the meta
+                                tiles (the gid of each of their cells) and
+                                each layer as a list of meta tiles.  Maps
+                                that repeat whole rooms or furniture need
+                                far fewer values stored this way.
+    --metaTileSize=SIZE         The width and height (in cells) of the
+                                meta tiles, or "auto" to try 2 and 4 and
+                                keep the one that stores the fewest values.
+                                [Default: auto]
     --overwriteExisting         Overwrite output files with new files.
 
     --mergeExisting             Overwrite the tileset file and attempt
@@ -128,8 +306,8 @@ it does not touch ANY DATA.  If it cannot find the layer in the
 existing file, it is added.
 
 If you have other tilesets in the
-existing file with a gid = "1", this operation will generate
-bad results.
+existing file, this operation will fail.  The tileset pages
+(see --maxAtlasSize) are updated to match the new tileset.
 
 (2) If you created a room map (floorLayer, wallLayer, doorLayer, portalLayer),
 then the existing tileset will be scanned and all properties for the outNavPrefix +
@@ -158,8 +336,17 @@ import ImageFont
 from lxml import etree
 import docopt
 import math
+import bisect
+import io
+import re
 import datetime
 import random
+import time
+import cPickle
+import hashlib
+import json
+from PerfStats import PerfStats
+from ProgressReporter import ProgressReporter
 
 
 class MapTiler(object):
@@ -207,6 +394,48 @@ class MapTiler(object):
 
     PROPERTY_ROOM = "ROOM"
 
+    # Ways to lay out the tiles in the tileset image.
+    PACKING_POW2 = "pow2"
+    PACKING_TIGHT = "tight"
+    PACKING_ASPECT = "aspect"
+    PACKING_LIST = [PACKING_POW2, PACKING_TIGHT, PACKING_ASPECT]
+    # The widest (or tallest) tileset image "aspect" packing will make.
+    MAX_ATLAS_ASPECT = 2.0
+
+    # Orders for the tiles in the tileset image.
+    ORDER_DISCOVERY = "discovery"
+    ORDER_FREQUENCY = "frequency"
+    ORDER_LOCALITY = "locality"
+    ORDER_LIST = [ORDER_DISCOVERY, ORDER_FREQUENCY, ORDER_LOCALITY]
+
+    # How FindOrAddTile(...) placed an image: on the last tile matched,
+    # on another tile, or as a new tile.
+    MATCH_LAST = "last"
+    MATCH_FOUND = "found"
+    MATCH_NEW = "new"
+
+    # zlib strategies used when compressing the tileset image.
+    PNG_STRATEGY_LIST = ["default", "filtered", "huffman", "rle", "fixed"]
+    PNG_STRATEGY_DICT = {
+        # Z_DEFAULT_STRATEGY, Z_FILTERED, Z_HUFFMAN_ONLY, Z_RLE, Z_FIXED
+        "default":0,
+        "filtered":1,
+        "huffman":2,
+        "rle":3,
+        "fixed":4,
+    }
+
+    # The near duplicate index splits a tile into (at most) this many
+    # blocks across and down.
+    NEAR_INDEX_GRID = 4
+    # The pixels checked before comparing a whole tile are spread over
+    # a grid this many across and down.
+    NEAR_SAMPLE_GRID = 8
+
+    # Block sizes (in cells) tried for meta tiles.
+    META_TILE_AUTO = "auto"
+    META_TILE_SIZES = [2, 4]
+
     DRAW_FONT = "Transformers Movie.ttf"
 
     def __init__(self):
@@ -214,6 +443,15 @@ class MapTiler(object):
 
     def Reset(self):
         self.tileProperties = {}
+        self.transformComposition = None
+        self.nearIndex = None
+        self.nearMerged = set()
+        # The rooms read from the existing Tiled file for
+        # --incrementalRooms, and the old tile images of the rooms that
+        # keep their ids.
+        self.previousRooms = None
+        self.roomImages = {}
+        self.stats = PerfStats("MapTiler")
 
     # Updates the gid for a tile based on the rotation
     # and flipX flag passed in from the PyxelEdit element.
@@ -255,7 +493,7 @@ class MapTiler(object):
                 print "File %s does not exist."%file
                 print "Unable to coninue."
                 return False
-            if file != self.outTilesetFile:
+            if not self.IsTilesetPageFile(file):
                 self.layerFiles.append(file)
                 self.layerNames.append(os.path.splitext(os.path.split(file)[1])[0])
         return True
@@ -395,17 +633,238 @@ class MapTiler(object):
         for idx in xrange(len(rooms)):
             self.roomDict[idx] = rooms[idx]
 
+    # The cells next to a cell that a room can spread to, in the order
+    # CreateRoomData(...) tries them.
+    def GetRoomNeighbors(self, idx):
+        x, y = self.CalculateImageRowCell(idx)
+        return [self.CalculateImageIndexFromCell(x, y + 1),
+                self.CalculateImageIndexFromCell(x, y - 1),
+                self.CalculateImageIndexFromCell(x + 1, y),
+                self.CalculateImageIndexFromCell(x - 1, y)]
+
+    # Flood one room from a cell the same way CreateRoomData(...) does,
+    # with sets for the walkable and portal cells.
+    def FloodRoom(self, first, walkable, portals):
+        roomTiles = []
+        queue = [first]
+        seen = set(queue)
+        while len(queue) > 0:
+            idx = queue.pop(0)
+            roomTiles.append(idx)
+            for adj in self.GetRoomNeighbors(idx):
+                if adj in seen or adj not in walkable:
+                    continue
+                if idx in portals and adj in portals:
+                    # Don't expand beyond doors.
+                    continue
+                seen.add(adj)
+                queue.append(adj)
+        return roomTiles
+
+    # Read the nav layers and the rooms from the existing Tiled file.
+    # Returns None, and every room is flooded again, if they cannot be
+    # used.
+    def LoadPreviousRooms(self):
+        if not os.path.exists(self.outTiledFile):
+            print "There is no existing Tiled file %s, flooding all the rooms." % self.outTiledFile
+            return None
+        # Only needed with --incrementalRooms.
+        from MapDataExtractor import MapDataExtractor
+        extractor = MapDataExtractor()
+        if not extractor.LoadTiledMap(self.outTiledFile):
+            print "Flooding all the rooms."
+            return None
+        if (extractor.layerWidth, extractor.layerHeight, extractor.tileWidth, extractor.tileHeight) != \
+                (self.layerWidth, self.layerHeight, self.tileWidth, self.tileHeight):
+            print "The existing Tiled file %s has a different size, flooding all the rooms." % self.outTiledFile
+            return None
+        roomsName = self.outNavPrefix + "Rooms"
+        missing = [lname for lname in [self.navFloorLayer, self.navWallLayer, self.navPortalLayer,
+                                       self.navDoorLayer, roomsName] if lname not in extractor.layerMap]
+        if missing:
+            print "The existing Tiled file %s has no layer %s, flooding all the rooms." % (
+                self.outTiledFile, ", ".join(missing))
+            return None
+        propertyName = self.outNavPrefix + MapTiler.PROPERTY_ROOM
+        tileRooms = {}
+        for tileIdx in extractor.tileMap:
+            if propertyName in extractor.tileMap[tileIdx]:
+                tileRooms[tileIdx] = int(extractor.tileMap[tileIdx][propertyName])
+        rooms = {}
+        roomTiles = {}
+        for idx, tileIdx in extractor.layerMap[roomsName].iteritems():
+            if tileIdx in tileRooms:
+                rooms[idx] = tileRooms[tileIdx]
+                roomTiles[tileRooms[tileIdx]] = tileIdx
+        occupied = lambda lname: set([idx for idx, tileIdx in extractor.layerMap[lname].iteritems() if tileIdx > 0])
+        walls = occupied(self.navWallLayer)
+        # The tileset pages, so the old room tiles can be used again.
+        # Each page holding a room tile is loaded once.
+        pages = []
+        tiledDir = os.path.dirname(self.outTiledFile)
+        for event, tileset in etree.iterparse(self.outTiledFile, tag="tileset"):
+            image = tileset.find("image")
+            if image is not None:
+                pages.append((int(tileset.attrib["firstgid"]), os.path.join(tiledDir, image.attrib["source"]),
+                              int(tileset.attrib.get("margin", "0")), int(tileset.attrib.get("spacing", "0"))))
+            tileset.clear()
+        pages.sort(reverse=True)
+        roomGIDs = [tileIdx + 1 for tileIdx in roomTiles.itervalues()]
+        for pageIdx in xrange(len(pages)):
+            firstGID, fileName, margin, spacing = pages[pageIdx]
+            lastGID = pages[pageIdx - 1][0] if pageIdx > 0 else None
+            page = None
+            used = [gid for gid in roomGIDs if gid >= firstGID and (lastGID is None or gid < lastGID)]
+            if len(used) > 0 and os.path.exists(fileName):
+                page = Image.open(fileName)
+                if page.mode != "RGBA":
+                    page = page.convert("RGBA")
+            pages[pageIdx] = (firstGID, page, margin, spacing)
+        return {
+            "walkable":occupied(self.navFloorLayer) - walls,
+            "portals":(occupied(self.navPortalLayer) | occupied(self.navDoorLayer)) - walls,
+            "rooms":rooms,
+            "roomTiles":roomTiles,
+            "pages":pages,
+        }
+
+    # The old tile of a room, from the tileset page it was on, or None if
+    # it cannot be read.
+    def LoadPreviousRoomTile(self, tileIdx):
+        gid = tileIdx + 1
+        for firstGID, page, margin, spacing in self.previousRooms["pages"]:
+            if gid < firstGID:
+                continue
+            if page is None:
+                return None
+            columns = (page.size[0] - 2 * margin + spacing) / (self.tileWidth + spacing)
+            if columns <= 0:
+                return None
+            tileID = gid - firstGID
+            x = margin + (tileID % columns) * (self.tileWidth + spacing)
+            y = margin + (tileID / columns) * (self.tileHeight + spacing)
+            if y + self.tileHeight > page.size[1]:
+                return None
+            return page.crop((x, y, x + self.tileWidth, y + self.tileHeight))
+        return None
+
+    # Update the rooms read from the existing Tiled file.  Only the rooms
+    # touching a cell whose walkable or portal state changed are flooded
+    # again.  The rest are still whole rooms, so they are kept as they
+    # are.
+    def UpdateRoomData(self):
+        previous = self.previousRooms
+        floorTiles = set(self.GetOccupiedTiles(self.navFloorLayer))
+        wallTiles = set(self.GetOccupiedTiles(self.navWallLayer))
+        portalTiles = set(self.GetOccupiedTiles(self.navPortalLayer)) | set(self.GetOccupiedTiles(self.navDoorLayer))
+        walkable = floorTiles - wallTiles
+        portals = portalTiles - wallTiles
+        oldRooms = previous["rooms"]
+        # Cells that changed, and cells the old rooms do not agree with
+        # (e.g. the rooms layer was edited).
+        changed = (walkable ^ previous["walkable"]) | (portals ^ previous["portals"]) | \
+                  (previous["walkable"] ^ set(oldRooms.keys()))
+        seeds = set(changed)
+        for idx in changed:
+            seeds.update(self.GetRoomNeighbors(idx))
+        roomCells = {}
+        for idx, room in oldRooms.iteritems():
+            roomCells.setdefault(room, []).append(idx)
+        dirtyRooms = set([oldRooms[idx] for idx in seeds if idx in oldRooms])
+        flood = set([idx for idx in seeds if idx in walkable])
+        for room in dirtyRooms:
+            flood.update([idx for idx in roomCells[room] if idx in walkable])
+        components = []
+        while len(flood) > 0:
+            roomTiles = self.FloodRoom(min(flood), walkable, portals)
+            # A room that was not whole (e.g. edited by hand) is
+            # flooded again too.
+            for idx in roomTiles:
+                room = oldRooms.get(idx)
+                if room is not None and room not in dirtyRooms:
+                    dirtyRooms.add(room)
+                    flood.update([cell for cell in roomCells[room] if cell in walkable])
+            flood.difference_update(roomTiles)
+            components.append(roomTiles)
+        # Each new room takes the id of the old room it overlaps most,
+        # largest overlaps first.
+        pairs = []
+        for compIdx in xrange(len(components)):
+            overlap = {}
+            for idx in components[compIdx]:
+                room = oldRooms.get(idx)
+                if room in dirtyRooms:
+                    overlap[room] = overlap.get(room, 0) + 1
+            pairs += [(-count, room, compIdx) for room, count in overlap.iteritems()]
+        pairs.sort()
+        assigned = {}
+        matched = set()
+        for count, room, compIdx in pairs:
+            if compIdx in assigned or room in matched:
+                continue
+            assigned[compIdx] = room
+            matched.add(room)
+        # The rest reuse the ids of the old rooms that went away, then
+        # take new ones.
+        self.roomDict = { room:roomCells[room] for room in roomCells if room not in dirtyRooms }
+        freeRooms = sorted(dirtyRooms - matched)
+        nextRoom = max(roomCells.keys() + [-1]) + 1
+        for compIdx in xrange(len(components)):
+            if compIdx not in assigned:
+                if freeRooms:
+                    assigned[compIdx] = freeRooms.pop(0)
+                else:
+                    assigned[compIdx] = nextRoom
+                    nextRoom += 1
+            self.roomDict[assigned[compIdx]] = components[compIdx]
+        # The rooms that kept their id keep their tile.
+        previous["keptRooms"] = (set(roomCells.keys()) - dirtyRooms) | matched
+        self.roomImages = {}
+        for room in previous["keptRooms"]:
+            tile = self.LoadPreviousRoomTile(previous["roomTiles"][room])
+            if tile is not None:
+                self.roomImages[room] = tile
+        kept = len(roomCells) - len(dirtyRooms)
+        print "Rooms: %d cells changed, %d of %d rooms flooded again into %d rooms, %d rooms untouched." % (
+            len(changed), len(dirtyRooms), len(roomCells), len(components), kept)
+        self.stats.SetCounter("Rooms Flooded", len(components))
+        self.stats.SetCounter("Rooms Untouched", kept)
+
+    # After the tiles are placed, report how many of the rooms from the
+    # existing Tiled file kept their id and tile gid.
+    def ReportRoomGIDs(self):
+        if self.previousRooms is None:
+            return True
+        layerDict = self.layerDict[self.outNavPrefix + "Rooms"]
+        oldTiles = self.previousRooms["roomTiles"]
+        keptRooms = self.previousRooms["keptRooms"]
+        keptGIDs = 0
+        for room in keptRooms:
+            tileIdx, xForm = layerDict[self.roomDict[room][0]]
+            if self.CalculateGID(tileIdx, 0) == oldTiles[room] + 1:
+                keptGIDs += 1
+        print "%d of %d rooms kept their ids, %d of them kept their tile gids." % (
+            len(keptRooms), len(oldTiles), keptGIDs)
+        self.stats.SetCounter("Room GIDs Kept", keptGIDs)
+        return True
+
     def CreateRoomsLayer(self):
         roomDict = self.roomDict
         keys = roomDict.keys()
         keys.sort()
         # Create the layer
         layerDict = { idx:(0,0) for idx in xrange(self.layerTiles) }
-        for idx in keys:
-            tile = self.CreateRandomColorTile(opacity=128,text="R%d"%idx)
+        # Room ids can have gaps after --incrementalRooms.  A tile is
+        # still made for a missing id so the rooms after it keep their
+        # gids.
+        for idx in xrange(keys[-1] + 1 if keys else 0):
+            if idx in self.roomImages:
+                tile = self.roomImages[idx]
+            else:
+                tile = self.CreateRandomColorTile(opacity=128,text="R%d"%idx)
             tileIdx = len(self.imageDict)
             self.imageDict[tileIdx] = tile
-            for roomTile in roomDict[idx]:
+            for roomTile in roomDict.get(idx, []):
                 layerDict[roomTile] = (tileIdx,0)
                 self.tileProperties[tileIdx] = [(self.outNavPrefix + MapTiler.PROPERTY_ROOM,"%s"%idx)]
         lname = self.outNavPrefix + "Rooms"
@@ -448,90 +907,506 @@ class MapTiler(object):
         if self.createNavData:
             self.CreateWalkableData()
             self.CreateBlockingData()
-            self.CreateRoomData()
+            self.previousRooms = None
+            self.roomImages = {}
+            if self.incrementalRooms:
+                self.previousRooms = self.LoadPreviousRooms()
+            if self.previousRooms is None:
+                self.CreateRoomData()
+            else:
+                self.UpdateRoomData()
 
             self.CreateWalkableLayer()
             self.CreateBlockingLayer()
             self.CreateRoomsLayer()
         return True
 
+    # Take out the layers made by CreateNavData(...) so it can be run
+    # again.  Their tiles are left for CompactTiles(...) to remove.
+    def RemoveNavData(self):
+        for name in ["Walkable", "Blocked", "Rooms"]:
+            lname = self.outNavPrefix + name
+            if lname in self.layerDict:
+                del self.layerDict[lname]
+                self.layerNames.remove(lname)
+        return True
+
+    # Extra text for the progress lines while creating the tileset.
+    def FormatTilesetProgress(self):
+        return "Eff %5.1f%%, %d unique" % (
+            100 * (1.0 - self.tilesCreated * 1.0 / max(self.tilesPossible, 1)), self.tilesCreated)
+
+    # The inputs that must not change between a checkpoint being
+    # written and the run being resumed from it.
+    def CreateCheckpointSignature(self):
+        files = []
+        for fname in self.layerFiles:
+            stat = os.stat(fname)
+            files.append((fname, stat.st_size, int(stat.st_mtime)))
+        return {
+            "tileSize":(self.tileWidth, self.tileHeight),
+            "offset":(self.tileOffX, self.tileOffY),
+            "inset":(self.tileInsetX, self.tileInsetY),
+            "tolerance":(self.maxChannelDelta, self.maxDiffPixels),
+            "files":files,
+        }
+
+    # Save the state of CreateTileset(...) so that it can be resumed
+    # from the start of the row after the last one completed.  The file
+    # is written to a temporary name first so that a run killed while
+    # saving does not lose the previous checkpoint.
+    def SaveCheckpoint(self, layerIdx, nextRow, lastTileMatchIndex):
+        images = {}
+        for tileIdx in self.imageDict:
+            tile = self.imageDict[tileIdx]
+            images[tileIdx] = (tile.mode, tile.size, tile.tobytes())
+        state = {
+            "signature":self.CreateCheckpointSignature(),
+            "images":images,
+            "layerDict":self.layerDict,
+            "tilesCreated":self.tilesCreated,
+            "tilesPossible":self.tilesPossible,
+            "layerIdx":layerIdx,
+            "nextRow":nextRow,
+            "lastTileMatchIndex":lastTileMatchIndex,
+        }
+        tempFile = self.checkpointFile + ".tmp"
+        with open(tempFile, "wb") as outFile:
+            cPickle.dump(state, outFile, cPickle.HIGHEST_PROTOCOL)
+        if os.path.exists(self.checkpointFile):
+            os.remove(self.checkpointFile)
+        os.rename(tempFile, self.checkpointFile)
+        self.lastCheckpointTime = time.time()
+        self.progress.Message("Saved checkpoint to %s (layer %d, row %d)." % (self.checkpointFile, layerIdx, nextRow))
+
+    # Called at the end of every row.  Only saves if the checkpoint
+    # interval has passed.
+    def UpdateCheckpoint(self, layerIdx, nextRow, lastTileMatchIndex):
+        if not self.checkpointFile:
+            return
+        if time.time() - self.lastCheckpointTime < self.checkpointInterval:
+            return
+        self.SaveCheckpoint(layerIdx, nextRow, lastTileMatchIndex)
+
+    # Restore the state saved by SaveCheckpoint(...).  Returns the
+    # (layerIdx, nextRow, lastTileMatchIndex) to carry on from, or
+    # None if the checkpoint cannot be used.
+    def LoadCheckpoint(self):
+        if not os.path.exists(self.checkpointFile):
+            print "Checkpoint %s does not exist." % self.checkpointFile
+            return None
+        with open(self.checkpointFile, "rb") as inFile:
+            state = cPickle.load(inFile)
+        if state["signature"] != self.CreateCheckpointSignature():
+            print "Checkpoint %s was made with different layers or tile settings." % self.checkpointFile
+            return None
+        self.imageDict = {}
+        for tileIdx in state["images"]:
+            mode, size, data = state["images"][tileIdx]
+            self.imageDict[tileIdx] = Image.frombytes(mode, size, data)
+        self.layerDict = state["layerDict"]
+        self.tilesCreated = state["tilesCreated"]
+        self.tilesPossible = state["tilesPossible"]
+        print "Resuming from checkpoint %s at layer %d, row %d with %d tiles." % (
+            self.checkpointFile, state["layerIdx"], state["nextRow"], len(self.imageDict))
+        return state["layerIdx"], state["nextRow"], state["lastTileMatchIndex"]
+
+    def RemoveCheckpoint(self):
+        if self.checkpointFile and os.path.exists(self.checkpointFile):
+            os.remove(self.checkpointFile)
+            print "Removed checkpoint %s." % self.checkpointFile
+        return True
+
     def CreateTileset(self):
         self.imageDict = {}
         self.layerDict = {}
         self.tilesCreated = 0
         self.tilesPossible = 0
-        # Create an empty tile.
-        # There is almost ALWAYS at least one of these.
-        emptyTile = Image.new('RGBA', (self.tileWidth, self.tileHeight ), (0, 0, 0, 0))
-        self.imageDict[0] = emptyTile
-        self.tilesCreated += 1
-        subimgIdx = 1
-        tilesToProcess = len(self.layerFiles)*self.layerTiles
-        tilesProcessed = 0
+        self.lastCheckpointTime = time.time()
+        self.nearIndex = None
+        self.nearMerged = set()
+        startLayer = 0
+        startRow = 0
         lastTileMatchIndex = 0
-        for fname in self.layerFiles:
-            lname = os.path.split(fname)[1]
-            lname = os.path.splitext(lname)[0]
-            if self.verbose:
-                print "Creating Subimages for layer %s" % lname
+        if self.resume:
+            resumeState = self.LoadCheckpoint()
+            if resumeState is None:
+                return False
+            startLayer, startRow, lastTileMatchIndex = resumeState
+        else:
+            # Create an empty tile.
+            # There is almost ALWAYS at least one of these.
+            emptyTile = Image.new('RGBA', (self.tileWidth, self.tileHeight ), (0, 0, 0, 0))
+            self.imageDict[0] = emptyTile
+            self.tilesCreated += 1
+        self.tilesToProcess = len(self.layerFiles)*self.layerTiles
+        self.progress.BeginJob(self.tilesToProcess - self.tilesPossible)
+        for layerIdx in xrange(startLayer, len(self.layerFiles)):
+            firstIdx = 0
+            if layerIdx == startLayer:
+                firstIdx = startRow * self.layerWidth
+            lastTileMatchIndex = self.TileLayer(layerIdx, firstIdx, lastTileMatchIndex)
+        # Everything is done.  Keep a final checkpoint so that a failure
+        # writing the outputs does not mean starting over.
+        if self.checkpointFile:
+            self.SaveCheckpoint(len(self.layerFiles), 0, lastTileMatchIndex)
+        self.stats.SetCounter("Tiles Scanned", self.tilesPossible)
+        self.stats.SetCounter("Unique Tiles", self.tilesCreated)
+        if self.IsToleranceMode():
+            print "%d cells used a near duplicate tile, merging %d different images." % (
+                self.stats.counters.get("Near Matches", 0), len(self.nearMerged))
+            self.stats.SetCounter("Near Duplicates Merged", len(self.nearMerged))
+        return True
+
+    # Split one layer into tiles, starting at cell firstIdx, and map each
+    # one onto a tile already in imageDict (or add it).  Returns the last
+    # tile matched, which is the first one tried for the next cell.
+    def TileLayer(self, layerIdx, firstIdx=0, lastTileMatchIndex=0):
+        fname = self.layerFiles[layerIdx]
+        lname = os.path.split(fname)[1]
+        lname = os.path.splitext(lname)[0]
+        self.progress.Message("Creating Subimages for layer %s" % lname)
+        self.progress.BeginTask("Layer %s" % lname, self.layerTiles - firstIdx)
+        if firstIdx == 0:
             self.layerDict[lname] = {}
-            img = self.LoadCroppedImage(fname)
-            foundXform = False
-            for idx in xrange(self.layerTiles):
-                subimg = self.ExtractSubimage(img, idx)
-                foundXform = False
-                col, row = self.CalculateImageRowCell(idx)
-                self.tilesPossible += 1
-                tilesProcessed += 1
-                # A slight optimization here.  Tiles are being scanned
-                # horizontally and they often repeat.  The last tile is
-                # a good candidate for a match, so check this one first.
-                # Some "Results"
-                # Processing a small map (JanHouse.png) changed the process time from 8 seconds to 6 seconds.
-                # Processing a large mpa (kmare.png) changed the process time from 14:51 to 8:48.
-                #
-                # This approach appears to have some merit.
-                #
-                xForm = self.FindImageTransformation(subimg, self.imageDict[lastTileMatchIndex])
+        img = self.LoadCroppedImage(fname)
+        tilesToProcess = self.tilesToProcess
+        nearIndex = None
+        if self.IsToleranceMode():
+            if self.nearIndex is None or self.nearIndex["size"] != len(self.imageDict):
+                self.nearIndex = self.CreateNearIndex(self.imageDict)
+            nearIndex = self.nearIndex
+        for idx in xrange(firstIdx, self.layerTiles):
+            subimg = self.ExtractSubimage(img, idx)
+            col, row = self.CalculateImageRowCell(idx)
+            self.tilesPossible += 1
+            tilesProcessed = self.tilesPossible
+            tileIdx, xForm, match = self.FindOrAddTile(subimg, self.imageDict, nearIndex, lastTileMatchIndex)
+            self.layerDict[lname][idx] = (tileIdx, xForm)
+            lastTileMatchIndex = tileIdx
+            if match == MapTiler.MATCH_LAST:
+                self.stats.AddCounter("Cache Hits")
+            if self.progress.IsDebug():
+                if match == MapTiler.MATCH_NEW:
+                    self.progress.Trace("[%5.1f%% Complete] [%5.1f%% Eff] Layer %s, Index %d (%d,%d) is a new image."%(
+                        100.0 * tilesProcessed / tilesToProcess,
+                        100 * (1.0 - self.tilesCreated * 1.0 / self.tilesPossible),
+                        lname,idx,row,col))
+                else:
+                    self.progress.Trace("[%5.1f%% Complete] [%5.1f%% Eff] Layer %s, Index %d (%d,%d) maps onto image %d, xForm %d."%(
+                        100.0*tilesProcessed/tilesToProcess,
+                        100*(1.0-self.tilesCreated*1.0/self.tilesPossible),
+                        lname,idx,row,col,tileIdx,xForm ))
+            if match == MapTiler.MATCH_NEW:
+                self.tilesCreated += 1
+            self.progress.Update(self.FormatTilesetProgress)
+            if col == self.layerWidth - 1:
+                self.UpdateCheckpoint(layerIdx, row + 1, lastTileMatchIndex)
+        self.progress.EndTask(self.FormatTilesetProgress)
+        return lastTileMatchIndex
+
+    # Map an image onto a tile in tiles (and transformation), or add it
+    # as a new tile.  In tolerance mode the tiles are looked up in
+    # nearIndex, which new tiles are added to.  Returns (tileIdx, xForm,
+    # match), where match is one of the MATCH_ values.
+    def FindOrAddTile(self, subimg, tiles, nearIndex, lastTileMatchIndex):
+        # A slight optimization here.  Tiles are being scanned
+        # horizontally and they often repeat.  The last tile is
+        # a good candidate for a match, so check this one first.
+        # Some "Results"
+        # Processing a small map (JanHouse.png) changed the process time from 8 seconds to 6 seconds.
+        # Processing a large mpa (kmare.png) changed the process time from 14:51 to 8:48.
+        #
+        # This approach appears to have some merit.
+        #
+        xForm = self.FindImageTransformation(subimg, tiles[lastTileMatchIndex])
+        if xForm != None:
+            return lastTileMatchIndex, xForm, MapTiler.MATCH_LAST
+        if nearIndex is not None:
+            # Near duplicates (and exact ones) are looked up in the
+            # index instead of comparing with every tile.
+            match = self.FindNearTile(nearIndex, subimg)
+            if match != None:
+                desIdx, xForm = match
+                return desIdx, xForm, MapTiler.MATCH_FOUND
+        else:
+            for desIdx in tiles.keys():
+                # Already checked this one.
+                if desIdx == lastTileMatchIndex:
+                    continue
+                xForm = self.FindImageTransformation(subimg, tiles[desIdx])
                 if xForm != None:
-                    self.layerDict[lname][idx] = (lastTileMatchIndex, xForm)
-                    if self.verbose:
-                        print "[%5.1f%% Complete] [%5.1f%% Eff] Layer %s, Index %d (%d,%d) maps onto image %d, xForm %d." % (
-                            100 * tilesProcessed / tilesToProcess,
-                            100 * (1.0 - self.tilesCreated * 1.0 / self.tilesPossible),
-                            lname, idx, row, col, lastTileMatchIndex, xForm )
+                    # We have an equivalent transformation
+                    return desIdx, xForm, MapTiler.MATCH_FOUND
+        # Keep this one.
+        tileIdx = len(tiles)
+        tiles[tileIdx] = subimg
+        if nearIndex is not None:
+            self.AddNearIndex(nearIndex, tileIdx, subimg)
+        return tileIdx, 0, MapTiler.MATCH_NEW
+
+    # Add the unique tiles of another tiler (a map or a shard) to
+    # imageDict.  A tile that matches one already there, under some
+    # transformation and with the same tile properties, is not added
+    # again.  fingerprints holds the canonical fingerprints of the tiles
+    # in imageDict and is updated.  The fingerprints of the new tiles
+    # are worked out unless they are given.  Returns the remap of each
+    # tile index to (tileIdx, xForm) in imageDict.
+    def MergeTiles(self, tiles, fingerprints, tileFingerprints=None, tileProperties=None):
+        remap = {}
+        for tileIdx in sorted(tiles):
+            tile = tiles[tileIdx]
+            properties = None
+            if tileProperties is not None:
+                properties = tileProperties.get(tileIdx)
+            if tileFingerprints is not None:
+                fingerprint = tileFingerprints[tileIdx]
+            else:
+                fingerprint = self.CreateCanonicalFingerprint(tile)
+            for mergedIdx in fingerprints.get(fingerprint, []):
+                if self.tileProperties.get(mergedIdx) != properties:
                     continue
+                xForm = self.FindImageTransformation(tile, self.imageDict[mergedIdx])
+                if xForm != None:
+                    remap[tileIdx] = (mergedIdx, xForm)
+                    break
+            if tileIdx not in remap:
+                mergedIdx = len(self.imageDict)
+                self.imageDict[mergedIdx] = tile
+                if properties is not None:
+                    self.tileProperties[mergedIdx] = properties
+                fingerprints.setdefault(fingerprint, []).append(mergedIdx)
+                remap[tileIdx] = (mergedIdx, 0)
+        return remap
+
+    # The (tileIdx, xForm) in imageDict of a cell that used tileIdx
+    # (with xForm) before MergeTiles(...).
+    def RemapMergedCell(self, remap, tileIdx, xForm):
+        mergedIdx, mergedXForm = remap[tileIdx]
+        return mergedIdx, self.ComposeTransformations(mergedXForm, xForm)
+
+    # Tile a random sample of whole rows from every layer, the same way
+    # TileLayer(...) does.  Whole rows keep the horizontal repeats that
+    # the last match check depends on, so the comparisons made are
+    # typical of a full run.  The same rows are picked every time.
+    def SampleTileset(self):
+        sampler = random.Random(0)
+        rowCount = max(1, int(round(self.sampleFraction * self.layerHeight)))
+        rowCount = min(rowCount, self.layerHeight)
+        sampleDict = { 0:Image.new('RGBA', (self.tileWidth, self.tileHeight ), (0, 0, 0, 0)) }
+        nearIndex = None
+        if self.IsToleranceMode():
+            nearIndex = self.CreateNearIndex(sampleDict)
+        # Keyed by sample tile index, the number of cells it covers.
+        counts = { 0:0 }
+        sample = { "rows":rowCount, "cells":0, "misses":0, "comparisons":0, "compareSeconds":0.0, "decodeSeconds":0.0 }
+        for fname in self.layerFiles:
+            start = time.time()
+            img = self.LoadCroppedImage(fname)
+            sample["decodeSeconds"] += time.time() - start
+            rows = sampler.sample(xrange(self.layerHeight), rowCount)
+            rows.sort()
+            for row in rows:
+                lastTileMatchIndex = 0
+                for col in xrange(self.layerWidth):
+                    subimg = self.ExtractSubimage(img, self.CalculateImageIndexFromCell(col, row))
+                    sample["cells"] += 1
+                    comparisons = self.stats.GetCounter("Comparisons") + self.stats.GetCounter("Near Candidates")
+                    start = time.time()
+                    matchIdx, xForm, match = self.FindOrAddTile(subimg, sampleDict, nearIndex, lastTileMatchIndex)
+                    if match != MapTiler.MATCH_LAST:
+                        sample["misses"] += 1
+                    if match == MapTiler.MATCH_NEW:
+                        counts[matchIdx] = 0
+                    sample["compareSeconds"] += time.time() - start
+                    sample["comparisons"] += self.stats.GetCounter("Comparisons") + self.stats.GetCounter("Near Candidates") - comparisons
+                    counts[matchIdx] += 1
+                    lastTileMatchIndex = matchIdx
+        sample["counts"] = counts.values()
+        return sample
+
+    # Estimate the number of unique tiles in all the cells from the
+    # number of cells each unique tile in the sample covered.  This is
+    # the Chao1 estimator for sampling without replacement (Chao & Lin,
+    # 2012): tiles seen once or twice say how many were never seen.  The
+    # 95% interval is log-normal.  Returns (estimate, lower, upper).
+    def EstimateUniqueTiles(self, counts, sampleCells, totalCells):
+        observed = len(counts)
+        f1 = len([count for count in counts if count == 1])
+        f2 = len([count for count in counts if count == 2])
+        n = sampleCells
+        q = n * 1.0 / totalCells
+        if q >= 1.0 or f1 == 0:
+            return observed, observed, observed
+        scale = n / max(n - 1.0, 1.0)
+        if f2 > 0:
+            unseen = f1 * f1 / (scale * 2.0 * f2 + q / (1.0 - q) * f1)
+            ratio = f1 * 1.0 / f2
+            variance = f2 * (ratio ** 4 / 4.0 + ratio ** 3 + ratio ** 2 / 2.0)
+        else:
+            unseen = f1 * (f1 - 1.0) / (scale * 2.0 + q / (1.0 - q) * f1)
+            variance = f1 * (f1 - 1.0) / 2.0 + f1 * (2.0 * f1 - 1.0) ** 2 / 4.0 - f1 ** 4 / (4.0 * (observed + unseen))
+        # Only the cells that were not sampled can hold new tiles.
+        unseen = min(unseen, totalCells - n)
+        variance *= (1.0 - q)
+        if unseen <= 0 or variance <= 0:
+            return int(round(observed + unseen)), observed, int(round(observed + unseen))
+        k = math.exp(1.96 * math.sqrt(math.log(1.0 + variance / (unseen * unseen))))
+        lower = observed + unseen / k
+        upper = min(observed + unseen * k, observed + totalCells - n)
+        return int(round(observed + unseen)), int(math.floor(lower)), int(math.ceil(upper))
+
+    # The time CreateTileset(...) would take for a number of unique
+    # tiles.  Every cell is checked against the last match.  A miss that
+    # matches scans about half of the tiles found so far (on average a
+    # quarter of the final count) and a new tile scans all of them (on
+    # average half of the final count).
+    def EstimateTilesetSeconds(self, sample, totalCells, uniqueTiles):
+        secondsPerComparison = sample["compareSeconds"] / max(sample["comparisons"], 1)
+        misses = sample["misses"] * 1.0 / sample["cells"] * totalCells
+        comparisons = totalCells + max(misses - uniqueTiles, 0) * uniqueTiles / 4.0 + uniqueTiles * uniqueTiles / 2.0
+        return comparisons * secondsPerComparison + sample["decodeSeconds"]
+
+    # Print the expected size of the tileset, the memory needed and the
+    # time it would take, without creating it.
+    def EstimateTileset(self):
+        sample = self.SampleTileset()
+        totalCells = len(self.layerFiles) * self.layerTiles
+        counts = sample["counts"]
+        estimate, lower, upper = self.EstimateUniqueTiles(counts, sample["cells"], totalCells)
+        print "---------------------------------"
+        print "Estimate from %d of %d rows in each layer (%d of %d cells, %4.1f%%)." % (
+            sample["rows"], self.layerHeight, sample["cells"], totalCells, 100.0 * sample["cells"] / totalCells)
+        print "Unique tiles in the sample: %d (%d seen once, %d seen twice)." % (
+            len(counts), len([count for count in counts if count == 1]), len([count for count in counts if count == 2]))
+        print "Estimated unique tiles: %d (95%% interval %d to %d)." % (estimate, lower, upper)
+        print
+        print "%-10s %8s %6s %14s %12s %12s" % ("", "Tiles", "Pages", "Page 0 Pixels", "Memory", "Time")
+        tileBytes = self.tileWidth * self.tileHeight * 4
+        # The layer being tiled is held both decoded and cropped.
+        layerBytes = 2 * self.imageWidth * self.imageHeight * 4
+        for name, tileCount in [("Estimate", estimate), ("Lower", lower), ("Upper", upper)]:
+            pages = self.CalculateTilesetPages(tileCount, self.atlasPacking)
+            if pages is None:
+                return False
+            used, total = self.CalculatePagePixels(pages)
+            fileName, firstTileIdx, count, cols, rows = pages[0]
+            memory = tileCount * tileBytes + layerBytes + total * 4
+            h, m, s = self.SecondsToHMS(self.EstimateTilesetSeconds(sample, totalCells, tileCount))
+            print "%-10s %8d %6d %14s %12s %12s" % (
+                name, tileCount, len(pages), "%d x %d" % (cols * self.tileWidth, rows * self.tileHeight),
+                self.stats.FormatBytes(memory), "%d:%02d:%02d" % (h, m, s))
+        print
+        print "Nav data tiles (two, plus one for each room) are not included."
+        self.stats.SetCounter("Sampled Cells", sample["cells"])
+        self.stats.SetCounter("Estimated Unique Tiles", estimate)
+        return True
 
-                for desIdx in self.imageDict.keys():
-                    # Already checked this one.
-                    if desIdx == lastTileMatchIndex:
-                        continue
-                    xForm = self.FindImageTransformation(subimg, self.imageDict[desIdx])
-                    if xForm != None:
-                        # We have an equivalent transformation
-                        self.layerDict[lname][idx] = (desIdx, xForm)
-                        if self.verbose:
-                            print "[%5.1f%% Complete] [%5.1f%% Eff] Layer %s, Index %d (%d,%d) maps onto image %d, xForm %d."%(
-                                100*tilesProcessed/tilesToProcess,
-                                100*(1.0-self.tilesCreated*1.0/self.tilesPossible),
-                                lname,idx,row,col,desIdx,xForm )
-                        foundXform = True
-                        lastTileMatchIndex = desIdx
-                        break
-
-                if not foundXform:
-                    # Keep this one.
-                    self.imageDict[subimgIdx] = subimg
-                    self.layerDict[lname][idx] = (subimgIdx, 0)
-                    if self.verbose:
-                        print "[%5.1f%% Complete] [%5.1f%% Eff] Layer %s, Index %d (%d,%d) is a new image."%(
-                            100.0 * tilesProcessed / tilesToProcess,
-                            100 * (1.0 - self.tilesCreated * 1.0 / self.tilesPossible),
-                            lname,idx,row,col)
-                    # Increment the subimage index for the next one.
-                    lastTileMatchIndex = subimgIdx
-                    self.tilesCreated += 1
-                    subimgIdx += 1
+    # Parse "16,32x16,..." into a list of (width, height).  Returns None
+    # if it is not valid.
+    def ParseSearchSizes(self, text):
+        sizes = []
+        for item in text.lower().split(","):
+            parts = item.strip().split("x")
+            if len(parts) == 1:
+                parts = parts * 2
+            if len(parts) != 2 or not parts[0].isdigit() or not parts[1].isdigit():
+                return None
+            width, height = int(parts[0]), int(parts[1])
+            if width <= 0 or height <= 0:
+                return None
+            sizes.append((width, height))
+        return sizes
+
+    # Decode every layer once and split it into rows of pixel data, so
+    # that each tile size and offset tried only has to slice the rows.
+    # Returns (width, height, layers) or None if the sizes differ.
+    def LoadSearchRows(self):
+        layers = []
+        size = None
+        for fname in self.layerFiles:
+            self.stats.BeginStage("Decode")
+            img = Image.open(fname)
+            if img.mode != "RGBA":
+                img = img.convert("RGBA")
+            self.stats.EndStage("Decode")
+            if size is not None and img.size != size:
+                print "Image %s Size (%d x %d) does not match base size (%d x %d)" % (
+                    fname, img.size[0], img.size[1], size[0], size[1])
+                return None
+            size = img.size
+            data = img.tobytes()
+            rowBytes = size[0] * 4
+            layers.append([data[y * rowBytes:(y + 1) * rowBytes] for y in xrange(size[1])])
+        return size[0], size[1], layers
+
+    # Count the cells and the unique tiles (under any rotation or
+    # reflection, as CreateTileset(...) finds them) for one tile size
+    # and offset.  The pixels of each cell are sliced from the rows and
+    # cells with the same pixels are only fingerprinted once.
+    def CountSearchTiles(self, layers, width, height, tileWidth, tileHeight, offX, offY):
+        cols = (width - offX) / tileWidth
+        rows = (height - offY) / tileHeight
+        tileBytes = tileWidth * 4
+        cells = set()
+        for layerRows in layers:
+            for row in xrange(rows):
+                y0 = offY + row * tileHeight
+                lines = layerRows[y0:y0 + tileHeight]
+                for col in xrange(cols):
+                    x0 = (offX + col * tileWidth) * 4
+                    cells.add("".join([line[x0:x0 + tileBytes] for line in lines]))
+        empty = Image.new('RGBA', (tileWidth, tileHeight), (0, 0, 0, 0))
+        fingerprints = set([self.CreateCanonicalFingerprint(empty)])
+        for data in cells:
+            fingerprints.add(self.CreateCanonicalFingerprint(Image.frombytes("RGBA", (tileWidth, tileHeight), data)))
+        return cols * rows * len(layers), len(fingerprints), (width - offX) % tileWidth, (height - offY) % tileHeight
+
+    # Try each tile size (and offset) on the layers decoded once, and
+    # rank them by the size of the tileset they need and then by the
+    # number of unique tiles.
+    def SearchTileSizes(self):
+        loaded = self.LoadSearchRows()
+        if loaded is None:
+            return False
+        width, height, layers = loaded
+        tileWidth, tileHeight = self.tileWidth, self.tileHeight
+        results = []
+        for searchWidth, searchHeight in self.ParseSearchSizes(self.searchSizes):
+            if self.searchOffsetStep > 0:
+                offsets = [(offX, offY) for offY in xrange(0, searchHeight, self.searchOffsetStep)
+                           for offX in xrange(0, searchWidth, self.searchOffsetStep)]
+            else:
+                offsets = [(self.tileOffX, self.tileOffY)]
+            for offX, offY in offsets:
+                if width - offX < searchWidth or height - offY < searchHeight:
+                    continue
+                cells, unique, insetX, insetY = self.CountSearchTiles(
+                    layers, width, height, searchWidth, searchHeight, offX, offY)
+                # The tileset is worked out for this tile size.
+                self.tileWidth, self.tileHeight = searchWidth, searchHeight
+                pages = self.CalculateTilesetPages(unique, self.atlasPacking)
+                if pages is None:
+                    continue
+                used, total = self.CalculatePagePixels(pages)
+                results.append((total, unique, cells, searchWidth, searchHeight, offX, offY, insetX, insetY, len(pages)))
+        self.tileWidth, self.tileHeight = tileWidth, tileHeight
+        if len(results) == 0:
+            print "None of the search sizes fit the %d x %d layers." % (width, height)
+            return False
+        results.sort()
+        print "---------------------------------"
+        print "Tile sizes for %d layers of %d x %d pixels (best first)" % (len(layers), width, height)
+        print "---------------------------------"
+        print "%-9s %-9s %9s %9s %7s %14s %6s" % ("Size", "Offset", "Cells", "Unique", "Eff", "Tileset (px)", "Pages")
+        for total, unique, cells, searchWidth, searchHeight, offX, offY, insetX, insetY, pageCount in results:
+            print "%-9s %-9s %9d %9d %6.1f%% %14d %6d" % (
+                "%dx%d" % (searchWidth, searchHeight), "%d,%d" % (offX, offY), cells, unique,
+                100.0 * (1.0 - unique * 1.0 / max(cells, 1)), total, pageCount)
+        total, unique, cells, searchWidth, searchHeight, offX, offY, insetX, insetY, pageCount = results[0]
+        print "Best: --tileWidth=%d --tileHeight=%d --tileOffX=%d --tileOffY=%d --tileInsetX=%d --tileInsetY=%d" % (
+            searchWidth, searchHeight, offX, offY, insetX, insetY)
+        self.stats.SetCounter("Configurations Searched", len(results))
         return True
 
     def DumpTilemap(self):
@@ -547,21 +1422,188 @@ class MapTiler(object):
                 print " -[%d] (%d, %d) %s" % (idx, col, row, self.layerDict[lname][idx])
             print
 
+    # Apply one of the transformations in TRANSFORM_LIST to an image.
+    def ApplyTransformation(self, img, xForm):
+        xForm, mirrorX, rot90 = MapTiler.TRANSFORM_LIST[xForm]
+        if mirrorX:
+            img = img.transpose(Image.FLIP_LEFT_RIGHT)
+        if rot90 == 1:
+            img = img.transpose(Image.ROTATE_90)
+        elif rot90 == 2:
+            img = img.transpose(Image.ROTATE_180)
+        elif rot90 == 3:
+            img = img.transpose(Image.ROTATE_270)
+        return img
+
+    # Find the single transformation that does the same thing as
+    # applying first and then second to an image.  The table is worked
+    # out once, by transforming a small image whose pixels are all
+    # different.
+    def ComposeTransformations(self, first, second):
+        if self.transformComposition is None:
+            probe = Image.new("L", (3, 3))
+            probe.putdata(range(0, 90, 10))
+            self.transformComposition = {}
+            for a, mirrorA, rotA in MapTiler.TRANSFORM_LIST:
+                for b, mirrorB, rotB in MapTiler.TRANSFORM_LIST:
+                    both = self.ApplyTransformation(self.ApplyTransformation(probe, a), b)
+                    self.transformComposition[(a, b)] = self.FindImageTransformation(both, probe)
+        return self.transformComposition[(first, second)]
+
+    # A key that is the same for an image and for every transformation
+    # of it that has the same size, so that possible matches can be
+    # looked up without comparing against every tile.
+    def CreateCanonicalFingerprint(self, img):
+        fingerprints = []
+        for xForm, mirrorX, rot90 in MapTiler.TRANSFORM_LIST:
+            other = self.ApplyTransformation(img, xForm)
+            if other.size == img.size:
+                fingerprints.append(hashlib.md5(other.tobytes()).hexdigest())
+        return min(fingerprints)
+
+    def IsToleranceMode(self):
+        return self.maxChannelDelta > 0 or self.maxDiffPixels > 0
+
+    # The block averages a tile is looked up and compared by in the near
+    # duplicate index.  The tile is shrunk to a grid and the channels of
+    # each block are listed in row order.
+    def CreateNearGrid(self, img):
+        grid = self.nearGrid
+        bands = [band.resize((grid, grid), Image.BILINEAR).getdata() for band in img.split()]
+        return [channel for value in zip(*bands) for channel in value]
+
+    # A few pixels spread over the tile.  If more than maxDiffPixels of
+    # them are too different, so is the whole tile.
+    def CreateNearSample(self, img):
+        return [img.getpixel(point) for point in self.nearPoints]
+
+    # The keys a tile is found by in the near duplicate index, one list
+    # for each row of the grid.  The averages are quantized, but those
+    # of near duplicates may still fall either side of a step, so each
+    # row has a second key using steps offset by half a step.  Rows that
+    # are no more opaque than clear are left out, since most tiles have
+    # transparent rows.
+    def CreateNearKeys(self, values, clear):
+        grid = self.nearGrid
+        step = self.nearStep
+        bands = []
+        for row in xrange(grid):
+            band = values[row * grid * 4:(row + 1) * grid * 4]
+            if max(band[3::4]) <= clear:
+                continue
+            bands.append([(shift, row, tuple([(channel + shift) / step for channel in band])) for shift in [0, step / 2]])
+        return bands
+
+    # Index every tile under each of its transformations, so that a new
+    # tile is looked up with just its own keys.  The step is wide enough
+    # for the block averages to move by the tolerance.  Tiles that are
+    # almost transparent are also found by one shared key.  The
+    # transformed images and their averages are kept for the
+    # comparisons.
+    def CreateNearIndex(self, tiles):
+        self.nearGrid = max(1, min(MapTiler.NEAR_INDEX_GRID, self.tileWidth, self.tileHeight))
+        blockPixels = (self.tileWidth / self.nearGrid) * (self.tileHeight / self.nearGrid)
+        self.nearSpread = self.maxChannelDelta + 255.0 * self.maxDiffPixels / blockPixels
+        self.nearStep = max(8, int(2 * self.nearSpread) + 1)
+        across = min(MapTiler.NEAR_SAMPLE_GRID, self.tileWidth)
+        down = min(MapTiler.NEAR_SAMPLE_GRID, self.tileHeight)
+        self.nearPoints = [((2 * x + 1) * self.tileWidth / (2 * across), (2 * y + 1) * self.tileHeight / (2 * down))
+                           for y in xrange(down) for x in xrange(across)]
+        index = { "keys":{}, "tiles":{}, "size":0 }
+        for tileIdx in sorted(tiles):
+            self.AddNearIndex(index, tileIdx, tiles[tileIdx])
+        return index
+
+    def AddNearIndex(self, index, tileIdx, img):
+        for xForm, mirrorX, rot90 in MapTiler.TRANSFORM_LIST:
+            other = self.ApplyTransformation(img, xForm)
+            if other.size != img.size:
+                continue
+            values = self.CreateNearGrid(other)
+            index["tiles"][(tileIdx, xForm)] = (other, values, self.CreateNearSample(other))
+            bands = self.CreateNearKeys(values, 0)
+            if max(values[3::4]) <= 2 * self.nearSpread + 1:
+                bands.append([("faint",)])
+            for band in bands:
+                for key in band:
+                    index["keys"].setdefault(key, set()).add((tileIdx, xForm))
+        index["size"] += 1
+
+    # True if no more than maxDiffPixels pixels have a channel that
+    # differs by more than maxChannelDelta.
+    def IsWithinTolerance(self, img, ref):
+        bands = ImageChops.difference(img, ref).split()
+        largest = bands[0]
+        for band in bands[1:]:
+            largest = ImageChops.lighter(largest, band)
+        over = sum(largest.histogram()[self.maxChannelDelta + 1:])
+        return over <= self.maxDiffPixels
+
+    # True if no more than maxDiffPixels of the sampled (RGBA) pixels
+    # have a channel that differs by more than maxChannelDelta.
+    def IsSampleWithinTolerance(self, sample, refSample):
+        delta = self.maxChannelDelta
+        over = 0
+        for (r, g, b, a), (refR, refG, refB, refA) in zip(sample, refSample):
+            if abs(r - refR) > delta or abs(g - refG) > delta or abs(b - refB) > delta or abs(a - refA) > delta:
+                over += 1
+                if over > self.maxDiffPixels:
+                    return False
+        return True
+
+    # Find a tile (and transformation) that is within the tolerance of
+    # the image.  Only tiles matching every row of the image (with
+    # either quantization) whose block averages are within the spread
+    # and whose sampled pixels are within the tolerance are compared in
+    # full, closest first.  Rows that a transparent tile could match
+    # are not looked up.  Returns (tileIdx, xForm) or None.
+    def FindNearTile(self, index, img):
+        # The averages are rounded, so allow one more.
+        spread = self.nearSpread + 1
+        values = self.CreateNearGrid(img)
+        bands = self.CreateNearKeys(values, spread)
+        if len(bands) == 0:
+            bands = [[("faint",)]]
+        candidates = None
+        for band in bands:
+            matches = set()
+            for key in band:
+                if key in index["keys"]:
+                    matches |= index["keys"][key]
+            if candidates is None:
+                candidates = matches
+            else:
+                candidates &= matches
+            if len(candidates) == 0:
+                return None
+        sample = self.CreateNearSample(img)
+        ranked = []
+        for candidate in candidates:
+            ref, refValues, refSample = index["tiles"][candidate]
+            if not self.IsSampleWithinTolerance(sample, refSample):
+                continue
+            distance = max([abs(value - refValue) for value, refValue in zip(values, refValues)])
+            if distance <= spread:
+                ranked.append((distance, candidate))
+        ranked.sort()
+        for distance, candidate in ranked:
+            ref = index["tiles"][candidate][0]
+            self.stats.AddCounter("Near Candidates")
+            if self.IsWithinTolerance(img, ref):
+                if ImageChops.difference(img, ref).getbbox() is not None:
+                    self.stats.AddCounter("Near Matches")
+                    self.nearMerged.add(hashlib.md5(img.tobytes()).hexdigest())
+                return candidate
+        return None
+
     # Determine if two images are the same by comparing rotations and
     # reflections between them.  If a transformation can be found that
     # turns the first into the second, return it.  Otherwise return None.
     # This is NOT a trivial operation.
     def FindImageTransformation(self, im1org, im2org):
+        self.stats.AddCounter("Comparisons")
         for xForm, mirrorX, rot90 in MapTiler.TRANSFORM_LIST:
-            im2 = im2org
-            if mirrorX:
-                im2 = im2.transpose(Image.FLIP_LEFT_RIGHT)
-            if rot90 == 1:
-                im2 = im2.transpose(Image.ROTATE_90)
-            elif rot90 == 2:
-                im2 = im2.transpose(Image.ROTATE_180)
-            elif rot90 == 3:
-                im2 = im2.transpose(Image.ROTATE_270)
+            im2 = self.ApplyTransformation(im2org, xForm)
             if im1org.size != im2.size:
                 # Don't compare images that are not the same size.
                 continue
@@ -576,11 +1618,59 @@ class MapTiler(object):
             k = k * 2
         return k
 
-    def ExportTileset(self):
-        # How many tiles do we have?
-        tileCount = len(self.imageDict)
-        # Need to create a "square" image that is a power of 2
-        # This helps with GPUs, etc.
+    def FindPrevPowerOfTwo(self, N):
+        k = 1
+        while k * 2 <= N:
+            k = k * 2
+        return k
+
+    # The first page of the tileset is always written to outTilesetFile.
+    # Any additional pages (when the tiles do not fit under maxAtlasSize)
+    # get the page number appended to the name, e.g. tileset_1.png.
+    def FormatTilesetPageFile(self, page):
+        if page == 0:
+            return self.outTilesetFile
+        base, ext = os.path.splitext(self.outTilesetFile)
+        return "%s_%d%s" % (base, page, ext)
+
+    # Each mip level of a page gets the level appended to the name of
+    # the page, e.g. tileset_mip1.png or tileset_1_mip2.png.
+    def FormatTilesetMipFile(self, pageFile, level):
+        base, ext = os.path.splitext(pageFile)
+        return "%s_mip%d%s" % (base, level, ext)
+
+    # True for any page (or mip level of a page) of the output tileset.
+    def IsTilesetPageFile(self, fileName):
+        base, ext = os.path.splitext(self.outTilesetFile)
+        name, fext = os.path.splitext(fileName)
+        if fext != ext:
+            return False
+        return re.match(re.escape(base) + r"(_\d+)?(_mip\d+)?$", name) is not None
+
+    # Figure out how many tiles (columns x rows) fit on a single
+    # tileset page.  Returns (0, 0) if there is no limit.
+    def CalculatePageLimits(self, packing):
+        if self.maxAtlasSize <= 0:
+            return 0, 0
+        maxCols = self.maxAtlasSize / self.tileWidth
+        maxRows = self.maxAtlasSize / self.tileHeight
+        if packing == MapTiler.PACKING_POW2:
+            maxCols = self.FindPrevPowerOfTwo(maxCols)
+            maxRows = self.FindPrevPowerOfTwo(maxRows)
+        return maxCols, maxRows
+
+    def CalculateAtlasGrid(self, tileCount, maxCols=0, maxRows=0, packing=None):
+        if packing is None:
+            packing = self.atlasPacking
+        if packing == MapTiler.PACKING_TIGHT:
+            return self.CalculateTightGrid(tileCount, maxCols, maxRows)
+        if packing == MapTiler.PACKING_ASPECT:
+            return self.CalculateBestAspectGrid(tileCount, maxCols, maxRows)
+        return self.CalculatePowerOfTwoGrid(tileCount, maxCols, maxRows)
+
+    # Need to create a "square" image that is a power of 2
+    # This helps with GPUs, etc.
+    def CalculatePowerOfTwoGrid(self, tileCount, maxCols=0, maxRows=0):
         imageDimWidth = self.FindNextPowerOfTwo(math.sqrt(tileCount))
         imageDimHeight = imageDimWidth
         if self.forceSquareTileset:
@@ -589,32 +1679,392 @@ class MapTiler(object):
             while imageDimHeight * imageDimWidth > tileCount:
                 imageDimHeight = imageDimHeight / 2
             imageDimHeight = imageDimHeight * 2
-        imageWidth = imageDimWidth * self.tileWidth
-        imageHeight = imageDimHeight * self.tileHeight
-        self.tilesetWidth = imageWidth
-        self.tilesetHeight = imageHeight
+        if maxCols > 0 and imageDimWidth > maxCols:
+            # Too wide for a page, so use the full page width and only
+            # as many rows as are needed.
+            imageDimWidth = maxCols
+            imageDimHeight = self.FindNextPowerOfTwo(int(math.ceil(tileCount * 1.0 / imageDimWidth)))
+        if maxRows > 0 and imageDimHeight > maxRows:
+            # Too tall for a page, so widen it as much as needed instead.
+            imageDimHeight = maxRows
+            imageDimWidth = min(maxCols, self.FindNextPowerOfTwo(int(math.ceil(tileCount * 1.0 / imageDimHeight))))
+        return imageDimWidth, imageDimHeight
+
+    # The smallest near-square grid of any size.  At most one partial
+    # row is wasted.
+    def CalculateTightGrid(self, tileCount, maxCols=0, maxRows=0):
+        imageDimWidth = int(math.ceil(math.sqrt(tileCount)))
+        if maxCols > 0:
+            imageDimWidth = min(imageDimWidth, maxCols)
+        imageDimHeight = int(math.ceil(tileCount * 1.0 / imageDimWidth))
+        if maxRows > 0 and imageDimHeight > maxRows:
+            imageDimHeight = maxRows
+            imageDimWidth = int(math.ceil(tileCount * 1.0 / imageDimHeight))
+        return imageDimWidth, imageDimHeight
+
+    # Search every width for the grid with the fewest empty cells whose
+    # image is no more than MAX_ATLAS_ASPECT times wider than it is tall
+    # (or the other way), preferring the one closest to square when
+    # there is a tie.  If the page limits leave no such grid, the one
+    # closest to square is used.
+    def CalculateBestAspectGrid(self, tileCount, maxCols=0, maxRows=0):
+        best = None
+        widthLimit = tileCount
+        if maxCols > 0:
+            widthLimit = min(widthLimit, maxCols)
+        for imageDimWidth in xrange(1, widthLimit + 1):
+            imageDimHeight = int(math.ceil(tileCount * 1.0 / imageDimWidth))
+            if maxRows > 0 and imageDimHeight > maxRows:
+                continue
+            wasted = imageDimWidth * imageDimHeight - tileCount
+            # Compare the shape in pixels, so tall or wide tiles work.
+            width = imageDimWidth * self.tileWidth
+            height = imageDimHeight * self.tileHeight
+            aspect = max(width, height) * 1.0 / min(width, height)
+            if aspect <= MapTiler.MAX_ATLAS_ASPECT:
+                score = (0, wasted, aspect)
+            else:
+                score = (1, aspect, wasted)
+            if best is None or score < best[0]:
+                best = (score, imageDimWidth, imageDimHeight)
+        return best[1], best[2]
+
+    # Split the tiles into pages.  Each page is stored as a tuple of
+    # (fileName, firstTileIdx, tileCount, columns, rows).
+    def CalculateTilesetPages(self, tileCount, packing):
+        maxCols, maxRows = self.CalculatePageLimits(packing)
+        if self.maxAtlasSize > 0 and (maxCols == 0 or maxRows == 0):
+            print "Max atlas size %d is smaller than the tile size (%d x %d)." % (
+                self.maxAtlasSize, self.tileWidth, self.tileHeight)
+            return None
+        pageTiles = tileCount
+        if maxCols > 0:
+            pageTiles = maxCols * maxRows
+        pages = []
+        firstTileIdx = 0
+        while firstTileIdx < tileCount:
+            count = min(pageTiles, tileCount - firstTileIdx)
+            cols, rows = self.CalculateAtlasGrid(count, maxCols, maxRows, packing)
+            fileName = self.FormatTilesetPageFile(len(pages))
+            pages.append((fileName, firstTileIdx, count, cols, rows))
+            firstTileIdx += count
+        return pages
+
+    # Returns the (used, total) pixels for a set of pages.
+    def CalculatePagePixels(self, pages):
+        used = 0
+        total = 0
+        for fileName, firstTileIdx, count, cols, rows in pages:
+            used += count * self.tileWidth * self.tileHeight
+            total += cols * rows * self.tileWidth * self.tileHeight
+        return used, total
+
+    # Paste the tiles for a page into an image.  By default, these are the
+    # full size tiles.  Pass in the tiles and their size for a mip level.
+    def CreateTilesetPageImage(self, page, imageDict=None, tileWidth=None, tileHeight=None):
+        if imageDict is None:
+            imageDict = self.imageDict
+            tileWidth = self.tileWidth
+            tileHeight = self.tileHeight
+        fileName, firstTileIdx, count, imageDimWidth, imageDimHeight = page
+        imageWidth = imageDimWidth * tileWidth
+        imageHeight = imageDimHeight * tileHeight
+        # Create the output image
+        imgOut = Image.new('RGBA', (imageWidth, imageHeight), (0, 0, 0, 0))
+        for idx in xrange(count):
+            row = idx / imageDimWidth
+            col = idx % imageDimWidth
+            x0 = col * tileWidth
+            y0 = row * tileHeight
+            x1 = x0 + tileWidth
+            y1 = y0 + tileHeight
+            imgOut.paste(imageDict[firstTileIdx + idx], (x0, y0, x1, y1))
+        return imgOut
+
+    # Downscale every tile on its own, so that neighboring tiles in the
+    # tileset never bleed into each other.  The colors are premultiplied
+    # by alpha while scaling so transparent pixels do not darken edges.
+    def CreateMipTiles(self, tileWidth, tileHeight):
+        mipDict = {}
+        for tileIdx in self.imageDict:
+            tile = self.imageDict[tileIdx].convert("RGBa")
+            tile = tile.resize((tileWidth, tileHeight), Image.ANTIALIAS)
+            mipDict[tileIdx] = tile.convert("RGBA")
+        return mipDict
+
+    # Write a downscaled copy of every page for each mip level (1/2,
+    # 1/4, ...).  The pages have the same grid as the full size pages,
+    # so the same gids are used to look tiles up at every level.
+    def ExportTilesetMips(self):
+        for level in xrange(1, self.mipLevels + 1):
+            tileWidth = self.tileWidth >> level
+            tileHeight = self.tileHeight >> level
+            if tileWidth < 1 or tileHeight < 1:
+                print "Tiles cannot be scaled down to mip level %d, stopping at level %d." % (level, level - 1)
+                break
+            mipDict = self.CreateMipTiles(tileWidth, tileHeight)
+            for page in self.tilesetPages:
+                fileName = self.FormatTilesetMipFile(page[0], level)
+                imgOut = self.CreateTilesetPageImage(page, mipDict, tileWidth, tileHeight)
+                data, encoding = self.EncodeTilesetImage(imgOut)
+                print "Saving mip level %d (%d x %d pixel tiles) to %s (%s, %d bytes)." % (
+                    level, tileWidth, tileHeight, fileName, encoding, len(data))
+                with open(fileName, "wb") as outFile:
+                    outFile.write(data)
+        return True
+
+    # Lay out the tiles with every packing policy and report how much
+    # of the atlas is wasted and how big the files would be.  Nothing is
+    # written to disk.
+    def ReportPackingPolicies(self):
+        tileCount = len(self.imageDict)
+        print "---------------------------------"
+        print "Packing Policies"
+        print "---------------------------------"
+        print "%-8s %5s %15s %10s %12s" % ("Policy", "Pages", "Pixels", "Wasted", "Bytes")
+        for packing in MapTiler.PACKING_LIST:
+            pages = self.CalculateTilesetPages(tileCount, packing)
+            if pages is None:
+                return False
+            used, total = self.CalculatePagePixels(pages)
+            fileBytes = 0
+            for page in pages:
+                data, encoding = self.EncodeTilesetImage(self.CreateTilesetPageImage(page))
+                fileBytes += len(data)
+            print "%-8s %5d %15d %9.1f%% %12d" % (
+                packing, len(pages), total, 100.0 * (total - used) / total, fileBytes)
+        print
+        return True
+
+    # Find the page that a (zero based) tile index is stored on.
+    def FindTilesetPage(self, tileIdx):
+        starts = [firstTileIdx for fileName, firstTileIdx, count, cols, rows in self.tilesetPages]
+        return self.tilesetPages[bisect.bisect_right(starts, tileIdx) - 1]
+
+    # Convert a (zero based) tile index and transformation into the
+    # gid that Tiled expects, relative to the page the tile is on.
+    def CalculateGID(self, tileIdx, xForm):
+        if tileIdx == 0:
+            # This is the "empty" tile
+            return 0
+        return self.UpdateGIDForRotation(tileIdx + 1, xForm)
+
+    # Count how many cells, over all layers, use each tile.
+    def CountTileUsage(self):
+        counts = { tileIdx:0 for tileIdx in self.imageDict }
+        for lname in self.layerDict:
+            for tileIdx, xForm in self.layerDict[lname].itervalues():
+                counts[tileIdx] += 1
+        return counts
+
+    # Count how often each pair of tiles is seen together, either as
+    # horizontal/vertical neighbors in a layer or stacked in the same
+    # cell on different layers.  Returns a dictionary of dictionaries
+    # keyed by tile index.
+    def CountTileCoOccurrence(self):
+        weights = { tileIdx:{} for tileIdx in self.imageDict }
+        def AddPair(tileA, tileB):
+            if tileA == 0 or tileB == 0 or tileA == tileB:
+                return
+            weights[tileA][tileB] = weights[tileA].get(tileB, 0) + 1
+            weights[tileB][tileA] = weights[tileB].get(tileA, 0) + 1
+        lnames = self.layerDict.keys()
+        lnames.sort()
+        for idx in xrange(self.layerTiles):
+            col, row = self.CalculateImageRowCell(idx)
+            stack = []
+            for lname in lnames:
+                layerDict = self.layerDict[lname]
+                tileIdx = layerDict[idx][0]
+                if tileIdx == 0:
+                    continue
+                if col + 1 < self.layerWidth:
+                    AddPair(tileIdx, layerDict[idx + 1][0])
+                if row + 1 < self.layerHeight:
+                    AddPair(tileIdx, layerDict[idx + self.layerWidth][0])
+                for other in stack:
+                    AddPair(tileIdx, other)
+                stack.append(tileIdx)
+        return weights
+
+    # Most used tiles first.  Ties keep the discovery order.
+    def CreateFrequencyOrder(self):
+        counts = self.CountTileUsage()
+        order = [tileIdx for tileIdx in self.imageDict if tileIdx != 0]
+        order.sort(key=lambda tileIdx: (-counts[tileIdx], tileIdx))
+        return [0] + order
+
+    # Build a chain of tiles where each tile is followed by the unplaced
+    # tile it is seen with most often.  When the chain runs out of
+    # neighbors, it restarts from the most used tile left.
+    def CreateLocalityOrder(self):
+        weights = self.CountTileCoOccurrence()
+        byFrequency = self.CreateFrequencyOrder()[1:]
+        placed = set([0])
+        order = [0]
+        nextFrequent = 0
+        current = None
+        while len(order) < len(byFrequency) + 1:
+            best = None
+            if current is not None:
+                for other, weight in weights[current].iteritems():
+                    if other in placed:
+                        continue
+                    if best is None or (weight, -other) > (weights[current][best], -best):
+                        best = other
+            if best is None:
+                while byFrequency[nextFrequent] in placed:
+                    nextFrequent += 1
+                best = byFrequency[nextFrequent]
+            order.append(best)
+            placed.add(best)
+            current = best
+        return order
+
+    # Renumber the tiles so that order[n] becomes tile n.  Every layer
+    # and the tile properties are updated to use the new numbers.
+    def RemapTileIndices(self, order):
+        # The near duplicate index uses the old indices.
+        self.nearIndex = None
+        remap = { old:new for new, old in enumerate(order) }
+        self.imageDict = { remap[old]:self.imageDict[old] for old in self.imageDict }
+        for lname in self.layerDict:
+            layerDict = self.layerDict[lname]
+            for idx in layerDict:
+                tileIdx, xForm = layerDict[idx]
+                layerDict[idx] = (remap[tileIdx], xForm)
+        self.tileProperties = { remap[old]:self.tileProperties[old] for old in self.tileProperties }
+
+    # Drop the tiles that no layer uses any more (e.g. after a layer
+    # was tiled again) and renumber the rest, keeping their order.
+    # Returns the number of tiles removed.
+    def CompactTiles(self):
+        used = set([0])
+        for lname in self.layerDict:
+            for tileIdx, xForm in self.layerDict[lname].itervalues():
+                used.add(tileIdx)
+        removed = len(self.imageDict) - len(used)
+        self.imageDict = { tileIdx:self.imageDict[tileIdx] for tileIdx in used }
+        self.tileProperties = { tileIdx:self.tileProperties[tileIdx] for tileIdx in self.tileProperties if tileIdx in used }
+        order = list(used)
+        order.sort()
+        self.RemapTileIndices(order)
+        return removed
+
+    def ReorderTiles(self):
+        if self.tileOrder == MapTiler.ORDER_FREQUENCY:
+            order = self.CreateFrequencyOrder()
+        elif self.tileOrder == MapTiler.ORDER_LOCALITY:
+            order = self.CreateLocalityOrder()
+        else:
+            return True
+        self.RemapTileIndices(order)
+        print "Tiles placed in the tileset by %s." % self.tileOrder
+        return True
+
+    def ExportTileset(self):
+        if not self.ReorderTiles():
+            return False
+        # How many tiles do we have?
+        tileCount = len(self.imageDict)
+        if self.reportPacking and not self.ReportPackingPolicies():
+            return False
+        self.tilesetPages = self.CalculateTilesetPages(tileCount, self.atlasPacking)
+        if self.tilesetPages is None:
+            return False
         print "The tile size is (%d x %d) pixels wide x high."%(self.tileWidth,self.tileHeight)
-        print "For %d tiles, the image size will be %d x %d tiles (%d x %d pixels)." % (
-            tileCount, imageDimWidth, imageDimHeight, imageWidth, imageHeight)
+        for fileName, firstTileIdx, count, imageDimWidth, imageDimHeight in self.tilesetPages:
+            print "For %d tiles, the image size will be %d x %d tiles (%d x %d pixels)." % (
+                count, imageDimWidth, imageDimHeight,
+                imageDimWidth * self.tileWidth, imageDimHeight * self.tileHeight)
+        if len(self.tilesetPages) > 1:
+            print "The tileset is split into %d pages of at most %d x %d pixels." % (
+                len(self.tilesetPages), self.maxAtlasSize, self.maxAtlasSize)
         print "Efficiency = 100%%(1-Tiles Created / Tiles Possible) => 100%%(1-%d/%d) = %4.1f%%."%(
             self.tilesCreated,
             self.tilesPossible,
             100*(1.0-self.tilesCreated*1.0/self.tilesPossible))
-        # Create the output image
-        imgOut = Image.new('RGBA', (imageWidth, imageHeight), (0, 0, 0, 0))
-        for idx in xrange(tileCount):
-            row = idx / imageDimWidth
-            col = idx % imageDimWidth
-            x0 = col * self.tileWidth
-            y0 = row * self.tileHeight
-            x1 = x0 + self.tileWidth
-            y1 = y0 + self.tileHeight
-            imgOut.paste(self.imageDict[idx], (x0, y0, x1, y1))
-        print "Saving tileset to %s." % self.outTilesetFile
-        imgOut.save(self.outTilesetFile)
+        used, total = self.CalculatePagePixels(self.tilesetPages)
+        fileName, firstTileIdx, count, imageDimWidth, imageDimHeight = self.tilesetPages[0]
+        self.tilesetWidth = imageDimWidth * self.tileWidth
+        self.tilesetHeight = imageDimHeight * self.tileHeight
+        if not self.exportTileset:
+            print "Packing %s wastes %d of %d pixels (%4.1f%%), the tileset is not saved." % (
+                self.atlasPacking, total - used, total, 100.0 * (total - used) / total)
+            return True
+        fileBytes = 0
+        for page in self.tilesetPages:
+            fileName = page[0]
+            imgOut = self.CreateTilesetPageImage(page)
+            data, encoding = self.EncodeTilesetImage(imgOut)
+            print "Saving tileset to %s (%s, %d bytes)." % (fileName, encoding, len(data))
+            if self.optimizeTileset:
+                defaultBytes = len(self.EncodePNG(imgOut))
+                print "Optimizing saved %d of %d bytes (%4.1f%%)." % (
+                    defaultBytes - len(data), defaultBytes, 100.0 * (defaultBytes - len(data)) / defaultBytes)
+            with open(fileName, "wb") as outFile:
+                outFile.write(data)
+            fileBytes += len(data)
+        print "Packing %s wastes %d of %d pixels (%4.1f%%), tileset size is %d bytes." % (
+            self.atlasPacking, total - used, total, 100.0 * (total - used) / total, fileBytes)
+        if not self.ExportTilesetMips():
+            return False
         return True
 
+    # If the image has 256 colors or fewer (counting alpha), convert it
+    # to an indexed image with the exact same colors.  Otherwise return
+    # None.
+    def CreatePaletteImage(self, img):
+        colors = img.getcolors(256)
+        if colors is None:
+            return None
+        # Most used colors first.
+        colors.sort(reverse=True)
+        colors = [color for count, color in colors]
+        index = { color:idx for idx, color in enumerate(colors) }
+        palImg = Image.new("P", img.size)
+        palette = []
+        alpha = []
+        for r, g, b, a in colors:
+            palette += [r, g, b]
+            alpha.append(chr(a))
+        palImg.putpalette(palette + [0] * (768 - len(palette)))
+        palImg.putdata([index[color] for color in img.getdata()])
+        palImg.info["transparency"] = "".join(alpha)
+        return palImg
+
+    def EncodePNG(self, img, compressLevel=-1, strategy=-1):
+        buf = io.BytesIO()
+        params = { "compress_level":compressLevel, "compress_type":strategy }
+        if img.mode == "P":
+            params["transparency"] = img.info["transparency"]
+        img.save(buf, "PNG", **params)
+        return buf.getvalue()
+
+    # Encode a tileset image with the configured compression level and
+    # strategy.  Images with few colors are stored with a palette.  When
+    # optimizing, every strategy at maximum compression is tried (with
+    # and without the palette) and the smallest is kept.  Returns the
+    # PNG data and a description of the encoding.
+    def EncodeTilesetImage(self, img):
+        images = [("RGBA", img)]
+        palImg = self.CreatePaletteImage(img)
+        if palImg is not None:
+            images.insert(0, ("Indexed", palImg))
+        if not self.optimizeTileset:
+            mode, img = images[0]
+            data = self.EncodePNG(img, self.pngCompressLevel, MapTiler.PNG_STRATEGY_DICT[self.pngStrategy])
+            return data, "%s, level %d, %s" % (mode, self.pngCompressLevel, self.pngStrategy)
+        best = None
+        for mode, img in images:
+            for strategy in MapTiler.PNG_STRATEGY_LIST:
+                data = self.EncodePNG(img, 9, MapTiler.PNG_STRATEGY_DICT[strategy])
+                if best is None or len(data) < len(best[0]):
+                    best = (data, "%s, level 9, %s" % (mode, strategy))
+        return best
+
     def LoadCroppedImage(self,fileName):
+        self.stats.BeginStage("Decode")
         image = Image.open(fileName)
         w, h = image.size
         x0 = self.tileOffX
@@ -624,6 +2074,7 @@ class MapTiler(object):
         img = image.crop((x0, y0, x1, y1))
         if img.mode != "RGBA":
             img = img.convert("RGBA")
+        self.stats.EndStage("Decode")
         return img
 
     def CreateTiledFile(self):
@@ -636,39 +2087,73 @@ class MapTiler(object):
         outRoot.attrib["height"] = "%s" % self.layerHeight
         outRoot.attrib["tilewidth"] = "%s" % self.tileWidth
         outRoot.attrib["tileheight"] = "%s" % self.tileHeight
+        if self.infiniteMap:
+            outRoot.attrib["infinite"] = "1"
 
-        # Build the tileset
-        tileset = etree.SubElement(outRoot, "tileset")
-        tileset.attrib["firstgid"] = "1"
-        tileset.attrib["name"] = os.path.splitext(os.path.split(self.outTilesetFile)[1])[0]
-        tileset.attrib["tilewidth"] = "%s" % self.tileWidth
-        tileset.attrib["tileheight"] = "%s" % self.tileHeight
+        # Build the tilesets, one for each page.
+        for page in self.tilesetPages:
+            self.CreateXMLTileset(outRoot, page)
 
-        # Add the image information for the tileset
-        imgElem = etree.SubElement(tileset, "image")
-        imgElem.attrib["source"] = self.outTilesetFile
-        imgElem.attrib["width"] = "%s" % self.tilesetWidth
-        imgElem.attrib["height"] = "%s" % self.tilesetHeight
+        # Now iterate over the layers and pull out each one.
+        self.nextObjectID = 1
+        hasObjects = False
+        for lname in self.layerNames:
+            if self.IsSparseLayer(lname):
+                self.CreateXMLObjectGroup(outRoot, lname)
+                hasObjects = True
+            else:
+                self.CreateXMLLayer(outRoot,lname)
+        # Only maps with object groups need the next object id.
+        if hasObjects:
+            outRoot.attrib["nextobjectid"] = "%s" % self.nextObjectID
+        outTree = etree.ElementTree(outRoot)
+        return outTree
 
-        # Add any special properties that we have put into the tiles.
-        for tileID in self.tileProperties:
+    def UpdateXMLTilesetImage(self, tileset, page):
+        fileName, firstTileIdx, count, imageDimWidth, imageDimHeight = page
+        tileset.attrib["firstgid"] = "%s" % (firstTileIdx + 1)
+        imgElem = tileset.find("image")
+        imgElem.attrib["width"] = "%s" % (imageDimWidth * self.tileWidth)
+        imgElem.attrib["height"] = "%s" % (imageDimHeight * self.tileHeight)
+
+    # Add any special properties that we have put into the tiles
+    # on this page.  Tiles ids are relative to the page.
+    def AddXMLTileProperties(self, tileset, page):
+        fileName, firstTileIdx, count, imageDimWidth, imageDimHeight = page
+        tileIDs = [tileID for tileID in self.tileProperties if firstTileIdx <= tileID < firstTileIdx + count]
+        tileIDs.sort()
+        for tileID in tileIDs:
             tile = etree.SubElement(tileset,"tile")
-            tile.attrib["id"] = "%s"%tileID
+            tile.attrib["id"] = "%s"%(tileID - firstTileIdx)
             properties = etree.SubElement(tile,"properties")
             for name,value in self.tileProperties[tileID]:
                 property = etree.SubElement(properties,"property")
                 property.attrib["name"] = name
                 property.attrib["value"] = "%s"%value
 
+    def CreateXMLTileset(self, outRoot, page, position=None):
+        fileName = page[0]
+        tileset = etree.Element("tileset")
+        tileset.attrib["firstgid"] = "1"
+        tileset.attrib["name"] = os.path.splitext(os.path.split(fileName)[1])[0]
+        tileset.attrib["tilewidth"] = "%s" % self.tileWidth
+        tileset.attrib["tileheight"] = "%s" % self.tileHeight
 
-        # Now iterate over the layers and pull out each one.
-        for lname in self.layerNames:
-            self.CreateXMLLayer(outRoot,lname)
-        outTree = etree.ElementTree(outRoot)
-        return outTree
+        # Add the image information for the tileset
+        imgElem = etree.SubElement(tileset, "image")
+        imgElem.attrib["source"] = fileName
+        self.UpdateXMLTilesetImage(tileset, page)
+        self.AddXMLTileProperties(tileset, page)
+        if position is None:
+            outRoot.append(tileset)
+        else:
+            outRoot.insert(position, tileset)
+        return tileset
 
-    def CreateXMLLayer(self,outRoot,layerName):
-        layer = etree.SubElement(outRoot, "layer")
+    def CreateXMLLayer(self,outRoot,layerName,position=None):
+        if self.infiniteMap:
+            return self.CreateXMLChunkedLayer(outRoot, layerName, position)
+        layer = etree.Element("layer")
         layer.attrib["name"] = layerName
         layer.attrib["width"] = "%s" % self.layerWidth
         layer.attrib["height"] = "%s" % self.layerHeight
@@ -677,46 +2162,198 @@ class MapTiler(object):
         for idx in xrange(self.layerTiles):
             tile = etree.SubElement(data, "tile")
             gid, xForm = self.layerDict[layerName][idx]
-            if (gid == 0):
-                # This is the "empty" tile
-                tile.attrib["gid"] = "0"
+            tile.attrib["gid"] = str(self.CalculateGID(gid, xForm))
+        if position is None:
+            outRoot.append(layer)
+        else:
+            outRoot.insert(position, layer)
+        return layer
+
+    # Layers of infinite maps are split into chunks of chunkSize x
+    # chunkSize cells, and only the chunks with a tile in them are
+    # written.  Each chunk is stored as CSV.
+    def CreateXMLChunkedLayer(self, outRoot, layerName, position=None):
+        layer = etree.Element("layer")
+        layer.attrib["name"] = layerName
+        layer.attrib["width"] = "%s" % self.layerWidth
+        layer.attrib["height"] = "%s" % self.layerHeight
+        data = etree.SubElement(layer, "data")
+        data.attrib["encoding"] = "csv"
+        layerDict = self.layerDict[layerName]
+        chunkSize = self.chunkSize
+        chunks = set()
+        for idx in xrange(self.layerTiles):
+            if layerDict[idx][0] > 0:
+                col, row = self.CalculateImageRowCell(idx)
+                chunks.add((row / chunkSize, col / chunkSize))
+        for chunkRow, chunkCol in sorted(chunks):
+            chunkX = chunkCol * chunkSize
+            chunkY = chunkRow * chunkSize
+            rows = []
+            for row in xrange(chunkY, chunkY + chunkSize):
+                gids = []
+                for col in xrange(chunkX, chunkX + chunkSize):
+                    if col < self.layerWidth and row < self.layerHeight:
+                        tileIdx, xForm = layerDict[row * self.layerWidth + col]
+                        gids.append("%s" % self.CalculateGID(tileIdx, xForm))
+                    else:
+                        gids.append("0")
+                rows.append(",".join(gids))
+            chunk = etree.SubElement(data, "chunk")
+            chunk.attrib["x"] = "%s" % chunkX
+            chunk.attrib["y"] = "%s" % chunkY
+            chunk.attrib["width"] = "%s" % chunkSize
+            chunk.attrib["height"] = "%s" % chunkSize
+            chunk.text = "\n" + ",\n".join(rows) + "\n"
+        if position is None:
+            outRoot.append(layer)
+        else:
+            outRoot.insert(position, layer)
+        return layer
+
+    # True if the layer element stores one <tile> element per cell, so
+    # the gids can be updated in place when merging.
+    def IsXMLTileData(self, layer):
+        data = layer.find("data")
+        return data is not None and "encoding" not in data.attrib and data.find("chunk") is None
+
+    # True if so few of the cells in a layer are used that it should be
+    # written as an object group of tile objects instead.
+    def IsSparseLayer(self, layerName):
+        if self.sparseThreshold <= 0:
+            return False
+        layerDict = self.layerDict[layerName]
+        used = len([idx for idx in layerDict if layerDict[idx][0] > 0])
+        return used < self.sparseThreshold * self.layerTiles
+
+    # Tile objects can only be flipped horizontally and vertically, not
+    # diagonally.  A diagonal flip is the same as a vertical flip
+    # followed by a 90 degree clockwise rotation, so the flips are
+    # swapped around and the object is rotated instead.
+    # Returns (gid, rotation).
+    def CalculateObjectGID(self, tileIdx, xForm):
+        flipX, flipY, flipD = MapTiler.TRANSFORM_DICT[xForm]
+        rotation = 0
+        if flipD:
+            flipX, flipY, rotation = flipY, not flipX, 90
+        gid = self.CalculateGID(tileIdx, 0)
+        if flipX:
+            gid += MapTiler.FLIPPED_HORIZONTALLY_FLAG
+        if flipY:
+            gid += MapTiler.FLIPPED_VERTICALLY_FLAG
+        return gid, rotation
+
+    # Write a layer as an object group with one tile object for each
+    # used cell.  Tile objects are placed by their bottom left corner,
+    # which is also what they rotate around, so a rotated object is
+    # placed by the top left corner of its cell.
+    # objectIDs, if given, holds the ids to keep for the objects of
+    # cells that already had one.
+    def CreateXMLObjectGroup(self, outRoot, layerName, position=None, objectIDs=None):
+        group = etree.Element("objectgroup")
+        group.attrib["name"] = layerName
+        layerDict = self.layerDict[layerName]
+        for idx in xrange(self.layerTiles):
+            tileIdx, xForm = layerDict[idx]
+            if tileIdx == 0:
+                continue
+            col, row = self.CalculateImageRowCell(idx)
+            gid, rotation = self.CalculateObjectGID(tileIdx, xForm)
+            obj = etree.SubElement(group, "object")
+            if objectIDs is not None and idx in objectIDs:
+                obj.attrib["id"] = "%s" % objectIDs[idx]
+            else:
+                obj.attrib["id"] = "%s" % self.nextObjectID
+                self.nextObjectID += 1
+            obj.attrib["gid"] = "%s" % gid
+            obj.attrib["x"] = "%s" % (col * self.tileWidth)
+            if rotation == 0:
+                obj.attrib["y"] = "%s" % ((row + 1) * self.tileHeight)
             else:
-                tile.attrib["gid"] = str(self.UpdateGIDForRotation(gid + 1, xForm))
+                obj.attrib["y"] = "%s" % (row * self.tileHeight)
+                obj.attrib["rotation"] = "%s" % rotation
+            obj.attrib["width"] = "%s" % self.tileWidth
+            obj.attrib["height"] = "%s" % self.tileHeight
+        if position is None:
+            outRoot.append(group)
+        else:
+            outRoot.insert(position, group)
+        return group
+
+    # The ids of the tile objects in an existing object group, keyed by
+    # the cell each one is placed in (see CreateXMLObjectGroup(...)).
+    def FindXMLObjectIDs(self, group):
+        objectIDs = {}
+        for obj in group.findall("object"):
+            if "id" not in obj.attrib or "gid" not in obj.attrib:
+                continue
+            x = int(float(obj.attrib.get("x", "0")))
+            y = int(float(obj.attrib.get("y", "0")))
+            if float(obj.attrib.get("rotation", "0")) == 0:
+                y -= self.tileHeight
+            col = x / self.tileWidth
+            row = y / self.tileHeight
+            if 0 <= col < self.layerWidth and 0 <= row < self.layerHeight:
+                objectIDs[self.CalculateImageIndexFromCell(col, row)] = int(obj.attrib["id"])
+        return objectIDs
+
+    # Bring the tilesets in an existing file in line with the pages
+    # that were just exported.  Tilesets for pages that still exist
+    # are kept (along with anything added to them in Tiled), new pages
+    # are added and pages that are no longer used are removed.
+    def MergeXMLTilesets(self, outRoot):
+        existing = {}
+        position = None
+        for tileset in outRoot.findall("tileset"):
+            if position is None:
+                position = outRoot.index(tileset)
+            existing[tileset.find("image").attrib["source"]] = tileset
+        for page in self.tilesetPages:
+            fileName = page[0]
+            if fileName not in existing:
+                print "Tileset page %s DOES NOT EXIST in the existing file will be added." % fileName
+                self.CreateXMLTileset(outRoot, page, position + self.tilesetPages.index(page))
+                continue
+            tileset = existing.pop(fileName)
+            self.UpdateXMLTilesetImage(tileset, page)
+            # Remove all the properties for "ROOM" from the existing tileset
+            # and add the room tags for the new tiles to it, if nav tiles
+            # were generated.
+            if self.createNavData:
+                # Remove ROOM property for tiles.
+                for tile in tileset.findall("tile"):
+                    for properties in tile.findall("properties"):
+                        for property in properties.findall("property"):
+                            if property.attrib["name"] == self.outNavPrefix + MapTiler.PROPERTY_ROOM:
+                                properties.remove(property)
+                self.AddXMLTileProperties(tileset, page)
+        for fileName in existing:
+            print "Tileset page %s is no longer used and will be removed." % fileName
+            outRoot.remove(existing[fileName])
 
     def MergeTiledFiles(self):
         outTree = etree.parse(self.outTiledFile)
         outRoot = outTree.getroot()
 
-        # Remove all the properties for "ROOM" from the existing tileset
-        # and add the room tags for the new tiles to it, if nav tiles
-        # were generated.
-        if self.createNavData:
-            for tileset in outRoot.findall("tileset"):
-                if tileset.attrib["firstgid"] == "1":
-                    # Remove ROOM property for tiles.
-                    for tile in tileset.findall("tile"):
-                        for properties in tile.findall("properties"):
-                            for property in properties.findall("property"):
-                                if property.attrib["name"] == self.outNavPrefix + MapTiler.PROPERTY_ROOM:
-                                    properties.remove(property)
-                    # Add any special properties that we have put into the tiles.
-                    for tileID in self.tileProperties:
-                        tile = etree.SubElement(tileset, "tile")
-                        tile.attrib["id"] = "%s" % tileID
-                        properties = etree.SubElement(tile, "properties")
-                        for name, value in self.tileProperties[tileID]:
-                            property = etree.SubElement(properties, "property")
-                            property.attrib["name"] = name
-                            property.attrib["value"] = "%s" % value
-
-
-        # Find all the layers in the output tree
-        layers = outRoot.findall("layer")
+        # Update the tilesets to match the exported pages.
+        self.MergeXMLTilesets(outRoot)
+
+        # Find all the layers in the output tree, including the ones
+        # written as object groups.
+        layers = [layer for layer in outRoot if layer.tag in ["layer", "objectgroup"]]
         outLayers = { layer.attrib['name']:layer for layer in layers }
+        self.nextObjectID = int(outRoot.attrib.get("nextobjectid", "1"))
+        hasObjects = "nextobjectid" in outRoot.attrib
+        if self.infiniteMap:
+            outRoot.attrib["infinite"] = "1"
+        elif "infinite" in outRoot.attrib:
+            del outRoot.attrib["infinite"]
         # For every layer that already exists, just update the GID data.
         # Otherwise, add a new layer to the tree with the data.
         for lname in self.layerNames:
-            if lname in outLayers:
+            sparse = self.IsSparseLayer(lname)
+            if (lname in outLayers and outLayers[lname].tag == "layer" and not sparse and
+                    not self.infiniteMap and self.IsXMLTileData(outLayers[lname])):
                 if self.verbose:
                     print "Layer %s will be updated."%lname
                 data = outLayers[lname].find("data")
@@ -724,19 +2361,40 @@ class MapTiler(object):
                 for idx in xrange(len(tiles)):
                     tile = tiles[idx]
                     gid, xForm = self.layerDict[lname][idx]
-                    if (gid == 0):
-                        # This is the "empty" tile
-                        tile.attrib["gid"] = "0"
-                    else:
-                        tile.attrib["gid"] = str(self.UpdateGIDForRotation(gid + 1, xForm))
+                    tile.attrib["gid"] = str(self.CalculateGID(gid, xForm))
+            elif lname in outLayers:
+                # Object groups, chunked layers and layers changing
+                # between them are written again in the same place.
+                if self.verbose:
+                    print "Layer %s will be replaced."%lname
+                position = outRoot.index(outLayers[lname])
+                outRoot.remove(outLayers[lname])
+                if sparse:
+                    # Objects in cells that already had one keep their
+                    # ids, so references to them in Tiled still work.
+                    objectIDs = None
+                    if outLayers[lname].tag == "objectgroup":
+                        objectIDs = self.FindXMLObjectIDs(outLayers[lname])
+                    self.CreateXMLObjectGroup(outRoot, lname, position, objectIDs)
+                    hasObjects = True
+                else:
+                    self.CreateXMLLayer(outRoot, lname, position)
             else:
                 # Regardless of "verbosity", let the user know we are
                 # adding a whole new layer to their map.
                 print "Layer %s DOES NOT EXIST in the existing file will be added."%lname
-                self.CreateXMLLayer(outRoot, lname)
+                if sparse:
+                    self.CreateXMLObjectGroup(outRoot, lname)
+                    hasObjects = True
+                else:
+                    self.CreateXMLLayer(outRoot, lname)
+        if hasObjects:
+            outRoot.attrib["nextobjectid"] = "%s" % self.nextObjectID
         return outTree
 
     def ExportTiledFile(self):
+        if not self.exportTiledFile:
+            return True
         if os.path.exists(self.outTiledFile):
             if self.mergeExisting:
                 outTree = self.MergeTiledFiles()
@@ -749,6 +2407,119 @@ class MapTiler(object):
         print "Saving tiled file to %s." % self.outTiledFile
         return True
 
+    # Split every layer into blocks of size x size cells and find the
+    # distinct blocks (meta tiles) over all the layers.  Each meta tile
+    # is a tuple of the (tileIdx, xForm) of its cells in row order, and
+    # cells past the edge of the map are empty.  Meta tile 0 is always
+    # the empty block.  Returns (metaTiles, layers), where layers has
+    # the meta tile of every block of each layer in row order.
+    def CreateMetaTiles(self, size):
+        metaWidth = (self.layerWidth + size - 1) / size
+        metaHeight = (self.layerHeight + size - 1) / size
+        empty = ((0, 0),) * (size * size)
+        metaTiles = [empty]
+        metaDict = { empty:0 }
+        layers = {}
+        for lname in self.layerNames:
+            layerDict = self.layerDict[lname]
+            refs = []
+            for metaRow in xrange(metaHeight):
+                for metaCol in xrange(metaWidth):
+                    block = []
+                    for row in xrange(metaRow * size, (metaRow + 1) * size):
+                        for col in xrange(metaCol * size, (metaCol + 1) * size):
+                            if col < self.layerWidth and row < self.layerHeight:
+                                block.append(layerDict.get(self.CalculateImageIndexFromCell(col, row), (0, 0)))
+                            else:
+                                block.append((0, 0))
+                    block = tuple(block)
+                    if block not in metaDict:
+                        metaDict[block] = len(metaTiles)
+                        metaTiles.append(block)
+                    refs.append(metaDict[block])
+            layers[lname] = refs
+        return metaTiles, layers
+
+    # Rebuild the (tileIdx, xForm) of every cell of each layer from the
+    # meta tiles made by CreateMetaTiles(...).
+    def ExpandMetaTiles(self, size, metaTiles, layers):
+        metaWidth = (self.layerWidth + size - 1) / size
+        result = {}
+        for lname in layers:
+            refs = layers[lname]
+            cells = {}
+            for blockIdx in xrange(len(refs)):
+                block = metaTiles[refs[blockIdx]]
+                col0 = (blockIdx % metaWidth) * size
+                row0 = (blockIdx / metaWidth) * size
+                for pos in xrange(size * size):
+                    col = col0 + pos % size
+                    row = row0 + pos / size
+                    if col < self.layerWidth and row < self.layerHeight:
+                        cells[self.CalculateImageIndexFromCell(col, row)] = block[pos]
+            result[lname] = cells
+        return result
+
+    # The number of values needed to store the layers as meta tiles:
+    # one for each block of each layer and one for each cell of each
+    # meta tile.
+    def CountMetaTileValues(self, size, metaTiles, layers):
+        return sum([len(refs) for refs in layers.itervalues()]) + len(metaTiles) * size * size
+
+    # Find the meta tiles (trying each size for "auto"), check that they
+    # expand back to the same layers and save them as JSON.  The cells of
+    # the meta tiles are saved as gids so they can be used with the
+    # tileset pages directly.
+    def ExportMetaTiles(self):
+        if self.metaTileSize == MapTiler.META_TILE_AUTO:
+            sizes = MapTiler.META_TILE_SIZES
+        else:
+            sizes = [int(self.metaTileSize)]
+        cellValues = len(self.layerNames) * self.layerTiles
+        best = None
+        for size in sizes:
+            metaTiles, layers = self.CreateMetaTiles(size)
+            values = self.CountMetaTileValues(size, metaTiles, layers)
+            print "Meta tiles %d x %d: %d distinct blocks, %d values stored (%4.1f%% of %d cells)." % (
+                size, size, len(metaTiles), values, 100.0 * values / cellValues, cellValues)
+            if best is None or values < best[0]:
+                best = (values, size, metaTiles, layers)
+        values, size, metaTiles, layers = best
+        expanded = self.ExpandMetaTiles(size, metaTiles, layers)
+        for lname in self.layerNames:
+            layerDict = self.layerDict[lname]
+            for idx in xrange(self.layerTiles):
+                if expanded[lname][idx] != layerDict.get(idx, (0, 0)):
+                    col, row = self.CalculateImageRowCell(idx)
+                    print "Meta tiles for layer %s do not expand back to cell (%d,%d)." % (lname, col, row)
+                    return False
+        metaData = {
+            "tileWidth":self.tileWidth,
+            "tileHeight":self.tileHeight,
+            "layerWidth":self.layerWidth,
+            "layerHeight":self.layerHeight,
+            "metaTileSize":size,
+            "metaWidth":(self.layerWidth + size - 1) / size,
+            "metaHeight":(self.layerHeight + size - 1) / size,
+            "tilesets":[{ "firstgid":page[1] + 1, "image":page[0] } for page in self.tilesetPages],
+            "metaTiles":[[self.CalculateGID(tileIdx, xForm) for tileIdx, xForm in block] for block in metaTiles],
+            "layers":{ lname:layers[lname] for lname in self.layerNames },
+        }
+        with open(self.metaTileFile, "w") as outFile:
+            json.dump(metaData, outFile, sort_keys=True)
+        print "Saving %d x %d meta tiles to %s (%d values instead of %d, %4.1f%% smaller)." % (
+            size, size, self.metaTileFile, values, cellValues, 100.0 * (cellValues - values) / cellValues)
+        self.stats.SetCounter("Meta Tiles", len(metaTiles))
+        self.stats.SetCounter("Meta Tile Size", size)
+        return True
+
+    # Run one stage of the pipeline, recording its statistics.
+    def RunStage(self, name, method):
+        self.stats.BeginStage(name)
+        result = method()
+        self.stats.EndStage(name)
+        return result
+
     def SecondsToHMS(self,seconds):
         hours = divmod(seconds, 3600)  # hours
         minutes = divmod(hours[1], 60)  # minutes
@@ -760,6 +2531,9 @@ class MapTiler(object):
     # this would mean the tile set has been created, and that could
     # take a while.
     def CheckMergingFiles(self):
+        if not self.exportTiledFile:
+            # Nothing will be written, so nothing is merged.
+            return True
         if not os.path.exists(self.outTiledFile):
             # If the file does not exist, there is nto a problem.
             return True
@@ -786,42 +2560,45 @@ class MapTiler(object):
                 self.layerHeight)
             return False
 
-        # Currently,this script produces only ONE tileset
-        # and it will take some work to move them all around
-        # and merge them.  So for now at least, the script will
-        # fail if the tiled file contains more than one tileset.
+        # This script only knows how to merge the tilesets (pages)
+        # that it produced itself.  It will take some work to move
+        # other tilesets around and merge them.  So for now at least,
+        # the script will fail if the tiled file contains any other
+        # tileset.
         tilesets = inRoot.findall("tileset")
         if len(tilesets) == 0:
             print "Existing Tiled file has no tileset in it.  Cannot merge."
             return False
-        if len(tilesets) > 1:
-            print "Existing Tiled file has more than one tileset in it."
-            return False
-        images = tilesets[0].findall("image")
-        if len(images) == 0:
-            print "Existing tileset has no image associated with it."
-            return False
-        if len(images) > 1:
-            print "Existing tileset is connected to more than one image."
-            return False
-        imageSrc = images[0].attrib['source']
-        if imageSrc != self.outTilesetFile:
-            print "Existing tileset uses image %s, not output image %s."%(imageSrc,self.outTilesetFile)
-            return False
+        for tileset in tilesets:
+            images = tileset.findall("image")
+            if len(images) == 0:
+                print "Existing tileset has no image associated with it."
+                return False
+            if len(images) > 1:
+                print "Existing tileset is connected to more than one image."
+                return False
+            imageSrc = images[0].attrib['source']
+            if not self.IsTilesetPageFile(imageSrc):
+                print "Existing tileset uses image %s, not output image %s."%(imageSrc,self.outTilesetFile)
+                return False
         return True
 
     def CheckExistingFiles(self):
         if self.mergeExisting and self.overwriteExisting:
             print "Cannot have options to merge and overwrite existing files."
             return False
-        if os.path.exists(self.outTilesetFile):
+        if self.exportTileset and os.path.exists(self.outTilesetFile):
             if not self.mergeExisting and not self.overwriteExisting:
                 print "Output %s exists and would be modified.  Use options to control this."%self.outTilesetFile
                 return False
-        if os.path.exists(self.outTiledFile):
+        if self.exportTiledFile and os.path.exists(self.outTiledFile):
             if not self.mergeExisting and not self.overwriteExisting:
                 print "Output %s exists and would be modified.  Use options to control this."%self.outTiledFile
                 return False
+        if self.metaTileFile and os.path.exists(self.metaTileFile):
+            if not self.mergeExisting and not self.overwriteExisting:
+                print "Output %s exists and would be modified.  Use options to control this."%self.metaTileFile
+                return False
         return True
 
     def CheckNavArguments(self):
@@ -862,58 +2639,241 @@ class MapTiler(object):
                       wallLayer,
                       portalLayer,
                       doorLayer,
-                      outNavPrefix):
-
+                      outNavPrefix,
+                      maxAtlasSize=0,
+                      atlasPacking=PACKING_POW2,
+                      reportPacking=False,
+                      tileOrder=ORDER_DISCOVERY,
+                      pngCompressLevel=6,
+                      pngStrategy="default",
+                      optimizeTileset=False,
+                      mipLevels=0,
+                      statsFile=None,
+                      debug=False,
+                      progressRate=2.0,
+                      checkpointFile=None,
+                      checkpointInterval=60,
+                      resume=False,
+                      estimate=False,
+                      sampleFraction=0.1,
+                      sparseThreshold=0,
+                      infiniteMap=False,
+                      chunkSize=16,
+                      metaTileFile=None,
+                      metaTileSize=META_TILE_AUTO,
+                      maxChannelDelta=0,
+                      maxDiffPixels=0,
+                      searchTiles=False,
+                      searchSizes="16,24,32,48,64",
+                      searchOffsetStep=0,
+                      incrementalRooms=False):
+
+        config = MapTilerConfig(tileWidth=tileWidth,
+                                tileHeight=tileHeight,
+                                tileOffX=tileOffX,
+                                tileOffY=tileOffY,
+                                tileInsetX=tileInsetX,
+                                tileInsetY=tileInsetY,
+                                fileList=fileList,
+                                inputFilePattern=inputFilePattern,
+                                outTilesetFile=outTilesetFile,
+                                outTiledFile=outTiledFile,
+                                forceSquareTileset=forceSquareTileset,
+                                verbose=verbose,
+                                mergeExisting=mergeExisting,
+                                overwriteExisting=overwriteExisting,
+                                floorLayer=floorLayer,
+                                wallLayer=wallLayer,
+                                portalLayer=portalLayer,
+                                doorLayer=doorLayer,
+                                outNavPrefix=outNavPrefix,
+                                maxAtlasSize=maxAtlasSize,
+                                atlasPacking=atlasPacking,
+                                reportPacking=reportPacking,
+                                tileOrder=tileOrder,
+                                pngCompressLevel=pngCompressLevel,
+                                pngStrategy=pngStrategy,
+                                optimizeTileset=optimizeTileset,
+                                mipLevels=mipLevels,
+                                statsFile=statsFile,
+                                debug=debug,
+                                progressRate=progressRate,
+                                checkpointFile=checkpointFile,
+                                checkpointInterval=checkpointInterval,
+                                resume=resume,
+                                estimate=estimate,
+                                sampleFraction=sampleFraction,
+                                sparseThreshold=sparseThreshold,
+                                infiniteMap=infiniteMap,
+                                chunkSize=chunkSize,
+                                metaTileFile=metaTileFile,
+                                metaTileSize=metaTileSize,
+                                maxChannelDelta=maxChannelDelta,
+                                maxDiffPixels=maxDiffPixels,
+                                searchTiles=searchTiles,
+                                searchSizes=searchSizes,
+                                searchOffsetStep=searchOffsetStep,
+                                incrementalRooms=incrementalRooms)
+        return self.Process(config)
+
+    # Copy the settings in a MapTilerConfig onto the tiler.
+    def Configure(self, config):
+        self.config = config
+        self.tileOffX = config.tileOffX
+        self.tileOffY = config.tileOffY
+        self.tileInsetX = config.tileInsetX
+        self.tileInsetY = config.tileInsetY
+        self.tileWidth = config.tileWidth
+        self.tileHeight = config.tileHeight
+        self.outTilesetFile = config.outTilesetFile
+        self.outTiledFile = config.outTiledFile
+        self.exportTileset = config.exportTileset
+        self.exportTiledFile = config.exportTiledFile
+        self.forceSquareTileset = config.forceSquareTileset
+        self.maxAtlasSize = config.maxAtlasSize
+        self.atlasPacking = config.atlasPacking
+        self.reportPacking = config.reportPacking
+        self.tileOrder = config.tileOrder
+        self.pngCompressLevel = config.pngCompressLevel
+        self.pngStrategy = config.pngStrategy
+        self.optimizeTileset = config.optimizeTileset
+        self.mipLevels = config.mipLevels
+        self.statsFile = config.statsFile
+        self.checkpointFile = config.checkpointFile
+        self.checkpointInterval = config.checkpointInterval
+        self.resume = config.resume
+        self.estimate = config.estimate
+        self.sampleFraction = config.sampleFraction
+        self.sparseThreshold = config.sparseThreshold
+        self.infiniteMap = config.infiniteMap
+        self.chunkSize = config.chunkSize
+        self.metaTileFile = config.metaTileFile
+        self.metaTileSize = config.metaTileSize
+        self.maxChannelDelta = config.maxChannelDelta
+        self.maxDiffPixels = config.maxDiffPixels
+        self.searchTiles = config.searchTiles
+        self.searchSizes = config.searchSizes
+        self.searchOffsetStep = config.searchOffsetStep
+        self.incrementalRooms = config.incrementalRooms
+        self.verbose = config.verbose or config.debug
+        level = ProgressReporter.LEVEL_QUIET
+        if config.debug:
+            level = ProgressReporter.LEVEL_DEBUG
+        elif config.verbose:
+            level = ProgressReporter.LEVEL_PROGRESS
+        self.progress = ProgressReporter(level, config.progressRate)
+        self.mergeExisting = config.mergeExisting
+        self.overwriteExisting = config.overwriteExisting
+        self.outNavPrefix = config.outNavPrefix
+        self.navWallLayer = config.wallLayer
+        self.navPortalLayer = config.portalLayer
+        self.navFloorLayer = config.floorLayer
+        self.navDoorLayer = config.doorLayer
+
+    # Run everything described by a MapTilerConfig.  The results stay
+    # in the tiler (imageDict, layerDict, tileProperties, ...) after it
+    # is done, whether or not they are exported.
+    def Process(self, config):
         self.Reset()
-
-        self.tileOffX = tileOffX
-        self.tileOffY = tileOffY
-        self.tileInsetX = tileInsetX
-        self.tileInsetY = tileInsetY
-        self.tileWidth = tileWidth
-        self.tileHeight = tileHeight
-        self.outTilesetFile = outTilesetFile
-        self.outTiledFile = outTiledFile
-        self.forceSquareTileset = forceSquareTileset
-        self.verbose = verbose
-        self.mergeExisting = mergeExisting
-        self.overwriteExisting = overwriteExisting
+        self.Configure(config)
         self.startTime = datetime.datetime.now()
-        self.outNavPrefix = outNavPrefix
-        self.navWallLayer = wallLayer
-        self.navPortalLayer = portalLayer
-        self.navFloorLayer = floorLayer
-        self.navDoorLayer = doorLayer
 
         # Main execution path
-        if not self.CheckExistingFiles():
+        if self.atlasPacking not in MapTiler.PACKING_LIST:
+            print "Unknown atlas packing %s.  Must be one of %s." % (self.atlasPacking, ", ".join(MapTiler.PACKING_LIST))
+            print "Unable to continue."
+            return False
+        if self.tileOrder not in MapTiler.ORDER_LIST:
+            print "Unknown tile order %s.  Must be one of %s." % (self.tileOrder, ", ".join(MapTiler.ORDER_LIST))
             print "Unable to continue."
             return False
-        if not self.CreateLayerFiles(inputFilePattern,fileList):
+        if self.pngStrategy not in MapTiler.PNG_STRATEGY_LIST:
+            print "Unknown png strategy %s.  Must be one of %s." % (self.pngStrategy, ", ".join(MapTiler.PNG_STRATEGY_LIST))
+            print "Unable to continue."
+            return False
+        if self.pngCompressLevel < 0 or self.pngCompressLevel > 9:
+            print "The png compression level must be between 0 and 9, not %d." % self.pngCompressLevel
+            print "Unable to continue."
+            return False
+        if self.resume and not self.checkpointFile:
+            print "A --checkpoint file is needed to resume."
+            print "Unable to continue."
+            return False
+        if config.progressRate <= 0:
+            print "The progress rate must be more than 0, not %s." % config.progressRate
+            print "Unable to continue."
+            return False
+        if self.sampleFraction <= 0 or self.sampleFraction > 1:
+            print "The sample fraction must be more than 0 and at most 1, not %s." % self.sampleFraction
+            print "Unable to continue."
+            return False
+        if self.chunkSize <= 0:
+            print "The chunk size must be more than 0, not %s." % self.chunkSize
+            print "Unable to continue."
+            return False
+        if self.metaTileSize != MapTiler.META_TILE_AUTO and \
+                (not str(self.metaTileSize).isdigit() or int(self.metaTileSize) < 2):
+            print "The meta tile size must be %s or at least 2, not %s." % (MapTiler.META_TILE_AUTO, self.metaTileSize)
+            print "Unable to continue."
+            return False
+        if self.maxChannelDelta < 0 or self.maxChannelDelta > 255 or self.maxDiffPixels < 0:
+            print "The max channel delta must be between 0 and 255 and the max diff pixels at least 0."
+            print "Unable to continue."
+            return False
+        if self.searchTiles and (self.ParseSearchSizes(self.searchSizes) is None or self.searchOffsetStep < 0):
+            print "The search sizes must be a list of N or WxH (e.g. 16,32x16) and the offset step at least 0."
+            print "Unable to continue."
+            return False
+        # An estimate or search does not write anything.
+        if not self.estimate and not self.searchTiles and not self.CheckExistingFiles():
+            print "Unable to continue."
+            return False
+        if not self.CreateLayerFiles(config.inputFilePattern, list(config.fileList)):
             print "Unable to continue."
             return False
         if not self.CheckNavArguments():
             print "Unable to continue."
             return False
-        if not self.CheckImageSizes():
+        if self.searchTiles:
+            if not self.RunStage("SearchTileSizes", self.SearchTileSizes):
+                print "Unable to continue."
+                return False
+            self.stats.PrintTable()
+            return True
+        if not self.RunStage("CheckImageSizes", self.CheckImageSizes):
             print "Unable to continue."
             return False
-        if not self.CheckMergingFiles():
+        if self.estimate:
+            if not self.RunStage("EstimateTileset", self.EstimateTileset):
+                print "Unable to continue."
+                return False
+            self.stats.PrintTable()
+            return True
+        if not self.RunStage("CheckMergingFiles", self.CheckMergingFiles):
             print "Unable to continue."
             return False
-        if not self.CreateTileset():
+        if not self.RunStage("CreateTileset", self.CreateTileset):
             print "Unable to continue."
             return False
-        if not self.CreateNavData():
+        if not self.RunStage("CreateNavData", self.CreateNavData):
             print "Unable to continue."
             return False
         # self.DumpTilemap()
-        if not self.ExportTileset():
+        if not self.RunStage("ExportTileset", self.ExportTileset):
             print "Unable to continue."
             return False
-        if not self.ExportTiledFile():
+        if not self.RunStage("ExportTiledFile", self.ExportTiledFile):
             print "Unable to continue."
             return False
+        if self.incrementalRooms:
+            if not self.RunStage("ReportRoomGIDs", self.ReportRoomGIDs):
+                print "Unable to continue."
+                return False
+        if self.metaTileFile:
+            if not self.RunStage("ExportMetaTiles", self.ExportMetaTiles):
+                print "Unable to continue."
+                return False
+        self.RemoveCheckpoint()
 
         # Report execution time.
         self.stopTime = datetime.datetime.now()
@@ -922,8 +2882,71 @@ class MapTiler(object):
         print "Started: ",self.startTime
         print "Stopped: ",self.stopTime
         print "Total Run Time: [%d Hrs: %d Min: %d Sec]"%(h,m,s)
+        self.stats.PrintTable()
+        if self.statsFile:
+            self.stats.ExportJSON(self.statsFile)
         return True
 
+# All the settings for a MapTiler run, with the same names and defaults
+# as the options to MapTiler.py.  Any of them can be passed in as
+# keyword arguments, e.g. MapTilerConfig(tileWidth=32, fileList=[...]).
+# Set exportTileset or exportTiledFile to False to keep the results in
+# memory only (see MapPipeline.py).
+class MapTilerConfig(object):
+    def __init__(self, **settings):
+        self.tileWidth = 64
+        self.tileHeight = 64
+        self.tileOffX = 0
+        self.tileOffY = 0
+        self.tileInsetX = 0
+        self.tileInsetY = 0
+        self.fileList = []
+        self.inputFilePattern = None
+        self.outTilesetFile = "tileset.png"
+        self.outTiledFile = "tiled.tmx"
+        self.exportTileset = True
+        self.exportTiledFile = True
+        self.forceSquareTileset = False
+        self.verbose = False
+        self.debug = False
+        self.progressRate = 2.0
+        self.mergeExisting = False
+        self.overwriteExisting = False
+        self.floorLayer = None
+        self.wallLayer = None
+        self.portalLayer = None
+        self.doorLayer = None
+        self.outNavPrefix = "NAV_"
+        self.maxAtlasSize = 0
+        self.atlasPacking = MapTiler.PACKING_POW2
+        self.reportPacking = False
+        self.tileOrder = MapTiler.ORDER_DISCOVERY
+        self.pngCompressLevel = 6
+        self.pngStrategy = "default"
+        self.optimizeTileset = False
+        self.mipLevels = 0
+        self.statsFile = None
+        self.checkpointFile = None
+        self.checkpointInterval = 60
+        self.resume = False
+        self.estimate = False
+        self.sampleFraction = 0.1
+        self.sparseThreshold = 0
+        self.infiniteMap = False
+        self.chunkSize = 16
+        self.metaTileFile = None
+        self.metaTileSize = MapTiler.META_TILE_AUTO
+        self.maxChannelDelta = 0
+        self.maxDiffPixels = 0
+        self.searchTiles = False
+        self.searchSizes = "16,24,32,48,64"
+        self.searchOffsetStep = 0
+        self.incrementalRooms = False
+        for name in settings:
+            if not hasattr(self, name):
+                raise TypeError("Unknown MapTiler setting %s." % name)
+            setattr(self, name, settings[name])
+
 if __name__ == "__main__":
     arguments = docopt.docopt(__doc__)
     # When testing is done, this is where
@@ -973,6 +2996,33 @@ if __name__ == "__main__":
     floorLayer = arguments['--floorLayer']
     doorLayer = arguments['--doorLayer']
     outNavPrefix = arguments['--outNavPrefix']
+    maxAtlasSize = int(arguments['--maxAtlasSize'])
+    atlasPacking = arguments['--atlasPacking']
+    reportPacking = arguments['--reportPacking']
+    tileOrder = arguments['--tileOrder']
+    pngCompressLevel = int(arguments['--pngCompressLevel'])
+    pngStrategy = arguments['--pngStrategy']
+    optimizeTileset = arguments['--optimizeTileset']
+    mipLevels = int(arguments['--mipLevels'])
+    statsFile = arguments['--statsFile']
+    debug = arguments['--debug']
+    progressRate = float(arguments['--progressRate'])
+    checkpointFile = arguments['--checkpoint']
+    checkpointInterval = float(arguments['--checkpointInterval'])
+    resume = arguments['--resume']
+    estimate = arguments['--estimate']
+    sampleFraction = float(arguments['--sampleFraction'])
+    sparseThreshold = float(arguments['--sparseThreshold'])
+    infiniteMap = arguments['--infiniteMap']
+    chunkSize = int(arguments['--chunkSize'])
+    metaTileFile = arguments['--metaTileFile']
+    metaTileSize = arguments['--metaTileSize']
+    maxChannelDelta = int(arguments['--maxChannelDelta'])
+    maxDiffPixels = int(arguments['--maxDiffPixels'])
+    searchTiles = arguments['--searchTiles']
+    searchSizes = arguments['--searchSizes']
+    searchOffsetStep = int(arguments['--searchOffsetStep'])
+    incrementalRooms = arguments['--incrementalRooms']
 
     # Now execute the parser
     parser = MapTiler()
@@ -994,4 +3044,31 @@ if __name__ == "__main__":
                          wallLayer,
                          portalLayer,
                          doorLayer,
-                         outNavPrefix)
+                         outNavPrefix,
+                         maxAtlasSize,
+                         atlasPacking,
+                         reportPacking,
+                         tileOrder,
+                         pngCompressLevel,
+                         pngStrategy,
+                         optimizeTileset,
+                         mipLevels,
+                         statsFile,
+                         debug,
+                         progressRate,
+                         checkpointFile,
+                         checkpointInterval,
+                         resume,
+                         estimate,
+                         sampleFraction,
+                         sparseThreshold,
+                         infiniteMap,
+                         chunkSize,
+                         metaTileFile,
+                         metaTileSize,
+                         maxChannelDelta,
+                         maxDiffPixels,
+                         searchTiles,
+                         searchSizes,
+                         searchOffsetStep,
+                         incrementalRooms)
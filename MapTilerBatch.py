@@ -0,0 +1,429 @@
+# -------------------------------------------------------------
+# License
+# -------------------------------------------------------------
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to
+# whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall
+# be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# -------------------------------------------------------------
+
+
+"""
+Run MapTiler.py over several maps drawn with the same art and build one
+tileset that is shared by all of them, with one Tiled (.tmx) file per
+map that uses it.
+
+The maps are listed in a JSON manifest.  The settings at the top level
+are shared by every map and have the same names (and defaults) as the
+MapTiler.py options.  Each map lists its layer images (or a file
+pattern), the Tiled file to write and, optionally, its nav layers:
+
+{
+    "tileWidth":32,
+    "tileHeight":32,
+    "outTileset":"shared.png",
+    "maxAtlasSize":2048,
+    "maps":[
+        {
+            "outTiled":"level1.tmx",
+            "layers":["level1/Floors.png", "level1/Walls.png"],
+            "floorLayer":"Floors",
+            "wallLayer":"Walls",
+            "portalLayer":"Portals",
+            "doorLayer":"Doors"
+        },
+        {
+            "outTiled":"level2.tmx",
+            "filePattern":"level2/*.png"
+        }
+    ]
+}
+
+Relative paths are relative to the directory of the manifest.
+
+Each map is tiled on its own (in parallel) exactly as MapTiler.py would
+do it.  The unique tiles of every map are then merged into the shared
+tileset, where a tile matches an existing one if it is the same under
+any rotation/reflection.  Tiles are placed in the shared tileset in the
+order the maps are listed (or by frequency over all the maps).  The
+"locality" tile order is not supported, since the maps do not share a
+layout.
+
+Usage: MapTilerBatch.py  <manifest>
+                         [--processes=PROCESSES]
+                         [--statsFile=STATSFILE]
+                         [--verbose]
+
+Options:
+    manifest                    The JSON file listing the maps and the
+                                shared settings.
+    --processes=PROCESSES       The number of maps to tile at the same
+                                time.  0 uses one per CPU.  1 does not
+                                start any extra processes.
+                                [Default: 0]
+    --statsFile=STATSFILE       Also save the stage statistics and
+                                counters to this file as JSON.
+    --verbose                   Print progress for each map.
+
+Website:        http://www.NonlinearIdeas.com
+Repository:     https://github.com/NonlinearIdeas/Map-Tiler
+Report Issues:  https://github.com/NonlinearIdeas/Map-Tiler
+License:        MIT License - See specific text in source code.
+Copyright:      Copyright (c) 2015 Nonlinear Ideas Inc (contact@nlideas.com)
+"""
+
+import os
+import json
+import datetime
+import multiprocessing
+import Image
+import docopt
+from MapTiler import MapTiler, MapTilerConfig
+
+# The shared settings in the manifest and their defaults.  These match
+# the MapTiler.py options.
+BATCH_SETTINGS = {
+    "tileWidth":64,
+    "tileHeight":64,
+    "tileOffX":0,
+    "tileOffY":0,
+    "tileInsetX":0,
+    "tileInsetY":0,
+    "outTileset":"tileset.png",
+    "forceSquareTileset":False,
+    "maxAtlasSize":0,
+    "atlasPacking":MapTiler.PACKING_POW2,
+    "tileOrder":MapTiler.ORDER_DISCOVERY,
+    "pngCompressLevel":6,
+    "pngStrategy":"default",
+    "optimizeTileset":False,
+    "mipLevels":0,
+    "sparseThreshold":0,
+    "infiniteMap":False,
+    "chunkSize":16,
+    "outNavPrefix":"NAV_",
+    "mergeExisting":False,
+    "overwriteExisting":False,
+    "incrementalRooms":False,
+}
+
+
+# Set up a MapTiler for one map of the batch (or for the shared tileset
+# if the map is None).
+def CreateMapTiler(settings, mapEntry, verbose):
+    config = MapTilerConfig(tileWidth=settings["tileWidth"],
+                            tileHeight=settings["tileHeight"],
+                            tileOffX=settings["tileOffX"],
+                            tileOffY=settings["tileOffY"],
+                            tileInsetX=settings["tileInsetX"],
+                            tileInsetY=settings["tileInsetY"],
+                            outTilesetFile=settings["outTileset"],
+                            outTiledFile=None,
+                            forceSquareTileset=settings["forceSquareTileset"],
+                            maxAtlasSize=settings["maxAtlasSize"],
+                            atlasPacking=settings["atlasPacking"],
+                            tileOrder=settings["tileOrder"],
+                            pngCompressLevel=settings["pngCompressLevel"],
+                            pngStrategy=settings["pngStrategy"],
+                            optimizeTileset=settings["optimizeTileset"],
+                            mipLevels=settings["mipLevels"],
+                            sparseThreshold=settings["sparseThreshold"],
+                            infiniteMap=settings["infiniteMap"],
+                            chunkSize=settings["chunkSize"],
+                            outNavPrefix=settings["outNavPrefix"],
+                            mergeExisting=settings["mergeExisting"],
+                            overwriteExisting=settings["overwriteExisting"],
+                            incrementalRooms=settings["incrementalRooms"],
+                            verbose=verbose)
+    if mapEntry is not None:
+        config.outTiledFile = mapEntry["outTiled"]
+        # The Tiled file refers to the shared tileset relative to
+        # where the Tiled file is.
+        tiledDir = os.path.dirname(os.path.abspath(mapEntry["outTiled"]))
+        config.outTilesetFile = os.path.relpath(os.path.abspath(settings["outTileset"]), tiledDir)
+        config.floorLayer = mapEntry.get("floorLayer")
+        config.wallLayer = mapEntry.get("wallLayer")
+        config.portalLayer = mapEntry.get("portalLayer")
+        config.doorLayer = mapEntry.get("doorLayer")
+    tiler = MapTiler()
+    tiler.Configure(config)
+    tiler.layerDict = {}
+    tiler.layerNames = []
+    return tiler
+
+
+# Tile one map of the batch.  This is run in a worker process, so
+# everything it returns must be picklable (the tiles are returned as raw
+# pixel data).  Returns None if the map could not be tiled.
+def TileMap(job):
+    settings, mapEntry, verbose = job
+    tiler = CreateMapTiler(settings, mapEntry, verbose)
+    print "Tiling map %s." % mapEntry["outTiled"]
+    if not tiler.CreateLayerFiles(mapEntry.get("filePattern"), list(mapEntry.get("layers", []))):
+        return None
+    if not tiler.CheckNavArguments():
+        return None
+    for name, method in [("CheckImageSizes", tiler.CheckImageSizes),
+                         ("CheckMergingFiles", tiler.CheckMergingFiles),
+                         ("CreateTileset", tiler.CreateTileset),
+                         ("CreateNavData", tiler.CreateNavData)]:
+        if not tiler.RunStage(name, method):
+            print "Map %s failed in %s." % (mapEntry["outTiled"], name)
+            return None
+    tiles = {}
+    for tileIdx in tiler.imageDict:
+        tile = tiler.imageDict[tileIdx]
+        tiles[tileIdx] = (tile.mode, tile.size, tile.tobytes())
+    print "Map %s has %d unique tiles in %d cells." % (
+        mapEntry["outTiled"], tiler.tilesCreated, tiler.tilesPossible)
+    return {
+        "tiles":tiles,
+        "tileProperties":tiler.tileProperties,
+        "layerNames":tiler.layerNames,
+        "layerDict":tiler.layerDict,
+        "layerWidth":tiler.layerWidth,
+        "layerHeight":tiler.layerHeight,
+        "createNavData":tiler.createNavData,
+        "tilesCreated":tiler.tilesCreated,
+        "tilesPossible":tiler.tilesPossible,
+        "counters":tiler.stats.counters,
+    }
+
+
+class MapTilerBatch(object):
+    def __init__(self):
+        pass
+
+    # Read the manifest, fill in the default settings and make the
+    # paths relative to the manifest.
+    def LoadManifest(self, manifestFile):
+        if not os.path.exists(manifestFile):
+            print "Manifest %s does not exist." % manifestFile
+            return False
+        with open(manifestFile, "r") as inFile:
+            manifest = json.load(inFile)
+        baseDir = os.path.dirname(manifestFile)
+        self.settings = dict(BATCH_SETTINGS)
+        for key in manifest:
+            if key == "maps":
+                continue
+            if key not in BATCH_SETTINGS:
+                print "Unknown setting %s in manifest %s." % (key, manifestFile)
+                return False
+            self.settings[key] = manifest[key]
+        self.settings["outTileset"] = os.path.join(baseDir, self.settings["outTileset"])
+        self.maps = []
+        for mapEntry in manifest.get("maps", []):
+            if "outTiled" not in mapEntry:
+                print "Every map in manifest %s needs an outTiled file." % manifestFile
+                return False
+            mapEntry = dict(mapEntry)
+            mapEntry["outTiled"] = os.path.join(baseDir, mapEntry["outTiled"])
+            mapEntry["layers"] = [os.path.join(baseDir, fname) for fname in mapEntry.get("layers", [])]
+            if mapEntry.get("filePattern"):
+                mapEntry["filePattern"] = os.path.join(baseDir, mapEntry["filePattern"])
+            self.maps.append(mapEntry)
+        if len(self.maps) == 0:
+            print "Manifest %s has no maps in it." % manifestFile
+            return False
+        return True
+
+    def CheckSettings(self):
+        if self.settings["atlasPacking"] not in MapTiler.PACKING_LIST:
+            print "Unknown atlas packing %s.  Must be one of %s." % (
+                self.settings["atlasPacking"], ", ".join(MapTiler.PACKING_LIST))
+            return False
+        if self.settings["tileOrder"] == MapTiler.ORDER_LOCALITY:
+            print "The %s tile order cannot be used for a batch of maps." % MapTiler.ORDER_LOCALITY
+            return False
+        if self.settings["tileOrder"] not in MapTiler.ORDER_LIST:
+            print "Unknown tile order %s.  Must be one of %s." % (
+                self.settings["tileOrder"], ", ".join(MapTiler.ORDER_LIST))
+            return False
+        if self.settings["pngStrategy"] not in MapTiler.PNG_STRATEGY_LIST:
+            print "Unknown png strategy %s.  Must be one of %s." % (
+                self.settings["pngStrategy"], ", ".join(MapTiler.PNG_STRATEGY_LIST))
+            return False
+        tiledFiles = [mapEntry["outTiled"] for mapEntry in self.maps]
+        if len(set(tiledFiles)) != len(tiledFiles):
+            print "Every map must have its own outTiled file."
+            return False
+        return True
+
+    def CheckExistingFiles(self):
+        if self.settings["mergeExisting"] and self.settings["overwriteExisting"]:
+            print "Cannot have options to merge and overwrite existing files."
+            return False
+        if self.settings["mergeExisting"] or self.settings["overwriteExisting"]:
+            return True
+        for fileName in [self.settings["outTileset"]] + [mapEntry["outTiled"] for mapEntry in self.maps]:
+            if os.path.exists(fileName):
+                print "Output %s exists and would be modified.  Use options to control this." % fileName
+                return False
+        return True
+
+    def TileMaps(self):
+        jobs = [(self.settings, mapEntry, self.verbose) for mapEntry in self.maps]
+        if self.processes == 1:
+            self.results = map(TileMap, jobs)
+        else:
+            pool = multiprocessing.Pool(self.processes or None)
+            self.results = pool.map(TileMap, jobs)
+            pool.close()
+            pool.join()
+        for mapEntry, result in zip(self.maps, self.results):
+            if result is None:
+                print "Unable to tile map %s." % mapEntry["outTiled"]
+                return False
+            for name in result["counters"]:
+                self.shared.stats.AddCounter(name, result["counters"][name])
+        return True
+
+    # Merge the unique tiles of every map into the shared tileset.  A
+    # map's tile is looked up by its canonical fingerprint and then
+    # compared exactly.  The cells of the map are updated to use the
+    # shared tile, combining the transformation of the cell with the
+    # one that turns the shared tile into the map's tile.
+    def MergeTilesets(self):
+        shared = self.shared
+        shared.imageDict = {}
+        shared.tileProperties = {}
+        shared.layerDict = {}
+        fingerprints = {}
+        for mapIdx in xrange(len(self.results)):
+            result = self.results[mapIdx]
+            tiles = {}
+            for tileIdx in result["tiles"]:
+                mode, size, data = result["tiles"][tileIdx]
+                tiles[tileIdx] = Image.frombytes(mode, size, data)
+            remap = shared.MergeTiles(tiles, fingerprints, tileProperties=result["tileProperties"])
+            for lname in result["layerNames"]:
+                layerDict = result["layerDict"][lname]
+                for idx in layerDict:
+                    tileIdx, xForm = layerDict[idx]
+                    layerDict[idx] = shared.RemapMergedCell(remap, tileIdx, xForm)
+                # The same dictionary is used by the shared tileset, so
+                # reordering the tiles updates the maps too.
+                shared.layerDict["%d/%s" % (mapIdx, lname)] = layerDict
+        shared.tilesCreated = len(shared.imageDict)
+        shared.tilesPossible = sum([result["tilesPossible"] for result in self.results])
+        shared.stats.SetCounter("Map Unique Tiles", sum([result["tilesCreated"] for result in self.results]))
+        shared.stats.SetCounter("Shared Unique Tiles", shared.tilesCreated)
+        return True
+
+    # Compare the shared tileset with what each map would have needed on
+    # its own, for the whole batch loaded at once.
+    def ReportSharing(self):
+        sharedUsed, sharedTotal = self.shared.CalculatePagePixels(self.shared.tilesetPages)
+        mapTiles = 0
+        mapTotal = 0
+        for result in self.results:
+            pages = self.shared.CalculateTilesetPages(result["tilesCreated"], self.settings["atlasPacking"])
+            used, total = self.shared.CalculatePagePixels(pages)
+            mapTiles += result["tilesCreated"]
+            mapTotal += total
+        print "---------------------------------"
+        print "The %d maps have %d unique tiles on their own and %d shared (%4.1f%% fewer)." % (
+            len(self.results), mapTiles, self.shared.tilesCreated,
+            100.0 * (mapTiles - self.shared.tilesCreated) / max(mapTiles, 1))
+        print "Texture memory (RGBA) for all the maps: %s separate, %s shared." % (
+            self.shared.stats.FormatBytes(mapTotal * 4), self.shared.stats.FormatBytes(sharedTotal * 4))
+        return True
+
+    def ExportTiledFiles(self):
+        for mapEntry, result in zip(self.maps, self.results):
+            tiler = CreateMapTiler(self.settings, mapEntry, self.verbose)
+            tiler.layerNames = result["layerNames"]
+            tiler.layerDict = result["layerDict"]
+            tiler.layerWidth = result["layerWidth"]
+            tiler.layerHeight = result["layerHeight"]
+            tiler.layerTiles = tiler.layerWidth * tiler.layerHeight
+            tiler.createNavData = result["createNavData"]
+            tiler.tileProperties = self.shared.tileProperties
+            tiler.tilesetPages = []
+            for pageIdx in xrange(len(self.shared.tilesetPages)):
+                page = self.shared.tilesetPages[pageIdx]
+                tiler.tilesetPages.append((tiler.FormatTilesetPageFile(pageIdx),) + page[1:])
+            if not tiler.ExportTiledFile():
+                return False
+        return True
+
+    def RunStage(self, name, method):
+        return self.shared.RunStage(name, method)
+
+    def ProcessManifest(self, manifestFile, processes=0, statsFile=None, verbose=False):
+        self.processes = processes
+        self.verbose = verbose
+        self.startTime = datetime.datetime.now()
+        if not self.LoadManifest(manifestFile):
+            print "Unable to continue."
+            return False
+        if not self.CheckSettings():
+            print "Unable to continue."
+            return False
+        if not self.CheckExistingFiles():
+            print "Unable to continue."
+            return False
+        self.shared = CreateMapTiler(self.settings, None, verbose)
+        self.shared.stats.toolName = "MapTilerBatch"
+        self.shared.stats.SetCounter("Maps", len(self.maps))
+        if not self.RunStage("TileMaps", self.TileMaps):
+            print "Unable to continue."
+            return False
+        if not self.RunStage("MergeTilesets", self.MergeTilesets):
+            print "Unable to continue."
+            return False
+        if not self.RunStage("ExportTileset", self.shared.ExportTileset):
+            print "Unable to continue."
+            return False
+        if not self.RunStage("ExportTiledFiles", self.ExportTiledFiles):
+            print "Unable to continue."
+            return False
+        self.ReportSharing()
+
+        # Report execution time.
+        self.stopTime = datetime.datetime.now()
+        totalSeconds = (self.stopTime - self.startTime).total_seconds()
+        h, m, s = self.shared.SecondsToHMS(totalSeconds)
+        print "Started: ", self.startTime
+        print "Stopped: ", self.stopTime
+        print "Total Run Time: [%d Hrs: %d Min: %d Sec]" % (h, m, s)
+        self.shared.stats.PrintTable()
+        if statsFile:
+            self.shared.stats.ExportJSON(statsFile)
+        return True
+
+
+if __name__ == "__main__":
+    arguments = docopt.docopt(__doc__)
+    print "-----------------------------------"
+    print "Inputs:"
+    args = arguments.keys()
+    args.sort()
+    for arg in args:
+        print "%-25s %s" % (arg, arguments[arg])
+    print "-----------------------------------"
+    manifestFile = arguments['<manifest>']
+    processes = int(arguments['--processes'])
+    statsFile = arguments['--statsFile']
+    verbose = arguments['--verbose']
+
+    batch = MapTilerBatch()
+    batch.ProcessManifest(manifestFile, processes, statsFile, verbose)
@@ -0,0 +1,367 @@
+# -------------------------------------------------------------
+# License
+# -------------------------------------------------------------
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to
+# whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall
+# be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# -------------------------------------------------------------
+
+
+"""
+Generate synthetic layer images and benchmark MapTiler.py against them.
+
+The layers are built from a pool of randomly drawn tiles, so the size of
+the map, how often tiles repeat, how many of the repeats are flipped or
+rotated and how empty the layers are can all be controlled.  The full
+MapTiler.ProcessInputs(...) pipeline is run on the layers, followed by
+a few stage level micro benchmarks.  The results (throughput in tiles
+per second, stage times and memory) are appended to a results file so
+that they can be compared across versions of the code.
+
+Usage: MapTilerBenchmark.py [--width=WIDTH]
+                            [--height=HEIGHT]
+                            [--layers=LAYERS]
+                            [--tileSize=SIZE]
+                            [--poolSize=POOL]
+                            [--repetition=REPEAT]
+                            [--transformMix=MIX]
+                            [--sparsity=SPARSE]
+                            [--seed=SEED]
+                            [--microRepeat=COUNT]
+                            [--label=LABEL]
+                            [--results=RESULTS]
+                            [--workDir=WORKDIR]
+                            [--verbose]
+       MapTilerBenchmark.py --compare [--results=RESULTS]
+
+Options:
+    --width=WIDTH           The width of each layer in tiles.
+                            [Default: 32]
+    --height=HEIGHT         The height of each layer in tiles.
+                            [Default: 32]
+    --layers=LAYERS         The number of layers to generate.
+                            [Default: 4]
+    --tileSize=SIZE         The width and height of a tile in pixels.
+                            [Default: 32]
+    --poolSize=POOL         The number of distinct tiles that repeated
+                            cells are drawn from.
+                            [Default: 32]
+    --repetition=REPEAT     The fraction (0-1) of occupied cells that reuse
+                            a tile from the pool.  The rest get a brand new
+                            tile of their own.
+                            [Default: 0.9]
+    --transformMix=MIX      The fraction (0-1) of reused tiles that are
+                            flipped and/or rotated.
+                            [Default: 0.25]
+    --sparsity=SPARSE       The fraction (0-1) of cells that are left empty.
+                            [Default: 0.5]
+    --seed=SEED             The random seed, so runs can be repeated.
+                            [Default: 1]
+    --microRepeat=COUNT     The number of times each micro benchmark
+                            operation is repeated.
+                            [Default: 200]
+    --label=LABEL           A label for this run (e.g. a version or
+                            branch name) stored with the results.
+                            [Default: unlabeled]
+    --results=RESULTS       The file the results are appended to, one
+                            JSON record per line.
+                            [Default: MapTilerBenchmark.jsonl]
+    --workDir=WORKDIR       The directory the layers and outputs are
+                            written to.
+                            [Default: MapTilerBenchmark]
+    --verbose               Pass --verbose on to MapTiler.
+    --compare               Print a table of the results in the results
+                            file, grouped by configuration, so runs with
+                            different labels can be compared.
+
+Website:        http://www.NonlinearIdeas.com
+Repository:     https://github.com/NonlinearIdeas/Map-Tiler
+Report Issues:  https://github.com/NonlinearIdeas/Map-Tiler
+License:        MIT License - See specific text in source code.
+Copyright:      Copyright (c) 2015 Nonlinear Ideas Inc (contact@nlideas.com)
+"""
+
+import os
+import json
+import time
+import random
+import datetime
+import Image
+import ImageDraw
+import docopt
+from MapTiler import MapTiler
+
+
+class MapTilerBenchmark(object):
+    # Keys for the configuration, in the order they are reported.
+    CONFIG_KEYS = ["width", "height", "layers", "tileSize", "poolSize",
+                   "repetition", "transformMix", "sparsity", "seed"]
+
+    def __init__(self):
+        self.Reset()
+
+    def Reset(self):
+        # The configuration of the generated map.
+        self.config = {}
+        # The generated layer image files.
+        self.layerFiles = []
+        # The number of distinct tiles (ignoring transformations)
+        # that were placed in the layers, including the empty tile.
+        self.expectedUniqueTiles = 0
+
+    # Draw a tile with a few random rectangles on it.  The rectangles
+    # make the tile (almost always) different under every flip and
+    # rotation, like real art.
+    def CreateRandomTile(self, rng):
+        size = self.config["tileSize"]
+        color = (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255), 255)
+        tile = Image.new("RGBA", (size, size), color)
+        draw = ImageDraw.Draw(tile)
+        for rect in xrange(4):
+            x0 = rng.randint(0, size - 2)
+            y0 = rng.randint(0, size - 2)
+            x1 = rng.randint(x0 + 1, size - 1)
+            y1 = rng.randint(y0 + 1, size - 1)
+            color = (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255), rng.randint(64, 255))
+            draw.rectangle((x0, y0, x1, y1), fill=color)
+        return tile
+
+    # Apply one of the MapTiler transformations to a tile, the same
+    # way MapTiler.FindImageTransformation(...) does.
+    def TransformTile(self, tile, xForm):
+        xForm, mirrorX, rot90 = MapTiler.TRANSFORM_LIST[xForm]
+        if mirrorX:
+            tile = tile.transpose(Image.FLIP_LEFT_RIGHT)
+        if rot90 == 1:
+            tile = tile.transpose(Image.ROTATE_90)
+        elif rot90 == 2:
+            tile = tile.transpose(Image.ROTATE_180)
+        elif rot90 == 3:
+            tile = tile.transpose(Image.ROTATE_270)
+        return tile
+
+    def GenerateLayers(self):
+        config = self.config
+        rng = random.Random(config["seed"])
+        size = config["tileSize"]
+        pool = [self.CreateRandomTile(rng) for idx in xrange(config["poolSize"])]
+        poolUsed = set()
+        freshTiles = 0
+        self.layerFiles = []
+        for layer in xrange(config["layers"]):
+            img = Image.new("RGBA", (config["width"] * size, config["height"] * size), (0, 0, 0, 0))
+            for row in xrange(config["height"]):
+                for col in xrange(config["width"]):
+                    if rng.random() < config["sparsity"]:
+                        continue
+                    if rng.random() < config["repetition"]:
+                        poolIdx = rng.randrange(len(pool))
+                        poolUsed.add(poolIdx)
+                        tile = pool[poolIdx]
+                        if rng.random() < config["transformMix"]:
+                            tile = self.TransformTile(tile, rng.randint(1, 7))
+                    else:
+                        tile = self.CreateRandomTile(rng)
+                        freshTiles += 1
+                    img.paste(tile, (col * size, row * size))
+            fileName = os.path.join(self.workDir, "Layer%02d.png" % layer)
+            img.save(fileName)
+            self.layerFiles.append(fileName)
+        self.expectedUniqueTiles = 1 + len(poolUsed) + freshTiles
+        print "Generated %d layers of %d x %d tiles (%d x %d pixels) in %s." % (
+            config["layers"], config["width"], config["height"],
+            config["width"] * size, config["height"] * size, self.workDir)
+        return True
+
+    def RunPipeline(self):
+        outTileset = os.path.join(self.workDir, "tileset.png")
+        outTiled = os.path.join(self.workDir, "tiled.tmx")
+        tiler = MapTiler()
+        result = tiler.ProcessInputs(tileWidth=self.config["tileSize"],
+                                     tileHeight=self.config["tileSize"],
+                                     tileOffX=0,
+                                     tileOffY=0,
+                                     tileInsetX=0,
+                                     tileInsetY=0,
+                                     fileList=self.layerFiles[:],
+                                     inputFilePattern=None,
+                                     outTilesetFile=outTileset,
+                                     outTiledFile=outTiled,
+                                     forceSquareTileset=False,
+                                     verbose=self.verbose,
+                                     mergeExisting=False,
+                                     overwriteExisting=True,
+                                     floorLayer=None,
+                                     wallLayer=None,
+                                     portalLayer=None,
+                                     doorLayer=None,
+                                     outNavPrefix="NAV_")
+        if not result:
+            return None
+        return tiler
+
+    # Time an operation repeated a number of times and return the
+    # number of operations per second.
+    def TimeOperation(self, operation):
+        count = self.microRepeat
+        start = time.time()
+        for idx in xrange(count):
+            operation()
+        elapsed = max(time.time() - start, 1e-9)
+        return count / elapsed
+
+    # Stage level micro benchmarks, run on the tiles that the pipeline
+    # found.
+    def RunMicroBenchmarks(self, tiler):
+        results = {}
+        tiles = [tiler.imageDict[idx] for idx in sorted(tiler.imageDict.keys())]
+        tileA = tiles[-1]
+        tileB = tiles[len(tiles) / 2]
+        flipped = self.TransformTile(tileA, 7)
+        results["FindImageTransformation (identity) ops/s"] = self.TimeOperation(
+            lambda: tiler.FindImageTransformation(tileA, tileA))
+        results["FindImageTransformation (xForm 7) ops/s"] = self.TimeOperation(
+            lambda: tiler.FindImageTransformation(flipped, tileA))
+        results["FindImageTransformation (no match) ops/s"] = self.TimeOperation(
+            lambda: tiler.FindImageTransformation(tileA, tileB))
+        layerImage = tiler.LoadCroppedImage(self.layerFiles[0])
+        results["LoadCroppedImage ops/s"] = self.TimeOperation(
+            lambda: tiler.LoadCroppedImage(self.layerFiles[0]))
+        results["ExtractSubimage ops/s"] = self.TimeOperation(
+            lambda: tiler.ExtractSubimage(layerImage, tiler.layerTiles / 2))
+        return results
+
+    # Create the record before running the micro benchmarks, which
+    # would otherwise add to the pipeline counters.
+    def CreateRecord(self, tiler):
+        createTileset = tiler.stats.stages["CreateTileset"]
+        tilesScanned = tiler.stats.GetCounter("Tiles Scanned")
+        record = {
+            "label":self.label,
+            "date":datetime.datetime.now().isoformat(),
+            "config":self.config,
+            "expectedUniqueTiles":self.expectedUniqueTiles,
+            "tilesPerSecond":tilesScanned / max(createTileset["wallSeconds"], 1e-9),
+            "report":tiler.stats.CreateReport(),
+            "micro":{},
+        }
+        return record
+
+    def PrintRecord(self, record):
+        print "---------------------------------"
+        print "Benchmark Results [%s]" % record["label"]
+        print "---------------------------------"
+        counters = record["report"]["counters"]
+        print "%-44s %12d" % ("Unique tiles (expected)", record["expectedUniqueTiles"])
+        print "%-44s %12d" % ("Unique tiles (found)", counters["Unique Tiles"])
+        print "%-44s %12.1f" % ("CreateTileset tiles/s", record["tilesPerSecond"])
+        for name in sorted(record["micro"].keys()):
+            print "%-44s %12.1f" % (name, record["micro"][name])
+        print
+
+    def AppendRecord(self, record):
+        with open(self.resultsFile, "a") as outFile:
+            outFile.write(json.dumps(record, sort_keys=True) + "\n")
+        print "Results appended to %s." % self.resultsFile
+        return True
+
+    def FormatConfig(self, config):
+        return ", ".join(["%s=%s" % (key, config[key]) for key in MapTilerBenchmark.CONFIG_KEYS])
+
+    def CompareResults(self, resultsFile):
+        if not os.path.exists(resultsFile):
+            print "Results file %s does not exist." % resultsFile
+            return False
+        groups = {}
+        with open(resultsFile) as inFile:
+            for line in inFile:
+                if line.strip():
+                    record = json.loads(line)
+                    groups.setdefault(self.FormatConfig(record["config"]), []).append(record)
+        for config in sorted(groups.keys()):
+            print "---------------------------------"
+            print config
+            print "---------------------------------"
+            print "%-20s %-26s %12s %10s %10s %12s" % (
+                "Label", "Date", "Tiles/s", "Unique", "Wall (s)", "Peak RSS")
+            for record in groups[config]:
+                report = record["report"]
+                wall = sum([stage["wallSeconds"] for stage in report["stages"] if stage["name"] != "Decode"])
+                peak = report["peakRSSBytes"]
+                print "%-20s %-26s %12.1f %10d %10.2f %12s" % (
+                    record["label"], record["date"][:26], record["tilesPerSecond"],
+                    report["counters"]["Unique Tiles"], wall,
+                    "n/a" if peak is None else "%.1f MB" % (peak / (1024.0 * 1024.0)))
+            print
+        return True
+
+    def RunBenchmark(self, config, microRepeat, label, resultsFile, workDir, verbose):
+        self.Reset()
+        self.config = config
+        self.microRepeat = microRepeat
+        self.label = label
+        self.resultsFile = resultsFile
+        self.workDir = workDir
+        self.verbose = verbose
+        if not os.path.exists(workDir):
+            os.makedirs(workDir)
+        if not self.GenerateLayers():
+            return False
+        tiler = self.RunPipeline()
+        if tiler is None:
+            print "MapTiler failed.  Unable to continue."
+            return False
+        record = self.CreateRecord(tiler)
+        record["micro"] = self.RunMicroBenchmarks(tiler)
+        self.PrintRecord(record)
+        return self.AppendRecord(record)
+
+if __name__ == "__main__":
+    arguments = docopt.docopt(__doc__)
+    print "-----------------------------------"
+    print "Inputs:"
+    args = arguments.keys()
+    args.sort()
+    for arg in args:
+        print "%-25s %s" % (arg, arguments[arg])
+    print "-----------------------------------"
+
+    benchmark = MapTilerBenchmark()
+    if arguments["--compare"]:
+        benchmark.CompareResults(arguments["--results"])
+    else:
+        config = {
+            "width":int(arguments["--width"]),
+            "height":int(arguments["--height"]),
+            "layers":int(arguments["--layers"]),
+            "tileSize":int(arguments["--tileSize"]),
+            "poolSize":int(arguments["--poolSize"]),
+            "repetition":float(arguments["--repetition"]),
+            "transformMix":float(arguments["--transformMix"]),
+            "sparsity":float(arguments["--sparsity"]),
+            "seed":int(arguments["--seed"]),
+        }
+        benchmark.RunBenchmark(config,
+                               int(arguments["--microRepeat"]),
+                               arguments["--label"],
+                               arguments["--results"],
+                               arguments["--workDir"],
+                               arguments["--verbose"])
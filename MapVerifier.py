@@ -0,0 +1,335 @@
+# -------------------------------------------------------------
+# License
+# -------------------------------------------------------------
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to
+# whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall
+# be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# -------------------------------------------------------------
+
+
+"""
+Check that a Tiled file written by MapTiler.py is lossless.
+
+Every layer that has a source image is drawn again from the tileset
+pages and the gids in the Tiled file, and compared with the source
+image (cropped with the same offset and inset as when it was tiled).
+The flip bits are applied the way Tiled draws them (diagonal flip
+first, then horizontal, then vertical), and tile objects (see
+--sparseThreshold) are flipped and then rotated about their corner, so
+this checks the encoding as well as the tiles.
+
+Tile layers may be XML, CSV or chunked (infinite maps).  Layers without
+a source image (e.g. the nav layers) are not checked.  The layers are
+checked in parallel.  The exit status is 0 if every layer matches and 1
+if not, so it can be used in a build.
+
+Usage: MapVerifier.py  <tiledFile>
+                       [--tileOffX=OFFX]
+                       [--tileOffY=OFFY]
+                       [--tileInsetX=INSETX]
+                       [--tileInsetY=INSETY]
+                       [--filePattern=PATTERN]
+                       [--processes=PROCESSES]
+                       [--maxReport=COUNT]
+                       [<layerImage>...]
+
+Options:
+    tiledFile                   The Tiled file to check.
+    layerImage                  The source images of the layers, named as
+                                the layers (as for MapTiler.py).
+    --tileOffX=OFFX             The x offset used when the map was tiled.
+                                [Default: 0]
+    --tileOffY=OFFY             The y offset used when the map was tiled.
+                                [Default: 0]
+    --tileInsetX=INSETX         The x inset used when the map was tiled.
+                                [Default: 0]
+    --tileInsetY=INSETY         The y inset used when the map was tiled.
+                                [Default: 0]
+    --filePattern=PATTERN       A pattern for the source images.
+    --processes=PROCESSES       The number of layers to check at the same
+                                time.  0 uses one per CPU.  1 does not
+                                start any extra processes.
+                                [Default: 0]
+    --maxReport=COUNT           The most mismatching cells to list for
+                                each layer.
+                                [Default: 20]
+
+Website:        http://www.NonlinearIdeas.com
+Repository:     https://github.com/NonlinearIdeas/Map-Tiler
+Report Issues:  https://github.com/NonlinearIdeas/Map-Tiler
+License:        MIT License - See specific text in source code.
+Copyright:      Copyright (c) 2015 Nonlinear Ideas Inc (contact@nlideas.com)
+"""
+
+import os
+import sys
+import datetime
+import multiprocessing
+import Image
+import ImageChops
+from lxml import etree
+import docopt
+from MapTiler import MapTiler, MapTilerConfig
+from MapDataExtractor import MapDataExtractor
+
+GID_FLAGS = MapTiler.FLIPPED_HORIZONTALLY_FLAG | MapTiler.FLIPPED_VERTICALLY_FLAG | MapTiler.FLIPPED_DIAGONALLY_FLAG
+
+
+# Cut the tiles out of the tileset pages as they are needed.
+class TilesetPages(object):
+    def __init__(self, pages, tileWidth, tileHeight):
+        # (firstGID, image file, margin, spacing), highest firstGID first.
+        self.pages = sorted(pages, reverse=True)
+        self.tileWidth = tileWidth
+        self.tileHeight = tileHeight
+        self.images = {}
+        self.tiles = {}
+
+    # The tile for a gid without its flip bits.  Returns None if no page
+    # has it.
+    def GetTile(self, gid):
+        if gid in self.tiles:
+            return self.tiles[gid]
+        tile = None
+        for firstGID, fileName, margin, spacing in self.pages:
+            if gid < firstGID:
+                continue
+            if fileName not in self.images:
+                img = Image.open(fileName)
+                if img.mode != "RGBA":
+                    img = img.convert("RGBA")
+                self.images[fileName] = img
+            img = self.images[fileName]
+            columns = (img.size[0] - 2 * margin + spacing) / (self.tileWidth + spacing)
+            tileID = gid - firstGID
+            x = margin + (tileID % columns) * (self.tileWidth + spacing)
+            y = margin + (tileID / columns) * (self.tileHeight + spacing)
+            if y + self.tileHeight <= img.size[1]:
+                tile = img.crop((x, y, x + self.tileWidth, y + self.tileHeight))
+            break
+        self.tiles[gid] = tile
+        return tile
+
+    # Draw the tile for a gid of a tile layer.  Tiled flips diagonally
+    # (swapping x and y) first, then horizontally, then vertically.
+    def GetLayerTile(self, gid):
+        tile = self.GetTile(gid & ~GID_FLAGS)
+        if tile is None:
+            return None
+        if gid & MapTiler.FLIPPED_DIAGONALLY_FLAG:
+            tile = tile.transpose(Image.ROTATE_90).transpose(Image.FLIP_TOP_BOTTOM)
+        if gid & MapTiler.FLIPPED_HORIZONTALLY_FLAG:
+            tile = tile.transpose(Image.FLIP_LEFT_RIGHT)
+        if gid & MapTiler.FLIPPED_VERTICALLY_FLAG:
+            tile = tile.transpose(Image.FLIP_TOP_BOTTOM)
+        return tile
+
+    # Draw the tile for a tile object.  Objects are flipped and then
+    # rotated clockwise.  Returns None for rotations other than
+    # multiples of 90 degrees.
+    def GetObjectTile(self, gid, rotation):
+        tile = self.GetTile(gid & ~GID_FLAGS)
+        if tile is None or rotation % 90 != 0:
+            return None
+        if gid & MapTiler.FLIPPED_HORIZONTALLY_FLAG:
+            tile = tile.transpose(Image.FLIP_LEFT_RIGHT)
+        if gid & MapTiler.FLIPPED_VERTICALLY_FLAG:
+            tile = tile.transpose(Image.FLIP_TOP_BOTTOM)
+        turns = (int(rotation) / 90) % 4
+        if turns == 1:
+            tile = tile.transpose(Image.ROTATE_270)
+        elif turns == 2:
+            tile = tile.transpose(Image.ROTATE_180)
+        elif turns == 3:
+            tile = tile.transpose(Image.ROTATE_90)
+        return tile
+
+
+# Draw one layer again and compare it with its source image.  This is
+# run in a worker process, so the job is a plain tuple.  Returns
+# (layerName, cells checked, mismatching (col, row) list, error).
+def VerifyLayer(job):
+    layerName, imageFile, crop, tileWidth, tileHeight, layerWidth, layerHeight, cells, pages = job
+    tiler = MapTiler()
+    tiler.Configure(MapTilerConfig(tileWidth=tileWidth,
+                                   tileHeight=tileHeight,
+                                   tileOffX=crop[0],
+                                   tileOffY=crop[1],
+                                   tileInsetX=crop[2],
+                                   tileInsetY=crop[3]))
+    source = tiler.LoadCroppedImage(imageFile)
+    if source.size != (layerWidth * tileWidth, layerHeight * tileHeight):
+        return layerName, 0, [], "Image %s (%d x %d after cropping) is not the size of the layer (%d x %d)." % (
+            imageFile, source.size[0], source.size[1], layerWidth * tileWidth, layerHeight * tileHeight)
+    tileset = TilesetPages(pages, tileWidth, tileHeight)
+    rebuilt = Image.new("RGBA", source.size, (0, 0, 0, 0))
+    bad = set()
+    for idx, gid, rotation in cells:
+        if rotation is None:
+            tile = tileset.GetLayerTile(gid)
+        else:
+            tile = tileset.GetObjectTile(gid, rotation)
+        col = idx % layerWidth
+        row = idx / layerWidth
+        if tile is None or tile.size != (tileWidth, tileHeight):
+            bad.add((col, row))
+            continue
+        rebuilt.paste(tile, (col * tileWidth, row * tileHeight))
+    # Compare the whole layer at once, and only look at single cells
+    # inside the area that differs.
+    bbox = ImageChops.difference(rebuilt, source).getbbox()
+    if bbox is not None:
+        x0, y0, x1, y1 = bbox
+        for row in xrange(y0 / tileHeight, (y1 - 1) / tileHeight + 1):
+            for col in xrange(x0 / tileWidth, (x1 - 1) / tileWidth + 1):
+                rect = (col * tileWidth, row * tileHeight, (col + 1) * tileWidth, (row + 1) * tileHeight)
+                if ImageChops.difference(rebuilt.crop(rect), source.crop(rect)).getbbox() is not None:
+                    bad.add((col, row))
+    return layerName, layerWidth * layerHeight, sorted(bad, key=lambda cell: (cell[1], cell[0])), None
+
+
+class MapVerifier(object):
+    def __init__(self):
+        pass
+
+    # Read the tile size, tileset pages and the gid of every used cell
+    # of each layer.  Cells of tile layers have a rotation of None.
+    def LoadTiledFile(self, tiledFile):
+        if not os.path.exists(tiledFile):
+            print "Tiled file %s does not exist." % tiledFile
+            return False
+        inRoot = etree.parse(tiledFile).getroot()
+        tiledDir = os.path.dirname(tiledFile)
+        # The extractor's readers are used to find the cells.
+        reader = MapDataExtractor()
+        reader.tileWidth = self.tileWidth = int(inRoot.attrib["tilewidth"])
+        reader.tileHeight = self.tileHeight = int(inRoot.attrib["tileheight"])
+        reader.layerWidth = self.layerWidth = int(inRoot.attrib["width"])
+        reader.layerHeight = self.layerHeight = int(inRoot.attrib["height"])
+        self.pages = []
+        for tileset in inRoot.findall("tileset"):
+            image = tileset.find("image")
+            if image is None:
+                print "Tileset %s has no image." % tileset.attrib.get("name")
+                return False
+            self.pages.append((int(tileset.attrib["firstgid"]),
+                               os.path.join(tiledDir, image.attrib["source"]),
+                               int(tileset.attrib.get("margin", "0")),
+                               int(tileset.attrib.get("spacing", "0"))))
+        self.layerCells = {}
+        for layer in inRoot.findall("layer"):
+            parsed = reader.ParseDataGids(layer.find("data"))
+            if parsed is None:
+                print "Layer %s has data encoded as %s.  Only XML and CSV are supported." % (
+                    layer.attrib['name'], layer.find("data").attrib["encoding"])
+                return False
+            cells, offMap = parsed
+            if offMap:
+                print "Layer %s has %d tiles outside the %dx%d map.  Turn off Map > Infinite in Tiled to crop it to its tiles." % (
+                    layer.attrib['name'], offMap, self.layerWidth, self.layerHeight)
+                return False
+            self.layerCells[layer.attrib['name']] = [(idx, gid, None) for idx, gid in cells]
+        for group in inRoot.findall("objectgroup"):
+            cells = []
+            for obj in group.findall("object"):
+                if "gid" not in obj.attrib:
+                    continue
+                idx = reader.CalculateObjectCellIndex(obj)
+                if idx is not None:
+                    cells.append((idx, int(obj.attrib["gid"]), float(obj.attrib.get("rotation", "0"))))
+            self.layerCells[group.attrib['name']] = cells
+        return True
+
+    def VerifyLayers(self, imageFiles, crop, processes, maxReport):
+        jobs = []
+        for imageFile in imageFiles:
+            layerName = os.path.splitext(os.path.split(imageFile)[1])[0]
+            if layerName not in self.layerCells:
+                print "Layer %s (%s) is not in the Tiled file." % (layerName, imageFile)
+                return False
+            jobs.append((layerName, imageFile, crop, self.tileWidth, self.tileHeight,
+                         self.layerWidth, self.layerHeight, self.layerCells[layerName], self.pages))
+        unchecked = [name for name in sorted(self.layerCells) if name not in [job[0] for job in jobs]]
+        if len(unchecked) > 0:
+            print "Layers without a source image (not checked): %s" % ", ".join(unchecked)
+        if processes == 1:
+            results = map(VerifyLayer, jobs)
+        else:
+            pool = multiprocessing.Pool(processes or None)
+            results = pool.map(VerifyLayer, jobs)
+            pool.close()
+            pool.join()
+        print "---------------------------------"
+        passed = True
+        for layerName, cellCount, bad, error in results:
+            if error:
+                print "Layer %-20s FAILED: %s" % (layerName, error)
+                passed = False
+            elif len(bad) > 0:
+                print "Layer %-20s FAILED: %d of %d cells do not match." % (layerName, len(bad), cellCount)
+                for col, row in bad[:maxReport]:
+                    print "    cell (%d,%d)" % (col, row)
+                if len(bad) > maxReport:
+                    print "    ... and %d more." % (len(bad) - maxReport)
+                passed = False
+            else:
+                print "Layer %-20s OK (%d cells)." % (layerName, cellCount)
+        return passed
+
+    def ProcessInputs(self, tiledFile, fileList, filePattern, crop, processes=0, maxReport=20):
+        self.startTime = datetime.datetime.now()
+        tiler = MapTiler()
+        tiler.Configure(MapTilerConfig())
+        if not tiler.CreateLayerFiles(filePattern, list(fileList)):
+            print "Unable to continue."
+            return False
+        if not self.LoadTiledFile(tiledFile):
+            print "Unable to continue."
+            return False
+        passed = self.VerifyLayers(tiler.layerFiles, crop, processes, maxReport)
+        self.stopTime = datetime.datetime.now()
+        print "Verified in %.2f seconds: %s" % (
+            (self.stopTime - self.startTime).total_seconds(), "PASSED" if passed else "FAILED")
+        return passed
+
+
+if __name__ == "__main__":
+    arguments = docopt.docopt(__doc__)
+    print "-----------------------------------"
+    print "Inputs:"
+    args = arguments.keys()
+    args.sort()
+    for arg in args:
+        print "%-25s %s" % (arg, arguments[arg])
+    print "-----------------------------------"
+    tiledFile = arguments['<tiledFile>']
+    fileList = arguments['<layerImage>']
+    filePattern = arguments['--filePattern']
+    crop = (int(arguments['--tileOffX']),
+            int(arguments['--tileOffY']),
+            int(arguments['--tileInsetX']),
+            int(arguments['--tileInsetY']))
+    processes = int(arguments['--processes'])
+    maxReport = int(arguments['--maxReport'])
+
+    verifier = MapVerifier()
+    passed = verifier.ProcessInputs(tiledFile, fileList, filePattern, crop, processes, maxReport)
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,178 @@
+# -------------------------------------------------------------
+# License
+# -------------------------------------------------------------
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to
+# whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall
+# be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# -------------------------------------------------------------
+
+
+"""
+Collect timing, memory and counter information for the stages of
+a run (MapTiler.py, MapDataExtractor.py) so that slow builds can be
+tracked down.
+
+For each stage, the wall time, CPU time, number of times it was run
+and the peak resident memory of the process when it finished are
+recorded.  Stages may be run more than once (the times add up) and
+may be nested inside each other (e.g. image decoding happens inside
+other stages).
+
+Counters are free form named numbers (tiles scanned, comparisons, ...).
+
+The results can be printed as a table or exported as JSON.  A hook
+can also be set that is called with the stage name and its results
+every time a stage finishes.
+
+Website:        http://www.NonlinearIdeas.com
+Repository:     https://github.com/NonlinearIdeas/Map-Tiler
+Report Issues:  https://github.com/NonlinearIdeas/Map-Tiler
+License:        MIT License - See specific text in source code.
+Copyright:      Copyright (c) 2015 Nonlinear Ideas Inc (contact@nlideas.com)
+"""
+
+import os
+import sys
+import time
+import json
+import datetime
+try:
+    import resource
+except ImportError:
+    # Not available on Windows.  Memory will not be reported.
+    resource = None
+
+
+class PerfStats(object):
+    def __init__(self, toolName):
+        self.toolName = toolName
+        self.stageHook = None
+        self.Reset()
+
+    def Reset(self):
+        # Stage names, in the order they were first started.
+        self.stageNames = []
+        # Keyed by stage name.  Each entry is a dictionary of the
+        # accumulated results for the stage.
+        self.stages = {}
+        # Keyed by stage name.  The (wall, cpu) time the stage was
+        # started at, while it is running.
+        self.openStages = {}
+        # Keyed by counter name.
+        self.counterNames = []
+        self.counters = {}
+        self.startTime = datetime.datetime.now()
+
+    def GetCPUSeconds(self):
+        times = os.times()
+        return times[0] + times[1]
+
+    # The peak resident set size of the process in bytes, or None
+    # if it cannot be determined on this platform.
+    def GetPeakRSS(self):
+        if resource is None:
+            return None
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == "darwin":
+            # Already in bytes.
+            return peak
+        # Linux reports kilobytes.
+        return peak * 1024
+
+    # The hook is called as hook(name, stage) where stage is the
+    # dictionary of accumulated results for the stage.
+    def SetStageHook(self, hook):
+        self.stageHook = hook
+
+    def BeginStage(self, name):
+        if name not in self.stages:
+            self.stageNames.append(name)
+            self.stages[name] = { "calls":0, "wallSeconds":0.0, "cpuSeconds":0.0, "peakRSSBytes":None }
+        self.openStages[name] = (time.time(), self.GetCPUSeconds())
+
+    def EndStage(self, name):
+        wallStart, cpuStart = self.openStages.pop(name)
+        stage = self.stages[name]
+        stage["calls"] += 1
+        stage["wallSeconds"] += time.time() - wallStart
+        stage["cpuSeconds"] += self.GetCPUSeconds() - cpuStart
+        stage["peakRSSBytes"] = self.GetPeakRSS()
+        if self.stageHook:
+            self.stageHook(name, stage)
+        return stage
+
+    def AddCounter(self, name, amount=1):
+        if name not in self.counters:
+            self.counterNames.append(name)
+            self.counters[name] = 0
+        self.counters[name] += amount
+
+    def SetCounter(self, name, value):
+        if name not in self.counters:
+            self.counterNames.append(name)
+        self.counters[name] = value
+
+    def GetCounter(self, name):
+        return self.counters.get(name, 0)
+
+    def FormatBytes(self, value):
+        if value is None:
+            return "n/a"
+        return "%.1f MB" % (value / (1024.0 * 1024.0))
+
+    def PrintTable(self):
+        print "---------------------------------"
+        print "%s Stage Statistics" % self.toolName
+        print "---------------------------------"
+        print "%-24s %6s %12s %12s %12s" % ("Stage", "Calls", "Wall (s)", "CPU (s)", "Peak RSS")
+        for name in self.stageNames:
+            stage = self.stages[name]
+            print "%-24s %6d %12.3f %12.3f %12s" % (
+                name, stage["calls"], stage["wallSeconds"], stage["cpuSeconds"],
+                self.FormatBytes(stage["peakRSSBytes"]))
+        if len(self.counterNames) > 0:
+            print
+            print "%-24s %12s" % ("Counter", "Value")
+            for name in self.counterNames:
+                print "%-24s %12s" % (name, self.counters[name])
+        print
+
+    def CreateReport(self):
+        report = {
+            "tool":self.toolName,
+            "started":self.startTime.isoformat(),
+            "peakRSSBytes":self.GetPeakRSS(),
+            "stages":[],
+            "counters":{},
+        }
+        for name in self.stageNames:
+            stage = dict(self.stages[name])
+            stage["name"] = name
+            report["stages"].append(stage)
+        for name in self.counterNames:
+            report["counters"][name] = self.counters[name]
+        return report
+
+    def ExportJSON(self, fileName):
+        with open(fileName, "w") as outFile:
+            json.dump(self.CreateReport(), outFile, indent=2, sort_keys=True)
+        print "Saving statistics to %s." % fileName
+        return True
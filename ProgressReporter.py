@@ -0,0 +1,140 @@
+# -------------------------------------------------------------
+# License
+# -------------------------------------------------------------
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated
+# documentation files (the "Software"), to deal in the Software
+# without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to
+# whom the Software is furnished to do so, subject to the
+# following conditions:
+#
+# The above copyright notice and this permission notice shall
+# be included in all copies or substantial portions of the
+# Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY
+# KIND, EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE
+# WARRANTIES OF MERCHANTABILITY, FITNESS FOR A PARTICULAR
+# PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE AUTHORS OR
+# COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR
+# OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+# -------------------------------------------------------------
+
+
+"""
+Rate limited progress reporting for long running loops (MapTiler.py,
+MapDataExtractor.py).
+
+Printing a line for every item of work slows a large run down and
+floods the console.  Instead, a job (e.g. all the tiles in all the
+layers) is split into tasks (e.g. one layer) and progress is printed at
+most a fixed number of times per second, with the rate (items per
+second) and the estimated time left for the task and for the whole job.
+
+There are three levels of output:
+    QUIET       Nothing is printed.
+    PROGRESS    Rate limited progress lines and messages.
+    DEBUG       Everything above, plus trace lines (e.g. one line per
+                tile), which are never rate limited.
+
+Website:        http://www.NonlinearIdeas.com
+Repository:     https://github.com/NonlinearIdeas/Map-Tiler
+Report Issues:  https://github.com/NonlinearIdeas/Map-Tiler
+License:        MIT License - See specific text in source code.
+Copyright:      Copyright (c) 2015 Nonlinear Ideas Inc (contact@nlideas.com)
+"""
+
+import time
+
+
+class ProgressReporter(object):
+    LEVEL_QUIET = 0
+    LEVEL_PROGRESS = 1
+    LEVEL_DEBUG = 2
+
+    def __init__(self, level=LEVEL_PROGRESS, updatesPerSecond=2.0):
+        self.level = level
+        self.updatesPerSecond = updatesPerSecond
+        self.BeginJob(0)
+
+    def IsProgress(self):
+        return self.level >= ProgressReporter.LEVEL_PROGRESS
+
+    def IsDebug(self):
+        return self.level >= ProgressReporter.LEVEL_DEBUG
+
+    def BeginJob(self, total):
+        self.jobTotal = total
+        self.jobDone = 0
+        self.jobStart = time.time()
+        self.taskName = ""
+        self.taskTotal = 0
+        self.taskDone = 0
+        self.taskStart = self.jobStart
+        self.lastUpdate = 0
+
+    def BeginTask(self, name, total):
+        self.taskName = name
+        self.taskTotal = total
+        self.taskDone = 0
+        self.taskStart = time.time()
+
+    def FormatSeconds(self, seconds):
+        if seconds is None:
+            return "--:--:--"
+        seconds = int(seconds)
+        return "%d:%02d:%02d" % (seconds / 3600, (seconds / 60) % 60, seconds % 60)
+
+    # The estimated seconds left to do the remaining items at the
+    # rate seen since the given start time.
+    def EstimateSeconds(self, done, total, start):
+        elapsed = time.time() - start
+        if done <= 0 or elapsed <= 0:
+            return None
+        return (total - done) * elapsed / done
+
+    def PrintProgress(self, detail):
+        elapsed = max(time.time() - self.taskStart, 1e-9)
+        line = "[%s] %5.1f%% (%d/%d) %.1f/s" % (
+            self.taskName,
+            100.0 * self.taskDone / max(self.taskTotal, 1),
+            self.taskDone, self.taskTotal,
+            self.taskDone / elapsed)
+        if detail:
+            line += ", " + detail
+        line += ", ETA %s" % self.FormatSeconds(self.EstimateSeconds(self.taskDone, self.taskTotal, self.taskStart))
+        if self.jobTotal > 0:
+            line += " (all %s)" % self.FormatSeconds(
+                self.EstimateSeconds(self.jobDone, self.jobTotal, self.jobStart))
+        print line
+
+    # Report that one more item has been done.  The detail is a
+    # callable that returns extra text for the line, so that it is
+    # only formatted when a line is actually printed.
+    def Update(self, detail=None):
+        self.taskDone += 1
+        self.jobDone += 1
+        if not self.IsProgress():
+            return
+        now = time.time()
+        if now - self.lastUpdate < 1.0 / self.updatesPerSecond:
+            return
+        self.lastUpdate = now
+        self.PrintProgress(detail() if detail else None)
+
+    # Always print the final line for a task.
+    def EndTask(self, detail=None):
+        if self.IsProgress():
+            self.PrintProgress(detail() if detail else None)
+
+    def Message(self, message):
+        if self.IsProgress():
+            print message
+
+    def Trace(self, message):
+        if self.IsDebug():
+            print message